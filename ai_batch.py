@@ -0,0 +1,326 @@
+import sys
+import csv
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import Qt
+
+from ai_chat import MAP_REDUCE_DATA_SECTION, AIWorker, MapReduceWorker, table_system_prompt
+from ai_context import build_data_context
+from ai_scheduler import PRIORITY_BACKGROUND, get_scheduler
+from database import Database
+from map_reduce import MAP_REDUCE_NUM_CTX
+from ollama_manager import get_manager
+from query_dsl import QueryFilterError, required_permissions
+from schema import TABLE_TITLES, get_table_fields
+from token_budget import ANSWER_RESERVE_TOKENS, CTX_BUCKETS, TokenCalibrator, choose_num_ctx, message_chars
+
+logger = logging.getLogger('AIBatch')
+
+# 分析方式
+MODE_FULL = 'full'            # 完整数据放入上下文
+MODE_MAP_REDUCE = 'map_reduce'  # 数据超出上下文时分块分析
+
+
+class BatchStore:
+    """批量分析结果的存取（ai_batch_runs / ai_batch_answers 表）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def create_run(self, title: str, model: str, num_ctx: int, mode: str, filter_spec,
+                   person_count: int, context_chars: int, context_build_ms: float) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "INSERT INTO ai_batch_runs (title, model, num_ctx, mode, filter_spec, person_count, "
+                "context_chars, context_build_ms, status, started_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'running', ?)",
+                (title, model, num_ctx, mode, json.dumps(filter_spec, ensure_ascii=False) if filter_spec else None,
+                 person_count, context_chars, context_build_ms, datetime.now().isoformat(timespec='seconds'))
+            )
+            return cursor.lastrowid
+
+    def add_answer(self, run_id: int, seq: int, question: str, result: dict):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO ai_batch_answers (run_id, seq, question, answer, status, started_at, wait_seconds, "
+                "first_token_seconds, duration_seconds, prompt_tokens, completion_tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, seq, question, result['answer'], result['status'], result['started_at'],
+                 result['wait_seconds'], result['first_token_seconds'], result['duration_seconds'],
+                 result['prompt_tokens'], result['completion_tokens'])
+            )
+
+    def finish_run(self, run_id: int, status: str):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE ai_batch_runs SET status=?, finished_at=? WHERE id=?",
+                         (status, datetime.now().isoformat(timespec='seconds'), run_id))
+
+    def list_runs(self, limit: int = 20) -> List[dict]:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT r.*, COUNT(a.id) AS answer_count FROM ai_batch_runs r "
+                "LEFT JOIN ai_batch_answers a ON a.run_id = r.id "
+                "GROUP BY r.id ORDER BY r.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [dict(row) for row in rows]
+
+    def get_run(self, run_id: int) -> Optional[dict]:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            run = conn.execute("SELECT * FROM ai_batch_runs WHERE id=?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            answers = conn.execute("SELECT * FROM ai_batch_answers WHERE run_id=? ORDER BY seq",
+                                   (run_id,)).fetchall()
+            report = dict(run)
+            report['answers'] = [dict(answer) for answer in answers]
+            return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="AI 批量分析：对同一查询结果依次提出多个问题，结果保存到数据库，可导出为报告",
+    )
+    parser.add_argument('--questions', help='问题列表文件（每行一个问题，# 开头为注释）')
+    parser.add_argument('--filter', help='JSON 格式的查询条件（格式与 query_cli 相同），默认全部人员')
+    parser.add_argument('--filter-file', help='包含 JSON 查询条件的文件路径')
+    parser.add_argument('--model', help='使用的模型名称')
+    parser.add_argument('--title', help='本次分析的标题')
+    parser.add_argument('--tables', nargs='+', choices=list(TABLE_TITLES), help='参与分析的数据表（默认全部有权限的表）')
+    parser.add_argument('--user', help='按该用户的表格权限提供数据（默认不限制）')
+    parser.add_argument('--db', help='数据库文件路径（默认使用程序配置）')
+    parser.add_argument('--list-runs', action='store_true', help='列出最近的批量分析后退出')
+    parser.add_argument('--report', type=int, metavar='RUN_ID', help='导出指定批量分析的报告后退出')
+    parser.add_argument('--format', default='md', choices=['md', 'csv'], help='报告格式')
+    parser.add_argument('--output', help='报告输出文件（默认输出到屏幕）')
+    return parser.parse_args(argv)
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def load_filter(args):
+    if args.filter_file:
+        with open(args.filter_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if args.filter:
+        return json.loads(args.filter)
+    return None
+
+
+def build_context_tables(db, results: Dict[str, List[dict]], table_keys: List[str]):
+    """与综合查询的 AI 分析相同：每张表使用全部展示字段"""
+    assessment_years = db.get_assessment_years()
+    return [
+        {
+            'key': t_key,
+            'title': TABLE_TITLES[t_key],
+            'rows': results[t_key],
+            'mapping': get_table_fields(t_key, assessment_years if t_key == 'base_info' else None),
+        }
+        for t_key in table_keys if results.get(t_key)
+    ]
+
+
+def run_question(worker: AIWorker, model: str, question: str) -> dict:
+    """通过调度器以后台优先级执行一个问题，等待完成并记录耗时与用量"""
+    usages = []
+    chunks_at = []
+    result = {}
+    # 调度线程中直接回调（批量模式没有界面事件循环）
+    worker.chunk_received.connect(lambda chunk: chunks_at or chunks_at.append(time.perf_counter()),
+                                  Qt.DirectConnection)
+    worker.usage_reported.connect(usages.append, Qt.DirectConnection)
+    worker.finished.connect(lambda answer: result.update(answer=answer), Qt.DirectConnection)
+
+    submitted = time.perf_counter()
+    timing = {}
+
+    def task():
+        timing['started'] = time.perf_counter()
+        timing['started_at'] = datetime.now().isoformat(timespec='seconds')
+        worker.run()
+        timing['finished'] = time.perf_counter()
+
+    get_scheduler().submit(model, task, PRIORITY_BACKGROUND, f"批量分析: {question[:20]}").future.result()
+
+    started = timing['started']
+    return {
+        'answer': result.get('answer', ''),
+        'status': 'error' if worker.failed or 'answer' not in result else 'ok',
+        'started_at': timing['started_at'],
+        'wait_seconds': started - submitted,
+        'first_token_seconds': chunks_at[0] - started if chunks_at else None,
+        'duration_seconds': timing['finished'] - started,
+        'prompt_tokens': sum(usage.get('prompt_tokens') or 0 for usage in usages),
+        'completion_tokens': sum(usage.get('completion_tokens') or 0 for usage in usages),
+        'usages': usages,
+    }
+
+
+def run_batch(db, store: BatchStore, questions: List[str], model: str, filter_spec=None,
+              table_keys: List[str] = None, title: str = None) -> int:
+    """构建一次数据上下文，依次分析全部问题，返回批量分析编号"""
+    start = time.perf_counter()
+    results = db.search(filter_spec)
+    context_tables = build_context_tables(db, results, table_keys or list(TABLE_TITLES))
+    data_context = build_data_context(context_tables, limit_rows_per_table=1000)
+    context_build_ms = (time.perf_counter() - start) * 1000
+    person_count = len(results.get('base_info', []))
+
+    # 所有问题使用相同的系统提示词与上下文长度，Ollama 可复用已计算的提示词缓存，模型也无需重新加载
+    calibrator = TokenCalibrator(db.db_path)
+    longest_question = max(questions, key=len)
+    full_messages = [{"role": "system", "content": table_system_prompt(data_context)},
+                     {"role": "user", "content": longest_question}]
+    tokens_needed = calibrator.estimate(model, message_chars(full_messages)) + ANSWER_RESERVE_TOKENS
+    num_ctx = choose_num_ctx(tokens_needed)
+    memory_limit = get_manager().recommend(model, CTX_BUCKETS)['max_ctx']
+    if num_ctx is not None and num_ctx <= memory_limit:
+        mode, system_prompt = MODE_FULL, table_system_prompt(data_context)
+    else:
+        # 完整数据放不下时改用分块全量分析，夜间运行不在意耗时
+        mode, num_ctx = MODE_MAP_REDUCE, MAP_REDUCE_NUM_CTX
+        system_prompt = table_system_prompt(MAP_REDUCE_DATA_SECTION)
+
+    run_id = store.create_run(title or f"批量分析 {datetime.now():%Y-%m-%d %H:%M}", model, num_ctx, mode,
+                              filter_spec, person_count, len(data_context), context_build_ms)
+    logger.info(f"批量分析 #{run_id} 开始：{len(questions)} 个问题，{person_count} 人，"
+                f"上下文 {len(data_context)} 字（构建耗时 {context_build_ms:.0f} ms），模式 {mode}，num_ctx={num_ctx}")
+
+    status = 'done'
+    try:
+        for seq, question in enumerate(questions, start=1):
+            messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": question}]
+            if mode == MODE_MAP_REDUCE:
+                worker = MapReduceWorker(model, messages, num_ctx, context_tables, calibrator.ratio(model))
+            else:
+                worker = AIWorker(model, messages, num_ctx)
+            print(f"[{seq}/{len(questions)}] {question}", file=sys.stderr)
+            result = run_question(worker, model, question)
+            for usage in result.pop('usages'):
+                calibrator.update(model, usage)
+            store.add_answer(run_id, seq, question, result)
+            print(f"    {result['status']}，耗时 {result['duration_seconds']:.1f} 秒，"
+                  f"回答 {result['completion_tokens']} tokens", file=sys.stderr)
+            if result['status'] != 'ok':
+                status = 'partial'
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        raise
+    finally:
+        store.finish_run(run_id, status)
+        logger.info(f"批量分析 #{run_id} 结束：{status}")
+    return run_id
+
+
+def format_seconds(value) -> str:
+    return '-' if value is None else f"{value:.1f} 秒"
+
+
+def write_markdown_report(report: dict, stream):
+    stream.write(f"# {report['title']}\n\n")
+    stream.write(f"- 编号：{report['id']}\n")
+    stream.write(f"- 时间：{report['started_at']} ~ {report['finished_at'] or '未完成'}（{report['status']}）\n")
+    stream.write(f"- 模型：{report['model']}（num_ctx={report['num_ctx']}，模式 {report['mode']}）\n")
+    stream.write(f"- 数据：{report['person_count']} 人，上下文 {report['context_chars']} 字\n")
+    if report['filter_spec']:
+        stream.write(f"- 查询条件：`{report['filter_spec']}`\n")
+    for answer in report['answers']:
+        stream.write(f"\n## {answer['seq']}. {answer['question']}\n\n")
+        stream.write(f"{answer['answer'] or ''}\n\n")
+        stream.write(
+            f"> 状态 {answer['status']}，排队 {format_seconds(answer['wait_seconds'])}，"
+            f"首字 {format_seconds(answer['first_token_seconds'])}，总耗时 {format_seconds(answer['duration_seconds'])}，"
+            f"提示 {answer['prompt_tokens']} tokens，回答 {answer['completion_tokens']} tokens\n"
+        )
+
+
+def write_csv_report(report: dict, stream):
+    fields = ['seq', 'question', 'answer', 'status', 'started_at', 'wait_seconds', 'first_token_seconds',
+              'duration_seconds', 'prompt_tokens', 'completion_tokens']
+    writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(report['answers'])
+
+
+def export_report(store: BatchStore, run_id: int, output_format: str, output: str = None) -> bool:
+    report = store.get_run(run_id)
+    if report is None:
+        print(f"不存在编号为 {run_id} 的批量分析", file=sys.stderr)
+        return False
+    writer = write_markdown_report if output_format == 'md' else write_csv_report
+    if output:
+        # CSV 带 BOM，便于 Excel 直接打开
+        with open(output, 'w', encoding='utf-8-sig' if output_format == 'csv' else 'utf-8', newline='') as f:
+            writer(report, f)
+        print(f"报告已导出: {output}", file=sys.stderr)
+    else:
+        writer(report, sys.stdout)
+    return True
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = Database(args.db)
+    store = BatchStore(db.db_path)
+    try:
+        if args.list_runs:
+            for run in store.list_runs():
+                print(f"#{run['id']}\t{run['started_at']}\t{run['status']}\t{run['model']}\t"
+                      f"{run['answer_count']} 个问题\t{run['title']}")
+            return 0
+        if args.report is not None:
+            return 0 if export_report(store, args.report, args.format, args.output) else 1
+
+        if not args.questions or not args.model:
+            print("运行批量分析需要指定 --questions 与 --model", file=sys.stderr)
+            return 2
+        try:
+            questions = load_questions(args.questions)
+            filter_spec = load_filter(args)
+        except (OSError, ValueError) as e:
+            print(f"读取问题或查询条件失败: {e}", file=sys.stderr)
+            return 2
+        if not questions:
+            print("问题列表为空", file=sys.stderr)
+            return 2
+
+        table_keys = args.tables or list(TABLE_TITLES)
+        if args.user and not db.is_admin(args.user):
+            permissions = db.get_user_permissions(args.user)
+            table_keys = [t_key for t_key in table_keys if permissions.get(t_key, False)]
+            if not table_keys:
+                print(f"用户 {args.user} 没有任何数据表的查看权限", file=sys.stderr)
+                return 3
+            denied = sorted(key for key in required_permissions(filter_spec) if not permissions.get(key, False))
+            if denied:
+                titles = '、'.join(TABLE_TITLES[key] for key in denied)
+                print(f"用户 {args.user} 没有 {titles} 的查看权限，不能在查询条件中使用", file=sys.stderr)
+                return 3
+
+        if not get_manager().wait_ready():
+            print("本地 AI 服务未能启动", file=sys.stderr)
+            return 4
+
+        run_id = run_batch(db, store, questions, args.model, filter_spec, table_keys, args.title)
+        print(f"批量分析完成，编号 {run_id}（使用 --report {run_id} 导出报告）", file=sys.stderr)
+        return 0
+    except QueryFilterError as e:
+        print(f"查询条件错误: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+        get_manager().stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+from typing import Dict, List
+
+logger = logging.getLogger('AIBenchmark')
+
+# 指标名称 -> (中文说明, 数值越大越好)
+METRICS = {
+    'search_ms': ("全量查询耗时 (ms)", False),
+    'context_build_ms': ("数据上下文构建耗时 (ms)", False),
+    'context_chars': ("数据上下文字符数", False),
+    'first_token_s': ("首字耗时 (s)", False),
+    'tokens_per_s': ("生成速度 (token/s)", True),
+    'total_s': ("回答总耗时 (s)", False),
+    'stream_flush_ms': ("流式刷新平均耗时 (ms)", False),
+    'render_ms': ("回答渲染耗时 (ms)", False),
+}
+
+DEFAULT_QUESTION = "请统计各职级的人数，并列出近三年年度考核为优秀的人员。"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="AI 分析链路基准测试：上下文构建、首字耗时、生成速度与界面渲染耗时",
+    )
+    parser.add_argument('--db', help='数据库文件路径（默认使用程序配置）')
+    parser.add_argument('--model', default='qwen2.5:7b', help='使用的模型名称')
+    parser.add_argument('--num-ctx', type=int, default=8192, help='上下文长度')
+    parser.add_argument('--question', default=DEFAULT_QUESTION, help='测试问题')
+    parser.add_argument('--runs', type=int, default=3, help='重复次数（结果取中位数）')
+    parser.add_argument('--rows', type=int, default=1000, help='每张表最多传入的行数（与综合查询一致）')
+    parser.add_argument('--mock', action='store_true', help='启动内置的模拟 Ollama 服务，无需真实模型')
+    parser.add_argument('--mock-tokens-per-second', type=float, default=30.0)
+    parser.add_argument('--mock-first-token-latency', type=float, default=0.3)
+    parser.add_argument('--mock-answer-tokens', type=int, default=200)
+    parser.add_argument('--no-ui', action='store_true', help='跳过界面渲染耗时测试')
+    parser.add_argument('--output', help='将结果保存为 JSON 文件（可作为之后比较的基线）')
+    parser.add_argument('--baseline', help='与基线 JSON 比较，任一指标退化超过容差时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的相对退化比例（默认 0.2 即 20%%）')
+    return parser.parse_args(argv)
+
+
+def load_context_tables(db, limit_rows: int):
+    """与综合查询的 AI 分析相同：查询全部人员，使用各表全部展示字段"""
+    from ai_context import build_data_context
+    from schema import TABLE_TITLES, get_table_fields
+
+    start = time.perf_counter()
+    results = db.search(None)
+    search_ms = (time.perf_counter() - start) * 1000
+
+    assessment_years = db.get_assessment_years()
+    context_tables = []
+    for t_key, title in TABLE_TITLES.items():
+        if results.get(t_key):
+            context_tables.append({
+                'key': t_key,
+                'title': title,
+                'rows': results[t_key],
+                'mapping': get_table_fields(t_key, assessment_years if t_key == 'base_info' else None),
+            })
+
+    start = time.perf_counter()
+    data_context = build_data_context(context_tables, limit_rows_per_table=limit_rows)
+    context_build_ms = (time.perf_counter() - start) * 1000
+    return context_tables, data_context, {
+        'search_ms': search_ms,
+        'context_build_ms': context_build_ms,
+        'context_chars': len(data_context),
+    }
+
+
+def measure_inference(model: str, num_ctx: int, data_context: str, question: str):
+    """通过 AIWorker 的流式调用测量首字耗时与生成速度，返回 (指标, 增量文本列表, 完整回答)"""
+    from ai_chat import AIWorker
+
+    messages = [
+        {"role": "system", "content": f"你是一个专业的人事数据分析助手。\n\n{data_context}"},
+        {"role": "user", "content": question},
+    ]
+    worker = AIWorker(model, messages, num_ctx)
+    chunks: List[tuple] = []
+    usage: Dict = {}
+    result: Dict = {}
+    worker.chunk_received.connect(lambda chunk: chunks.append((time.perf_counter(), chunk)))
+    worker.usage_reported.connect(usage.update)
+    worker.finished.connect(lambda answer: result.update(answer=answer))
+
+    # 在当前线程直接执行，信号为直接连接，无需事件循环
+    start = time.perf_counter()
+    worker.run()
+    total_s = time.perf_counter() - start
+
+    answer = result.get('answer', '')
+    if not chunks:
+        raise RuntimeError(f"模型没有返回内容: {answer}")
+
+    first_token_s = chunks[0][0] - start
+    completion_tokens = usage.get('completion_tokens') or len(chunks)
+    eval_ns = usage.get('eval_duration_ns')
+    if eval_ns:
+        tokens_per_s = completion_tokens / (eval_ns / 1e9)
+    else:
+        generation_s = max(chunks[-1][0] - chunks[0][0], 1e-6)
+        tokens_per_s = max(len(chunks) - 1, 1) / generation_s
+
+    metrics = {'first_token_s': first_token_s, 'tokens_per_s': tokens_per_s, 'total_s': total_s}
+    return metrics, chunks, answer
+
+
+def measure_rendering(app, context_tables, data_context: str, db_path: str, chunks: List[tuple], answer: str):
+    """在离屏窗口中按真实的刷新间隔回放流式输出，测量刷新与最终 Markdown 渲染耗时"""
+    from ai_chat import AIChatDialog, STREAM_REPAINT_INTERVAL_MS
+
+    dialog = AIChatDialog(data_context, None, context_tables=context_tables, db_path=db_path)
+    dialog.worker = None
+    dialog.show()
+    app.processEvents()
+
+    dialog.begin_stream()
+    dialog.stream_timer.stop()
+    flush_times = []
+    window_start = chunks[0][0]
+    for arrived_at, chunk in chunks:
+        dialog.handle_chunk(chunk)
+        if (arrived_at - window_start) * 1000 >= STREAM_REPAINT_INTERVAL_MS:
+            start = time.perf_counter()
+            dialog.flush_stream()
+            app.processEvents()
+            flush_times.append((time.perf_counter() - start) * 1000)
+            window_start = arrived_at
+
+    start = time.perf_counter()
+    dialog.handle_response(answer)
+    app.processEvents()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    dialog.close()
+    dialog.deleteLater()
+    return {
+        'stream_flush_ms': statistics.mean(flush_times) if flush_times else 0.0,
+        'render_ms': render_ms,
+    }
+
+
+def compare_with_baseline(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """返回退化超过容差的指标说明"""
+    regressions = []
+    for key, (label, higher_is_better) in METRICS.items():
+        if key not in current or not baseline.get(key):
+            continue
+        change = (current[key] - baseline[key]) / baseline[key]
+        if higher_is_better:
+            change = -change
+        if change > tolerance:
+            regressions.append(f"{label}: {baseline[key]:.3f} -> {current[key]:.3f}（退化 {change:.0%}）")
+    return regressions
+
+
+def print_report(summary: Dict[str, float], stream):
+    for key, (label, _) in METRICS.items():
+        if key in summary:
+            stream.write(f"{label:<24}{summary[key]:>12.3f}\n")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    server = None
+    if args.mock:
+        from mock_ollama import MockOllamaServer
+        server = MockOllamaServer(port=0, tokens_per_second=args.mock_tokens_per_second,
+                                  first_token_latency=args.mock_first_token_latency,
+                                  answer_tokens=args.mock_answer_tokens, models=[args.model]).start()
+        # 必须在导入 ollama_client 之前设置，共享客户端在导入时读取服务地址
+        os.environ['OLLAMA_BASE_URL'] = server.base_url
+    if not args.no_ui:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from PyQt5.QtWidgets import QApplication
+    from database import Database
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    db = Database(args.db)
+    try:
+        samples: Dict[str, List[float]] = {}
+        for run in range(args.runs):
+            context_tables, data_context, metrics = load_context_tables(db, args.rows)
+            inference_metrics, chunks, answer = measure_inference(args.model, args.num_ctx, data_context, args.question)
+            metrics.update(inference_metrics)
+            if not args.no_ui:
+                metrics.update(measure_rendering(app, context_tables, data_context, db.db_path, chunks, answer))
+            for key, value in metrics.items():
+                samples.setdefault(key, []).append(value)
+            logger.info(f"第 {run + 1} 次: {metrics}")
+
+        summary = {key: statistics.median(values) for key, values in samples.items()}
+        print_report(summary, sys.stdout)
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_with_baseline(summary, baseline, args.tolerance)
+            if regressions:
+                print("性能退化:\n  " + "\n  ".join(regressions), file=sys.stderr)
+                return 1
+        return 0
+    except Exception as e:
+        print(f"基准测试失败: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import unicodedata
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger('AICache')
+
+# 缓存回答的总大小上限（字节），超出后按最近最少使用淘汰
+MAX_CACHE_BYTES = 5 * 1024 * 1024
+
+TRAILING_PUNCTUATION = '?？。.!！~～ '
+
+
+def hash_text(*parts) -> str:
+    """对任意可 JSON 序列化的内容计算稳定哈希"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """统一全角/半角、大小写与空白，去掉句末标点，使措辞相同的问题命中同一缓存"""
+    text = unicodedata.normalize('NFKC', question).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(TRAILING_PUNCTUATION)
+
+
+class ResponseCache:
+    """AI 回答缓存：键由 (模型, 上下文长度, 数据上下文哈希, 规范化问题, 此前对话) 组成"""
+
+    def __init__(self, db_path: str, max_bytes: int = MAX_CACHE_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(model: str, num_ctx: int, context_hash: str, question: str,
+                 prefix_messages: List[dict]) -> str:
+        prefix = [(msg['role'], msg['content']) for msg in prefix_messages]
+        return hash_text(model, num_ctx, context_hash, normalize_question(question), prefix)
+
+    def get(self, cache_key: str) -> Optional[str]:
+        if not self.db_path:
+            return None
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute("SELECT answer FROM ai_response_cache WHERE cache_key=?",
+                                   (cache_key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE ai_response_cache SET last_used_at=?, hit_count=hit_count+1 WHERE cache_key=?",
+                    (datetime.now().isoformat(timespec='seconds'), cache_key)
+                )
+                return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"读取 AI 回答缓存失败: {e}")
+            return None
+
+    def put(self, cache_key: str, model: str, num_ctx: int, question: str, answer: str):
+        if not self.db_path:
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_response_cache "
+                    "(cache_key, model, num_ctx, question, answer, size, created_at, last_used_at, hit_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (cache_key, model, num_ctx, question, answer,
+                     len(answer.encode('utf-8')) + len(question.encode('utf-8')), now, now)
+                )
+                self.evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"写入 AI 回答缓存失败: {e}")
+
+    def evict(self, conn):
+        """总大小超出上限时删除最近最少使用的条目"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_response_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for cache_key, size in conn.execute(
+                "SELECT cache_key, size FROM ai_response_cache ORDER BY last_used_at, created_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM ai_response_cache WHERE cache_key=?", (cache_key,))
+            total -= size
+            removed += 1
+        logger.info(f"AI 回答缓存超出 {self.max_bytes} 字节，已淘汰 {removed} 条")
@@ -3,115 +3,559 @@ import os
 import json
 import re
 import requests
+import time
 import threading
 import traceback
-import markdown
-from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QTextEdit, QLineEdit,
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QLineEdit, QCheckBox,
                              QPushButton, QLabel, QHBoxLayout, QComboBox, QGroupBox, QMessageBox)
-from PyQt5.QtCore import pyqtSignal, QObject
+from PyQt5.QtCore import pyqtSignal, QObject, QTimer
+
+from ollama_client import MODEL_LIST_TTL_SECONDS, get_client
+from ollama_manager import get_manager
+from ai_scheduler import PRIORITY_INTERACTIVE, get_scheduler
+from rag_index import DEFAULT_TOP_K, PersonRetriever
+from ai_context import render_markdown_table
+from sql_analyst import MAX_RESULT_ROWS, SQLAnalysisError, extract_sql
+from ai_cache import ResponseCache, hash_text
+from ai_conversations import ConversationStore
+from chat_view import ChatView
+from chat_history import build_request_messages, compact_history, question_text, split_turns
+from map_reduce import (MAP_ANSWER_RESERVE_TOKENS, MAP_CONCURRENCY, MAP_PROMPT_OVERHEAD_TOKENS,
+                        MAP_REDUCE_NUM_CTX, REDUCE_SYSTEM_PROMPT, build_chunks, group_partials,
+                        map_messages, partial_chars, reduce_content)
+from token_budget import (ANSWER_RESERVE_TOKENS, CTX_BUCKETS, TokenCalibrator,
+                          choose_num_ctx, message_chars)
+
+# 嵌入模型名称中的常见关键字，用于自动选择向量模型
+EMBED_MODEL_KEYWORDS = ('embed', 'bge', 'm3e', 'gte')
+
+# 流式输出时刷新对话区的最小间隔（毫秒），避免每个 token 都触发重绘
+STREAM_REPAINT_INTERVAL_MS = 50
+
+# 上下文长度下拉框中的自动选项
+CTX_AUTO = "自动"
+
+# 分析方式
+MODE_TABLE = "数据表格分析"
+MODE_MAP_REDUCE = "分块全量分析"
+MODE_SQL = "统计查询（SQL）"
+
+# 统计查询模式下生成的 SQL 执行失败时，最多让模型修正的次数
+SQL_MAX_ATTEMPTS = 2
+
+SQL_NARRATIVE_PROMPT = (
+    "### 角色\n你是一名专业的人力资源数据分析师。\n\n"
+    "### 核心任务\n下面给出用户的问题、为回答该问题执行的 SQL 及其查询结果，请严格根据查询结果回答问题。\n"
+    "### 铁律\n"
+    "1. 回答中的数字必须与查询结果完全一致，禁止自行计算或推测查询结果之外的信息。\n"
+    "2. 如果查询结果为空或无法回答问题，请如实说明。\n\n"
+    "### 输出规则\n"
+    "1. 在输出多条数据时，使用 Markdown 表格列出多条数据。\n"
+    "2. 回复简洁、专业，只需要在最后进行总结。\n"
+)
+
+
+# 分块全量分析时系统提示词中的数据说明
+MAP_REDUCE_DATA_SECTION = "数据量较大，已分块分析，每次提问时会附带各分块的部分结果。"
+
+
+def table_system_prompt(data_section: str) -> str:
+    """表格分析的系统提示词（对话框与批量分析共用）"""
+    return (
+        "### 角色\n你是一名专业的人力资源数据分析师。\n\n"
+        "### 核心任务\n请严格且仅根据下方提供的【数据表格】回答用户的提问（表格中以 @ 开头的编码请按取值字典还原后再回答）。\n"
+        "### 铁律\n"
+        "1. 你的回答必须在提供的数据中能找到直接证据。\n"
+        "2. 如果数据中不存在相关信息，你必须回答'抱歉，根据现有数据无法得出结论'，**绝对禁止**推测、捏造或补充任何数据表外的人员信息！\n\n"
+        "### 数据内容\n"
+        f"{data_section}\n\n"
+        "### 输出规则\n"
+        "1. 在输出多条数据时，使用 Markdown 表格列出多条数据。\n"
+        "2. 回复简洁、专业，只需要在最后进行总结，禁止输出与数据无关的内容。\n"
+    )
+
+
+def is_embed_model(model: str) -> bool:
+    return any(keyword in model.lower() for keyword in EMBED_MODEL_KEYWORDS)
+
+
+class ModelNotFoundError(Exception):
+    """Ollama 中不存在所选模型"""
 
 
 class AIWorker(QObject):
     """在后台线程运行AI推理，调用本地 Ollama 接口"""
+    chunk_received = pyqtSignal(str)  # 流式输出的增量文本
+    status_changed = pyqtSignal(str)  # 检索等准备阶段的进度提示
+    usage_reported = pyqtSignal(dict)  # Ollama 返回的实际 token 用量
     finished = pyqtSignal(str)
 
-    def __init__(self, model_name, messages, n_ctx):
+    def __init__(self, model_name, messages, n_ctx, retriever=None, top_k=None):
         super().__init__()
         self.model_name = model_name
         self.messages = messages  # 接收完整的消息列表
         self.n_ctx = n_ctx
-        self.api_url = "http://127.0.0.1:11434/api/chat"
+        self.retriever = retriever  # 检索增强：提问前先检索相关人员数据
+        self.top_k = top_k
+        self.client = get_client()
         self._is_running = True
+        self.failed = False  # 本轮以错误信息结束（错误信息不写入回答缓存）
+        # 正在读取的响应；中止时关闭连接，Ollama 检测到断开后立即停止生成
+        self.responses = set()
+        self._responses_lock = threading.Lock()
 
     def stop(self):
         self._is_running = False
+        with self._responses_lock:
+            responses = list(self.responses)
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
 
-    def run(self):
-        try:
-            print(f"DEBUG: 正在请求 Ollama 模型 [{self.model_name}], ctx={self.n_ctx}")
+    def attach_retrieved_context(self):
+        """检索与最后一个问题相关的人员数据，并写入该条用户消息"""
+        if not self.retriever.is_built():
+            self.status_changed.emit("正在建立人员向量索引...")
+            self.retriever.build(
+                progress=lambda done, total: self.status_changed.emit(f"正在建立人员向量索引 ({done}/{total})...")
+            )
+        self.status_changed.emit("正在检索相关人员...")
+        question = self.messages[-1]['content']
+        context = self.retriever.context_for(question, self.top_k)
+        # 替换消息列表中的最后一项，完成后由对话框同步到对话历史
+        self.messages[-1] = {
+            "role": "user",
+            "content": f"### 相关人员数据\n{context}\n\n### 问题\n{question}",
+        }
+        self.status_changed.emit("AI 正在思考中...")
 
-            payload = {
-                "model": self.model_name,
-                "messages": self.messages,  # 发送包含上下文的消息列表
-                "stream": True,
-                "options": {
-                    "num_ctx": self.n_ctx,
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "seed": 42,
-                }
-            }
+    def chat_options(self, num_predict=None) -> dict:
+        options = {
+            "num_ctx": self.n_ctx,
+            "temperature": 0.1,
+            "top_p": 0.9,
+            "seed": 42,
+        }
+        if num_predict:
+            options["num_predict"] = num_predict
+        return options
 
-            response = requests.post(self.api_url, json=payload, stream=True, timeout=300)
+    def report_usage(self, data: dict, messages, answer: str):
+        """从 Ollama 的最终响应中提取 prompt_eval_count / eval_count"""
+        self.usage_reported.emit({
+            'model': self.model_name,
+            'num_ctx': self.n_ctx,
+            'prompt_tokens': data.get('prompt_eval_count'),
+            'completion_tokens': data.get('eval_count'),
+            'eval_duration_ns': data.get('eval_duration'),
+            'prompt_chars': message_chars(messages),
+            'completion_chars': len(answer),
+        })
 
-            if response.status_code == 404:
-                self.finished.emit(f"错误: 找不到模型 `{self.model_name}`。")
-                return
+    def stream_chat(self, messages, emit_chunks=True, num_predict=None):
+        """流式调用模型并逐段发出增量文本，返回完整回答；被中止时返回 None
 
+        num_predict 限制回答的 token 数，用于回答须留在预留空间内的中间步骤。
+        """
+        # 发送包含上下文的消息列表（复用共享连接池）
+        response = self.client.chat(self.model_name, messages, self.chat_options(num_predict), stream=True)
+        with self._responses_lock:
+            self.responses.add(response)
+        try:
+            if response.status_code == 404:
+                raise ModelNotFoundError(self.model_name)
             response.raise_for_status()
 
             answer = ""
             for line in response.iter_lines():
                 if not self._is_running:
-                    response.close()
-                    return
+                    return None
 
                 if line:
                     data = json.loads(line)
-                    answer += data.get('message', {}).get('content', '')
+                    chunk = data.get('message', {}).get('content', '')
+                    if chunk:
+                        answer += chunk
+                        if emit_chunks:
+                            self.chunk_received.emit(chunk)
+                    if data.get('done'):
+                        self.report_usage(data, messages, answer)
+            return answer if self._is_running else None
+        finally:
+            with self._responses_lock:
+                self.responses.discard(response)
+            response.close()
 
-            if self._is_running:
+    def complete_chat(self, messages, num_predict=None) -> str:
+        """调用模型并返回完整回答，不逐段发出（用于不直接展示的中间步骤）
+
+        同样使用流式请求，以便中止时能关闭连接、让 Ollama 停止生成。
+        """
+        answer = self.stream_chat(messages, emit_chunks=False, num_predict=num_predict)
+        return answer if answer is not None else ""
+
+    def generate(self):
+        """生成本轮回答"""
+        if self.retriever is not None:
+            self.attach_retrieved_context()
+        return self.stream_chat(self.messages)
+
+    def run(self):
+        try:
+            print(f"DEBUG: 正在请求 Ollama 模型 [{self.model_name}], ctx={self.n_ctx}")
+            answer = self.generate()
+            if answer is not None and self._is_running:
                 self.finished.emit(answer)
 
+        except ModelNotFoundError:
+            self.fail(f"错误: 找不到模型 `{self.model_name}`。")
         except requests.exceptions.ConnectionError:
-            self.finished.emit("错误: 无法连接到本地 Ollama 服务。\n请确认 Ollama 已在后台运行。")
+            self.fail("错误: 无法连接到本地 Ollama 服务。\n请确认 Ollama 已在后台运行。")
         except Exception as e:
             if self._is_running:
                 print(f"AI Error: {e}")
                 traceback.print_exc()
-                self.finished.emit(f"AI 运行出错: {str(e)}")
+            self.fail(f"AI 运行出错: {str(e)}")
+
+    def fail(self, message):
+        """以错误信息结束本轮；已被中止（连接被主动关闭）时不再报告"""
+        self.failed = True
+        if self._is_running:
+            self.finished.emit(message)
+
+
+class SQLWorker(AIWorker):
+    """统计查询模式：模型只看到表结构并生成 SELECT，执行结果再交给模型组织回答"""
+
+    def __init__(self, model_name, messages, n_ctx, analyst):
+        super().__init__(model_name, messages, n_ctx)
+        self.analyst = analyst
+
+    def generate(self):
+        question = self.messages[-1]['content']
+        sql_messages = list(self.messages)
+
+        self.status_changed.emit("正在生成查询语句...")
+        reply = self.complete_chat(sql_messages)
+        for attempt in range(SQL_MAX_ATTEMPTS):
+            try:
+                sql = extract_sql(reply)
+                self.status_changed.emit("正在执行查询...")
+                columns, rows, truncated = self.analyst.execute(sql)
+                break
+            except SQLAnalysisError as e:
+                if attempt == SQL_MAX_ATTEMPTS - 1 or not self._is_running:
+                    raise
+                # 把错误反馈给模型，让其修正查询语句
+                self.status_changed.emit("查询出错，正在修正查询语句...")
+                sql_messages += [
+                    {"role": "assistant", "content": reply},
+                    {"role": "user", "content": f"该查询执行失败：{e}\n请只输出修正后的 SQL。"},
+                ]
+                reply = self.complete_chat(sql_messages)
+
+        if not self._is_running:
+            return None
+
+        if rows:
+            result_table = render_markdown_table([dict(zip(columns, row)) for row in rows],
+                                                 {column: column for column in columns})
+        else:
+            result_table = "（查询结果为空）"
+        note = f"，仅列出前 {MAX_RESULT_ROWS} 行" if truncated else ""
+        narrative_messages = [
+            {"role": "system", "content": SQL_NARRATIVE_PROMPT},
+            {"role": "user", "content": (
+                f"### 问题\n{question}\n\n"
+                f"### 执行的查询\n```sql\n{sql}\n```\n\n"
+                f"### 查询结果（{len(rows)} 行{note}）\n{result_table}"
+            )},
+        ]
+
+        self.status_changed.emit("AI 正在整理回答...")
+        answer = self.stream_chat(narrative_messages)
+        if answer is None:
+            return None
+        # 附上实际执行的 SQL，便于核对，也供后续追问参考
+        return f"{answer.strip()}\n\n**执行的查询：**\n\n```sql\n{sql}\n```"
+
+
+class MapReduceWorker(AIWorker):
+    """分块全量分析：数据按上下文大小分块并发提取，再把部分结果合并为最终回答"""
+
+    def __init__(self, model_name, messages, n_ctx, tables, tokens_per_char):
+        super().__init__(model_name, messages, n_ctx)
+        self.tables = tables
+        self.tokens_per_char = tokens_per_char
+
+    def chunk_chars(self) -> int:
+        """每块数据（或每组待合并的部分结果）可用的字符数"""
+        data_tokens = self.n_ctx - MAP_PROMPT_OVERHEAD_TOKENS - MAP_ANSWER_RESERVE_TOKENS
+        return max(int(data_tokens / self.tokens_per_char), 1000)
+
+    def history_for_reduce(self, max_chars: int) -> list:
+        """最终合并时附带的此前对话，超出 max_chars 时从最早的轮次起舍弃"""
+        history = [msg for msg in self.messages[:-1] if msg['role'] != 'system']
+        while history and message_chars(history) > max_chars:
+            # 成对舍弃最早的一问一答，保持问答顺序
+            history = history[2:] if history[0]['role'] == 'user' and len(history) > 1 else history[1:]
+        return history
+
+    def run_concurrently(self, message_lists, progress_text):
+        """以有限并发调用模型，按输入顺序返回各结果；被中止时返回 None"""
+        results = [None] * len(message_lists)
+        done = 0
+        self.status_changed.emit(f"{progress_text}：0/{len(message_lists)}")
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+            futures = {}
+            for idx, messages in enumerate(message_lists):
+                futures[executor.submit(self.complete_if_running, messages)] = idx
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                done += 1
+                self.status_changed.emit(f"{progress_text}：{done}/{len(message_lists)}")
+        if not self._is_running:
+            return None
+        return results
+
+    def complete_if_running(self, messages):
+        # 排队中的分块在中止后不再发起请求
+        if not self._is_running:
+            return ""
+        return self.complete_chat(messages, num_predict=MAP_ANSWER_RESERVE_TOKENS)
+
+    def generate(self):
+        question = self.messages[-1]['content']
+        chunks = build_chunks(self.tables, self.chunk_chars())
+        if not chunks:
+            return "当前查询没有可分析的数据。"
+
+        partials = self.run_concurrently(
+            [map_messages(chunk, idx, len(chunks), question) for idx, chunk in enumerate(chunks, start=1)],
+            "分块分析中，已完成"
+        )
+        if partials is None:
+            return None
+
+        # 合并时带上此前的对话，支持追问；对话最多占用一半空间，其余留给部分结果
+        group_chars = self.chunk_chars()
+        history = self.history_for_reduce(group_chars // 2)
+        final_chars = group_chars - message_chars(history)
+
+        # 部分结果按估算的 token 数分组逐级合并，直到能放入最终合并的提示词，最后一级以流式输出
+        while len(partials) > 1 and partial_chars(partials) > final_chars:
+            groups = group_partials(partials, group_chars)
+            partials = self.run_concurrently(
+                [[{"role": "system", "content": REDUCE_SYSTEM_PROMPT},
+                  {"role": "user", "content": reduce_content(question, group)}] for group in groups],
+                "正在合并部分结果，已完成"
+            )
+            if partials is None:
+                return None
+
+        self.status_changed.emit("正在汇总各分块结果...")
+        reduce_messages = [{"role": "system", "content": REDUCE_SYSTEM_PROMPT}]
+        reduce_messages += history
+        reduce_messages.append({"role": "user", "content": reduce_content(question, partials)})
+        return self.stream_chat(reduce_messages)
 
 
 class AIChatDialog(QDialog):
-    def __init__(self, data_context, parent=None):
+    model_preloaded = pyqtSignal(str, bool)  # 后台预热完成（模型名, 是否成功）
+    service_ready = pyqtSignal(bool)  # 本地 Ollama 服务启动/探测完成（是否可用）
+    queue_changed = pyqtSignal(int)  # 全局 AI 请求队列中等待的请求数
+    models_discovered = pyqtSignal(object)  # 后台获取的模型列表（失败时为 None）
+
+    def __init__(self, data_context, parent=None, context_tables=None, db_path=None, sql_analyst=None,
+                 conversation=None):
         super().__init__(parent)
         self.data_context = data_context
-        # 新增：用于存储多轮对话的消息列表
+        # 统计查询模式：只向模型提供表结构，由其生成 SQL 在受限连接上执行
+        self.sql_analyst = sql_analyst
+        # 检索增强所需的原始数据（按表）及向量缓存所在的数据库
+        self.context_tables = context_tables
+        self.db_path = db_path
+        self.retriever = None
+        self.person_count = len({row.get('name') for table in context_tables or [] for row in table['rows']})
+        # 新增：用于存储多轮对话的消息列表（完整记录）
         self.history_messages = []
+        # 较早的轮次按 token 预算折叠为摘要，只发送系统提示词 + 摘要 + 近期轮次
+        self.compacted_turns = 0
+        # 流式输出状态：待刷新的增量文本及本轮回答在对话列表中的行号
+        self.stream_pending = []
+        self.stream_row = None
+        self.stream_started_at = None
+        self.stream_first_chunk = False
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(STREAM_REPAINT_INTERVAL_MS)
+        self.stream_timer.timeout.connect(self.flush_stream)
+        self.client = get_client()
+        self.model_preloaded.connect(self.on_model_preloaded)
+        self.service_ready.connect(self.on_service_ready)
+        self.models_discovered.connect(self.on_models_discovered)
+        self.discovering_models = False
+        # 所有对话框的请求统一由调度器排队执行
+        self.job = None
+        self.queue_changed.connect(self.on_queue_changed)
+        # 每次访问信号都会得到新的绑定对象，保存同一个回调以便关闭时能注销
+        self._queue_listener = self.queue_changed.emit
+        get_scheduler().add_listener(self._queue_listener)
+        # 对话保存到数据库（含产生数据上下文的查询条件），重新打开相同查询时可恢复
+        self.conversation = conversation
+        self.conversation_store = ConversationStore(db_path) if db_path and conversation is not None else None
+        restoring = bool(conversation and conversation.get('history'))
+        self.restored_model = conversation.get('model') if restoring else None
+        self.restored_embed_model = (conversation.get('options') or {}).get('embed_model') if restoring else None
+        self.rag_default_applied = restoring
+        # 按模型校准的 token 估算，以及本次对话已使用的上下文长度（自动模式下只增不减）
+        self.calibrator = TokenCalibrator(db_path)
+        self.conversation_ctx = 0
+        self.last_usage = None
+        # 按本机可用内存推算的当前模型最大上下文长度
+        self.memory_ctx_limit = CTX_BUCKETS[-1]
+        # 回答缓存：相同模型、数据、问题与此前对话直接返回已有回答
+        self.response_cache = ResponseCache(db_path)
+        self.pending_cache = None
+        self.force_regenerate = False
         self.setWindowTitle("智能分析助手 (多轮对话版)")
         self.resize(900, 800)
         self.setup_ui()
+        if restoring:
+            self.restore_conversation()
 
     def closeEvent(self, event):
-        if hasattr(self, 'worker') and self.worker:
-            self.worker.stop()
+        # 排队中的请求直接出队，执行中的请求关闭连接，不再占用模型
+        if self.job is not None:
+            get_scheduler().cancel(self.job)
+        get_scheduler().remove_listener(self._queue_listener)
+        self.stream_timer.stop()
         event.accept()
 
-    def get_local_models(self):
-        try:
-            response = requests.get("http://127.0.0.1:11434/api/tags", timeout=3)
-            if response.status_code == 200:
-                data = response.json()
-                # 获取模型列表
-                models = [model['name'] for model in data.get('models', [])]
+    def discover_models(self, force=False):
+        """在后台获取模型列表及各模型的内存评估，完成后通过信号填充下拉框
+
+        有效期内的缓存结果直接使用，不发起请求。
+        """
+        if not force:
+            models = self.client.cached_models(MODEL_LIST_TTL_SECONDS)
+            if models is not None:
+                self.on_models_discovered(models)
+                return
+        if self.discovering_models:
+            return
+        self.discovering_models = True
 
-                # 新增：对模型名称进行自动排序（按字母/数字升序排列）
-                models.sort()
+        def worker():
+            models = None
+            try:
+                # 模型名称已按字母/数字升序排列
+                models = self.client.list_models()
+                manager = get_manager()
+                for model in models:
+                    if not is_embed_model(model):
+                        manager.recommend(model, CTX_BUCKETS, max_age=0 if force else MODEL_LIST_TTL_SECONDS)
+            except Exception as e:
+                print(f"获取模型列表失败: {e}")
+            try:
+                self.models_discovered.emit(models)
+            except RuntimeError:
+                # 对话框可能已关闭
+                pass
 
-                return models
-        except Exception as e:
-            print(f"获取模型列表失败: {e}")
-        return []
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_models_discovered(self, models):
+        self.discovering_models = False
+        if models is None:
+            if self.client.cached_models() is None:
+                self.populate_models([])
+            self.status_label.setText("错误：无法连接 Ollama")
+            return
+        self.populate_models(models)
+        if self.stream_row is not None:
+            return
+        self.status_label.setText(f"就绪 (已识别到 {len(models)} 个本地模型)")
+        self.update_resource_limits()
+
+        # 完整数据放不进当前上下文窗口时默认启用检索增强
+        if self.context_tables and not self.rag_default_applied:
+            self.rag_default_applied = True
+            model_name = self.model_combo.currentText().strip()
+            full_tokens = self.calibrator.estimate(model_name, len(self.data_context) + 300)
+            self.rag_check.setChecked(full_tokens + ANSWER_RESERVE_TOKENS > self.memory_ctx_limit)
+        self.preload_model()
 
-    def refresh_models(self):
+    def populate_models(self, models):
+        """填充模型下拉框；列表未变化时保持当前选择"""
+        current_items = [self.model_combo.itemText(i) for i in range(self.model_combo.count())]
+        if models and current_items == models:
+            return
+        current = self.model_combo.currentText()
+        self.model_combo.blockSignals(True)
         self.model_combo.clear()
-        models = self.get_local_models()
         if models:
             self.model_combo.addItems(models)
-            self.status_label.setText(f"就绪 (已识别到 {len(models)} 个本地模型)")
+            if current not in models:
+                # 恢复的对话沿用原模型，模型与上下文长度不变时 Ollama 可复用已缓存的提示词
+                current = self.restored_model if self.restored_model in models else None
+            self.model_combo.setCurrentText(current or self.recommended_model(models) or models[0])
         else:
             self.model_combo.addItem("未检测到模型/服务未启动")
-            self.status_label.setText("错误：无法连接 Ollama")
+        self.model_combo.blockSignals(False)
+        self.model_combo.currentTextChanged.emit(self.model_combo.currentText())
+
+        if hasattr(self, 'embed_combo'):
+            current_embed = self.embed_combo.currentText() or self.restored_embed_model
+            self.embed_combo.clear()
+            self.embed_combo.addItems(models)
+            if current_embed in models:
+                self.embed_combo.setCurrentText(current_embed)
+            else:
+                for model in models:
+                    if is_embed_model(model):
+                        self.embed_combo.setCurrentText(model)
+                        break
+
+    def recommended_model(self, models):
+        """默认选中本机内存放得下的第一个对话模型（向量模型不能用于对话）"""
+        manager = get_manager()
+        for model in models:
+            if is_embed_model(model):
+                continue
+            recommendation = manager.cached_recommendation(model, CTX_BUCKETS)
+            if recommendation is None or recommendation['fits']:
+                return model
+        return None
+
+    def update_resource_limits(self, *args):
+        """按本机内存限制当前模型可选的上下文长度，超出的档位不可选"""
+        model_name = self.model_combo.currentText().strip()
+        if not model_name or "未检测到模型" in model_name:
+            return
+        # 只使用后台已完成的评估，界面线程不发起请求
+        recommendation = get_manager().cached_recommendation(model_name, CTX_BUCKETS)
+        if recommendation is None:
+            return
+        self.memory_ctx_limit = recommendation['max_ctx']
+
+        items = self.ctx_combo.model()
+        for index in range(self.ctx_combo.count()):
+            text = self.ctx_combo.itemText(index)
+            if text != CTX_AUTO:
+                items.item(index).setEnabled(int(text) <= self.memory_ctx_limit)
+        current = self.ctx_combo.currentText()
+        if current != CTX_AUTO and int(current) > self.memory_ctx_limit:
+            self.ctx_combo.setCurrentText(CTX_AUTO)
+        self.ctx_combo.setToolTip(f"按本机可用内存，当前模型建议上下文不超过 {self.memory_ctx_limit}")
+
+        if not recommendation['fits']:
+            self.status_label.setText(
+                f"⚠️ 模型 {model_name} 约需 {recommendation['required'] / 1024 ** 3:.1f} GB 内存，"
+                f"超过本机可用的 {recommendation['budget'] / 1024 ** 3:.1f} GB，生成会非常缓慢，建议选择更小的模型"
+            )
 
     def setup_ui(self):
         layout = QVBoxLayout()
@@ -125,16 +569,29 @@ class AIChatDialog(QDialog):
         settings_layout.addWidget(self.model_combo)
 
         self.refresh_btn = QPushButton("刷新列表")
-        self.refresh_btn.clicked.connect(self.refresh_models)
+        self.refresh_btn.clicked.connect(lambda: self.ensure_service(force_refresh=True))
         settings_layout.addWidget(self.refresh_btn)
 
         settings_layout.addSpacing(20)
         settings_layout.addWidget(QLabel("上下文长度:"))
         self.ctx_combo = QComboBox()
-        self.ctx_combo.addItems(["4096", "8192", "16384","32768", "65536"])
+        self.ctx_combo.addItems([CTX_AUTO] + [str(bucket) for bucket in CTX_BUCKETS])
         self.ctx_combo.setCurrentIndex(0)
         settings_layout.addWidget(self.ctx_combo)
 
+        # 分析方式：直接分析表格数据，或生成 SQL 精确统计
+        if self.sql_analyst is not None or self.context_tables:
+            settings_layout.addSpacing(20)
+            settings_layout.addWidget(QLabel("分析方式:"))
+            self.mode_combo = QComboBox()
+            self.mode_combo.addItem(MODE_TABLE)
+            if self.context_tables:
+                self.mode_combo.addItem(MODE_MAP_REDUCE)
+            if self.sql_analyst is not None:
+                self.mode_combo.addItem(MODE_SQL)
+            self.mode_combo.currentTextChanged.connect(self.on_mode_changed)
+            settings_layout.addWidget(self.mode_combo)
+
         # 新增：清空对话按钮
         self.clear_btn = QPushButton("清空对话")
         self.clear_btn.clicked.connect(self.clear_chat)
@@ -144,9 +601,33 @@ class AIChatDialog(QDialog):
         settings_group.setLayout(settings_layout)
         layout.addWidget(settings_group)
 
-        self.chat_history = QTextEdit()
-        self.chat_history.setReadOnly(True)
-        layout.addWidget(self.chat_history)
+        # 检索增强：数据量较大时每次只发送与问题最相关的人员
+        if self.context_tables:
+            self.rag_group = rag_group = QGroupBox("检索增强")
+            rag_layout = QHBoxLayout()
+            self.rag_check = QCheckBox(f"仅发送与问题相关的人员（共 {self.person_count} 人）")
+            rag_layout.addWidget(self.rag_check)
+
+            rag_layout.addSpacing(20)
+            rag_layout.addWidget(QLabel("向量模型:"))
+            self.embed_combo = QComboBox()
+            self.embed_combo.setMinimumWidth(180)
+            rag_layout.addWidget(self.embed_combo)
+
+            rag_layout.addSpacing(20)
+            rag_layout.addWidget(QLabel("每次检索人数:"))
+            self.top_k_combo = QComboBox()
+            self.top_k_combo.addItems(["10", "20", "50", "100"])
+            self.top_k_combo.setCurrentText(str(DEFAULT_TOP_K))
+            rag_layout.addWidget(self.top_k_combo)
+
+            rag_layout.addStretch()
+            rag_group.setLayout(rag_layout)
+            layout.addWidget(rag_group)
+
+        # 每条消息是独立的列表项，长对话中滚动和追加只涉及可见及新增的消息
+        self.chat_view = ChatView()
+        layout.addWidget(self.chat_view)
 
         input_layout = QHBoxLayout()
         self.input_field = QLineEdit()
@@ -158,21 +639,262 @@ class AIChatDialog(QDialog):
         self.send_btn.setDefault(True)
         self.send_btn.setStyleSheet("background-color: #2196F3; color: white; padding: 5px 15px;")
 
+        self.regenerate_btn = QPushButton("重新生成")
+        self.regenerate_btn.setToolTip("不使用缓存，重新生成上一个问题的回答")
+        self.regenerate_btn.clicked.connect(self.regenerate_last)
+        self.regenerate_btn.setEnabled(False)
+
         input_layout.addWidget(self.input_field)
         input_layout.addWidget(self.send_btn)
+        input_layout.addWidget(self.regenerate_btn)
         layout.addLayout(input_layout)
 
         self.status_label = QLabel("正在初始化...")
-        layout.addWidget(self.status_label)
+        self.queue_label = QLabel("")
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self.status_label, 1)
+        status_layout.addWidget(self.queue_label)
+        layout.addLayout(status_layout)
 
         self.setLayout(layout)
-        self.refresh_models()
+
+        # 切换模型时先按本机内存限制可选的上下文长度
+        self.model_combo.currentTextChanged.connect(self.update_resource_limits)
+        # 打开对话框或切换模型/上下文长度时在后台预热，首个问题无需等待模型加载
+        self.model_combo.currentTextChanged.connect(self.preload_model)
+        self.ctx_combo.currentTextChanged.connect(self.preload_model)
+        self.ensure_service()
+
+    def ensure_service(self, force_refresh=False):
+        """确保本地 Ollama 服务已启动；服务就绪后再加载模型列表
+
+        已有的模型列表缓存（即使已过期）先行显示，对话框无需等待即可打开。
+        """
+        self.force_model_refresh = bool(force_refresh)
+        cached = self.client.cached_models()
+        if cached:
+            self.populate_models(cached)
+        future = get_manager().ensure_started()
+        if future.done():
+            self.on_service_ready(future.result())
+            return
+        if not cached:
+            self.model_combo.clear()
+            self.model_combo.addItem("未检测到模型（服务启动中...）")
+        self.send_btn.setEnabled(False)
+        self.status_label.setText("正在启动本地 AI 服务，请稍候...")
+        future.add_done_callback(self.notify_service_ready)
+
+    def notify_service_ready(self, future):
+        """在后台线程中调用，通过信号转到界面线程"""
+        try:
+            self.service_ready.emit(future.result())
+        except RuntimeError:
+            # 对话框可能已关闭
+            pass
+
+    def on_service_ready(self, ok):
+        # 正在回答问题时不重新加载模型列表
+        if self.stream_row is not None:
+            return
+        self.send_btn.setEnabled(True)
+        if not ok:
+            self.status_label.setText("错误：本地 AI 服务启动失败，请点击【刷新列表】重试")
+            return
+        self.discover_models(force=self.force_model_refresh)
+
+    def preload_model(self, *args):
+        """按当前选择的模型与上下文长度在后台预热"""
+        model_name = self.model_combo.currentText().strip()
+        if not model_name or "未检测到模型" in model_name:
+            return
+        # 按首轮请求的预估长度选择上下文，与正式提问时保持一致
+        n_ctx = self.resolve_num_ctx(model_name, self.first_turn_chars())[1] or self.memory_ctx_limit
+        if self.client.preload_async(model_name, n_ctx, callback=self.model_preloaded.emit):
+            self.status_label.setText(f"正在预加载模型 {model_name} ...")
+
+    def on_model_preloaded(self, model_name, ok):
+        # 正在回答问题时不覆盖状态提示
+        if not self.send_btn.isEnabled():
+            return
+        if ok:
+            self.status_label.setText(f"就绪 (模型 {model_name} 已加载)")
+        else:
+            self.status_label.setText(f"模型 {model_name} 预加载失败，将在提问时加载")
+
+    def analysis_mode(self) -> str:
+        return self.mode_combo.currentText() if hasattr(self, 'mode_combo') else MODE_TABLE
+
+    def sql_mode(self) -> bool:
+        return self.analysis_mode() == MODE_SQL
+
+    def map_reduce_mode(self) -> bool:
+        return self.analysis_mode() == MODE_MAP_REDUCE
+
+    def rag_enabled(self) -> bool:
+        return bool(self.context_tables) and self.rag_check.isChecked() and self.analysis_mode() == MODE_TABLE
+
+    def on_mode_changed(self, mode):
+        """切换分析方式后系统提示词不同，需要重新开始对话"""
+        if hasattr(self, 'rag_group'):
+            self.rag_group.setEnabled(mode == MODE_TABLE)
+        if self.history_messages:
+            self.clear_chat()
+
+    def build_system_prompt(self, use_rag: bool) -> str:
+        """生成首轮对话的系统提示词"""
+        if self.sql_mode():
+            return (
+                "### 角色\n你是一名熟悉 SQLite 的人力资源数据分析师。\n\n"
+                "### 核心任务\n根据用户的问题编写一条 SQLite 查询语句，用于从下列数据表中统计或查找答案。\n\n"
+                "### 表结构\n"
+                f"{self.sql_analyst.schema_prompt()}\n\n"
+                "### 输出规则\n"
+                "1. 只输出一条 SQL，放在 ```sql 代码块中，不要解释。\n"
+                "2. 只能使用 SELECT（可使用 WITH），不得修改数据。\n"
+                "3. 文本条件优先使用 LIKE '%关键字%' 模糊匹配。\n"
+            )
+
+        if self.map_reduce_mode():
+            data_section = MAP_REDUCE_DATA_SECTION
+        elif use_rag:
+            data_section = "每次提问时会在问题前附带【相关人员数据】，仅包含与问题最相关的人员。"
+        else:
+            data_section = self.data_context
+        return table_system_prompt(data_section)
+
+    def get_retriever(self):
+        """按当前向量模型获取检索器（切换模型后重新建立）"""
+        embed_model = self.embed_combo.currentText().strip()
+        if self.retriever is None or self.retriever.embed_model != embed_model:
+            self.retriever = PersonRetriever(self.db_path, self.context_tables, embed_model, self.client)
+        return self.retriever
+
+    def first_turn_chars(self, top_k: int = 0) -> int:
+        """首轮系统提示词（含数据或表结构）的字符数"""
+        if self.sql_mode():
+            return len(self.sql_analyst.schema_prompt()) + 300
+        if self.map_reduce_mode():
+            return 300
+        if self.rag_enabled():
+            # 检索增强时每轮只附带 top-k 人员的数据，按人均数据量估算
+            top_k = top_k or int(self.top_k_combo.currentText())
+            return len(self.data_context) * min(top_k, self.person_count) // max(self.person_count, 1) + 300
+        return len(self.data_context) + 300
+
+    def resolve_num_ctx(self, model_name: str, total_chars: int):
+        """返回 (预估 token 数, 上下文长度)；上下文长度为 None 表示放不下"""
+        estimated_tokens = self.calibrator.estimate(model_name, total_chars)
+        tokens_needed = estimated_tokens + ANSWER_RESERVE_TOKENS
+        ctx_text = self.ctx_combo.currentText()
+        if ctx_text == CTX_AUTO:
+            if self.map_reduce_mode():
+                # 分块分析的每块大小按上下文长度确定，使用固定的较小窗口
+                tokens_needed = max(tokens_needed, MAP_REDUCE_NUM_CTX)
+            n_ctx = choose_num_ctx(tokens_needed, self.conversation_ctx)
+            # 超出本机内存可承受的上下文时会频繁换页，视为放不下
+            if n_ctx is not None and n_ctx > self.memory_ctx_limit:
+                n_ctx = None
+            return estimated_tokens, n_ctx
+        n_ctx = int(ctx_text)
+        return estimated_tokens, (n_ctx if tokens_needed <= n_ctx else None)
+
+    def cache_context_hash(self) -> str:
+        """当前分析方式下决定回答内容的数据上下文哈希"""
+        mode = self.analysis_mode()
+        parts = [mode, self.data_context, self.person_count]
+        if self.rag_enabled():
+            parts += [self.embed_combo.currentText(), self.top_k_combo.currentText()]
+        elif mode == MODE_SQL:
+            parts += [self.sql_analyst.schema_prompt(), self.sql_analyst.person_ids]
+        elif mode == MODE_MAP_REDUCE:
+            parts += [sum(len(table['rows']) for table in self.context_tables)]
+        return hash_text(*parts)
+
+    def regenerate_last(self):
+        """不使用缓存，重新生成上一个问题的回答"""
+        if not self.send_btn.isEnabled():
+            return
+        if len(self.history_messages) < 2 or self.history_messages[-1]['role'] != 'assistant':
+            return
+        question = question_text(self.history_messages[-2]['content'])
+        self.history_messages = self.history_messages[:-2]
+        self.compacted_turns = min(self.compacted_turns, len(split_turns(self.history_messages)[1]))
+        self.force_regenerate = True
+        self.input_field.setText(question)
+        self.start_inference()
+
+    def on_usage_reported(self, usage: dict):
+        """记录实际用量并更新该模型的 token 校准"""
+        self.last_usage = usage
+        self.calibrator.update(usage['model'], usage)
 
     def clear_chat(self):
-        """清空对话历史"""
+        """清空对话历史；正在生成的回答一并中止，其结果不再写入新的对话"""
+        if self.job is not None:
+            get_scheduler().cancel(self.job)
+        self.job = None
+        self.worker = None
+        self.end_stream()
+        self.send_btn.setEnabled(True)
+        self.status_label.setText("就绪")
         self.history_messages = []
-        self.chat_history.clear()
-        self.chat_history.append("<p style='color:gray;'><i>对话已清空</i></p>")
+        self.compacted_turns = 0
+        self.conversation_ctx = 0
+        self.pending_cache = None
+        self.regenerate_btn.setEnabled(False)
+        if self.conversation is not None:
+            # 之前的对话保留在数据库中，之后的提问另存为新对话
+            self.conversation['id'] = None
+        self.chat_view.clear_messages()
+        self.chat_view.add_notice("对话已清空")
+
+    def restore_conversation(self):
+        """恢复保存的对话：沿用原分析方式与上下文长度，对话记录原样发送，提示词前缀与之前一致"""
+        conversation = self.conversation
+        options = conversation.get('options') or {}
+        if hasattr(self, 'mode_combo') and options.get('mode'):
+            self.mode_combo.blockSignals(True)
+            self.mode_combo.setCurrentText(options['mode'])
+            self.mode_combo.blockSignals(False)
+            if hasattr(self, 'rag_group'):
+                self.rag_group.setEnabled(self.analysis_mode() == MODE_TABLE)
+        if hasattr(self, 'rag_check'):
+            self.rag_check.setChecked(bool(options.get('rag')))
+            if options.get('top_k'):
+                self.top_k_combo.setCurrentText(str(options['top_k']))
+        if options.get('ctx'):
+            self.ctx_combo.setCurrentText(options['ctx'])
+
+        self.history_messages = conversation['history']
+        self.compacted_turns = conversation.get('compacted_turns') or 0
+        self.conversation_ctx = conversation.get('num_ctx') or 0
+        for message in self.history_messages:
+            if message['role'] == 'user':
+                self.chat_view.add_user_message(question_text(message['content']))
+            elif message['role'] == 'assistant':
+                self.chat_view.add_assistant_message(message['content'])
+        self.chat_view.add_notice(f"已恢复 {conversation['updated_at']} 的对话，可继续提问")
+        self.regenerate_btn.setEnabled(self.history_messages[-1]['role'] == 'assistant')
+
+    def save_conversation(self):
+        """每轮回答后保存对话记录及所用的模型、上下文长度和分析方式"""
+        if self.conversation_store is None or not self.history_messages:
+            return
+        self.conversation.update({
+            'model': self.worker.model_name if self.worker is not None else self.model_combo.currentText().strip(),
+            'num_ctx': self.conversation_ctx,
+            'compacted_turns': self.compacted_turns,
+            'history': self.history_messages,
+            'options': {
+                'mode': self.analysis_mode(),
+                'rag': self.rag_enabled(),
+                'embed_model': self.embed_combo.currentText() if hasattr(self, 'embed_combo') else None,
+                'top_k': self.top_k_combo.currentText() if hasattr(self, 'top_k_combo') else None,
+                'ctx': self.ctx_combo.currentText(),
+            },
+        })
+        self.conversation_store.save(self.conversation)
 
     def start_inference(self):
         question = self.input_field.text().strip()
@@ -180,104 +902,192 @@ class AIChatDialog(QDialog):
 
         model_name = self.model_combo.currentText().strip()
         if not model_name or "未检测到模型" in model_name:
-            self.chat_history.append("<p style='color:red;'>错误：未选择有效模型</p>")
+            self.chat_view.add_notice("错误：未选择有效模型", color='red')
             return
 
-        ctx_text = self.ctx_combo.currentText().split()[0]
-        n_ctx = int(ctx_text)
-
         # ================== 【新增】上下文超限预估与拦截 ==================
         # 预估当前系统提示词（含数据）、历史对话和当前问题的总字符数
-        total_chars = len(question)
-        if not self.history_messages:
-            # 如果是首轮，加上系统提示词和完整表格数据的长度
-            total_chars += len(self.data_context) + 300
-        else:
-            # 加上所有历史消息的长度
-            total_chars += sum(len(msg.get('content', '')) for msg in self.history_messages)
+        use_rag = self.rag_enabled()
+        if use_rag:
+            embed_model = self.embed_combo.currentText().strip()
+            if not embed_model or "未检测到模型" in embed_model:
+                self.chat_view.add_notice("错误：检索增强需要选择向量模型", color='red')
+                return
+            top_k = int(self.top_k_combo.currentText())
 
-        # 粗略估算 Token 数量 (中文环境下，1字符约等于1.5~2个Token，此处取上限防越界)
-        estimated_tokens = int(total_chars * 1.8)
+        # 构造本轮的完整对话记录：首轮加入系统提示词和数据上下文
+        messages = list(self.history_messages)
+        if not messages:
+            messages.append({"role": "system", "content": self.build_system_prompt(use_rag)})
+        messages.append({"role": "user", "content": question})
 
-        # 预留给 AI 回复的空间 (比如预留 1500 tokens 用于生成回答)
-        if estimated_tokens > (n_ctx - 1500):
+        # 历史超出预算时将较早的轮次折叠为摘要，系统提示词（含数据）保持在最前不变
+        compacted_turns = compact_history(
+            messages, self.compacted_turns,
+            lambda chars: self.calibrator.estimate(model_name, chars)
+        )
+        request_messages = build_request_messages(messages, compacted_turns)
+
+        total_chars = message_chars(request_messages)
+        if use_rag:
+            # 检索增强时本轮还会附带 top-k 人员的数据
+            total_chars += self.first_turn_chars(top_k) - 300
+
+        # 按该模型实测校准的 token/字 比例估算（未校准时按 1.8 的上限估算），
+        # 并预留给 AI 回复的空间
+        estimated_tokens, n_ctx = self.resolve_num_ctx(model_name, total_chars)
+        if n_ctx is None:
+            ctx_text = self.ctx_combo.currentText()
+            ctx_limit = self.memory_ctx_limit if ctx_text == CTX_AUTO else int(ctx_text)
             QMessageBox.warning(
                 self,
                 "上下文超限警告",
                 f"⚠️ 数据量过大，可能导致 AI 编造信息！\n\n"
-                f"当前数据与对话预估需消耗: {estimated_tokens} Tokens\n"
-                f"您选择的上下文窗口仅为: {n_ctx} Tokens\n\n"
+                f"当前数据与对话预估需消耗: {estimated_tokens} Tokens（另需预留 {ANSWER_RESERVE_TOKENS} 用于回答）\n"
+                f"可用的上下文窗口为: {ctx_limit} Tokens\n\n"
                 f"为防止 AI 丢失规则并产生幻觉，请执行以下操作之一：\n"
-                f"1. 在上方下拉框调大【上下文长度】（若硬件允许）\n"
+                f"1. 在上方下拉框调大【上下文长度】（若硬件允许），或启用【检索增强】/【分块全量分析】\n"
                 f"2. 点击【清空对话】重置历史记忆\n"
                 f"3. 关闭此窗口，并在查询界面减少勾选的分析字段或缩小查询范围。"
             )
             return  # 拦截发送，避免 AI 瞎编
+        self.conversation_ctx = n_ctx
+        self.history_messages = messages
+        self.compacted_turns = compacted_turns
         # ==================================================================
 
         # 1. 更新 UI 显示
-        self.chat_history.append(f"<br><span style='color: #0277bd; '><b>👤 我：</b></span>{question}<br>")
+        force_regenerate, self.force_regenerate = self.force_regenerate, False
+        label = "（重新生成）" if force_regenerate else ""
+        self.chat_view.add_user_message(question, label)
         self.input_field.clear()
         self.send_btn.setEnabled(False)
+        self.regenerate_btn.setEnabled(False)
         self.status_label.setText("AI 正在思考中...")
 
-        # 2. 构造本次请求的消息列表
-        # 如果是首轮对话，加入系统提示词和数据上下文
-        if not self.history_messages:
-            system_content = (
-                "### 角色\n你是一名专业的人力资源数据分析师。\n\n"
-                "### 核心任务\n请严格且仅根据下方提供的【Markdown表格数据】回答用户的提问。\n"
-                "### 铁律\n"
-                "1. 你的回答必须在提供的数据中能找到直接证据。\n"
-                "2. 如果数据中不存在相关信息，你必须回答'抱歉，根据现有数据无法得出结论'，**绝对禁止**推测、捏造或补充任何数据表外的人员信息！\n\n"
-                "### 数据内容\n"
-                f"{self.data_context}\n\n"
-                "### 输出规则\n"
-                "1. 在输出多条数据时，使用 Markdown 表格列出多条数据。\n"
-                "2. 回复简洁、专业，只需要在最后进行总结，禁止输出与数据无关的内容。\n"
+        # 命中回答缓存时直接显示，无需再次推理
+        cache_key = ResponseCache.make_key(
+            model_name, n_ctx, self.cache_context_hash(), question,
+            [msg for msg in messages[:-1] if msg['role'] != 'system']
         )
-            self.history_messages.append({"role": "system", "content": system_content})
+        self.pending_cache = None
+        if not force_regenerate:
+            cached_answer = self.response_cache.get(cache_key)
+            if cached_answer is not None:
+                self.worker = None
+                self.handle_response(cached_answer, from_cache=True)
+                return
+        self.pending_cache = (cache_key, model_name, n_ctx, question)
 
-        # 将当前问题加入历史记录
-        self.history_messages.append({"role": "user", "content": question})
+        # 2. 准备流式输出区域：插入一条临时消息，完成后替换为渲染后的 Markdown
+        self.begin_stream()
 
-        # 3. 启动后台线程，传递完整的对话历史
-        self.worker = AIWorker(model_name, self.history_messages, n_ctx)
-        self.worker_thread = threading.Thread(target=self.worker.run)
-        self.worker_thread.daemon = True
+        # 3. 启动后台线程，传递压缩后的对话历史
+        if self.sql_mode():
+            self.worker = SQLWorker(model_name, request_messages, n_ctx, self.sql_analyst)
+        elif self.map_reduce_mode():
+            self.worker = MapReduceWorker(model_name, request_messages, n_ctx,
+                                          self.context_tables, self.calibrator.ratio(model_name))
+        else:
+            retriever = self.get_retriever() if use_rag else None
+            self.worker = AIWorker(model_name, request_messages, n_ctx,
+                                   retriever=retriever, top_k=top_k if use_rag else None)
+        self.worker.chunk_received.connect(self.handle_chunk)
+        self.worker.status_changed.connect(self.status_label.setText)
+        self.worker.usage_reported.connect(self.on_usage_reported)
+        self.last_usage = None
         self.worker.finished.connect(self.handle_response)
-        self.worker_thread.start()
+        # 同一模型的请求依次执行，提问优先于向量索引构建等后台任务
+        self.job = get_scheduler().submit(model_name, self.worker.run, PRIORITY_INTERACTIVE,
+                                          f"对话提问: {question[:20]}", cancel=self.worker.stop)
+        self.on_queue_changed(get_scheduler().queue_depth())
+
+    def on_queue_changed(self, depth):
+        """显示排队情况；本轮请求仍在等待时提示前面的请求数"""
+        self.queue_label.setText(f"AI 请求排队中：{depth}" if depth else "")
+        job = self.job
+        if job is None or job.future.done() or self.stream_row is None:
+            return
+        if job.future.running():
+            if self.status_label.text().startswith("排队等待"):
+                self.status_label.setText("AI 正在思考中...")
+        else:
+            ahead = get_scheduler().jobs_ahead(job)
+            if ahead:
+                self.status_label.setText(f"排队等待中（前面还有 {ahead} 个请求）...")
+
+    def begin_stream(self):
+        """在对话列表末尾插入一条正在生成的回答，后续增量文本以纯文本形式追加"""
+        self.stream_pending = []
+        self.stream_started_at = time.perf_counter()
+        self.stream_first_chunk = False
+        self.stream_row = self.chat_view.begin_stream()
+        self.stream_timer.start()
+
+    def is_stale_signal(self) -> bool:
+        """信号来自已被清空对话中止的 worker（排队送达的信号在中止后仍可能到达）"""
+        sender = self.sender()
+        return isinstance(sender, AIWorker) and sender is not self.worker
+
+    def handle_chunk(self, chunk):
+        """收到增量文本：先缓存，由定时器按固定间隔批量刷新到界面"""
+        if self.stream_row is None or self.is_stale_signal():
+            return
+        if not self.stream_first_chunk:
+            self.stream_first_chunk = True
+            elapsed = time.perf_counter() - self.stream_started_at
+            self.status_label.setText(f"AI 正在生成回答...（首字耗时 {elapsed:.1f} 秒）")
+        self.stream_pending.append(chunk)
+
+    def flush_stream(self):
+        """将缓存的增量文本一次性追加到正在生成的消息（用户向上翻看历史时不强制滚动到底部）"""
+        if not self.stream_pending:
+            return
+        text = ''.join(self.stream_pending)
+        self.stream_pending = []
+        self.chat_view.append_stream(text)
 
-    def handle_response(self, response):
+    def end_stream(self):
+        """停止刷新并移除流式输出的临时消息，为最终渲染腾出位置"""
+        self.stream_timer.stop()
+        self.stream_pending = []
+        if self.stream_row is None:
+            return
+        self.chat_view.remove_stream()
+        self.stream_row = None
+
+    def handle_response(self, response, from_cache=False):
+        if self.is_stale_signal():
+            return
         final_answer = response.strip()
+        self.end_stream()
+
+        # 检索增强会把本轮实际发送的数据写入用户消息，同步到完整对话记录
+        if (self.worker is not None and self.worker.messages and self.worker.messages[-1]['role'] == 'user'
+                and self.history_messages and self.history_messages[-1]['role'] == 'user'):
+            self.history_messages[-1] = self.worker.messages[-1]
 
         # 4. 将 AI 的回复存入历史记录，实现多轮记忆
         self.history_messages.append({"role": "assistant", "content": final_answer})
 
-        # 渲染 Markdown
-        try:
-            answer_html = markdown.markdown(final_answer, extensions=['extra', 'tables'])
-        except:
-            answer_html = final_answer.replace('\n', '<br>')
-
-        # 仅对表格做基础样式，不包裹外部背景 div
-        styled_html = f"""
-                <style>
-                    table {{ border-collapse: collapse; width: 100%; margin: 10px 0; }}
-                    th, td {{ border: 1px solid #ddd; padding: 8px; }}
-                    th {{ background-color: #f2f2f2; }}
-                </style>
-                {answer_html}
-                """
-
-        # 插入 AI 的名字标识和回答内容
-        self.chat_history.append(f"<span style='color: #9c27b0; '><b>🤖 AI：</b></span><br>{styled_html}")
-
-        # 使用全角字符画一条柔和的浅色横线作为分界线，绝对不会引起 PyQt5 的光标错位 Bug
-        self.chat_history.append(
-            "<div style='color: #e0e0e0; margin-top: 10px; margin-bottom: 10px;'>━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━</div>")
-
-        # 自动滚动
-        self.chat_history.verticalScrollBar().setValue(self.chat_history.verticalScrollBar().maximum())
+        # 写入回答缓存（错误信息不缓存）
+        if self.pending_cache and self.worker is not None and not self.worker.failed and final_answer:
+            cache_key, model_name, n_ctx, question = self.pending_cache
+            self.response_cache.put(cache_key, model_name, n_ctx, question, final_answer)
+        self.pending_cache = None
+        self.save_conversation()
+
+        # 回答只在此处渲染一次 Markdown，之后滚动和追加新消息都复用缓存的 HTML
+        self.chat_view.add_assistant_message(final_answer)
         self.send_btn.setEnabled(True)
-        self.status_label.setText("就绪")
+        self.regenerate_btn.setEnabled(True)
+        if from_cache:
+            self.status_label.setText("就绪（相同问题的缓存回答，如需重新推理请点击【重新生成】）")
+        elif self.last_usage and self.last_usage.get('prompt_tokens') is not None:
+            usage = self.last_usage
+            self.status_label.setText(
+                f"就绪（本轮实际用量：提示 {usage['prompt_tokens']} tokens，回答 {usage['completion_tokens']} tokens，"
+                f"上下文 {usage['num_ctx']}）"
+            )
+        else:
+            self.status_label.setText("就绪")
@@ -0,0 +1,228 @@
+import re
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger('AIContext')
+
+# 数据上下文中的表格描述：{'key': 表名, 'title': 中文名, 'rows': 数据行, 'mapping': 勾选字段 -> 中文表头}
+ContextTable = Dict[str, object]
+
+
+# 字典编码：至少出现这么多次、且不短于该长度的取值替换为短编码
+DICT_MIN_COUNT = 3
+DICT_MIN_LENGTH = 4
+DICT_CODE_PREFIX = '@'
+
+# 日期、期间等纯数字取值不编码，便于模型直接比较大小
+NUMERIC_VALUE_PATTERN = re.compile(r'^[\d.\-/\s至年月日]+$')
+
+DATE_PATTERNS = [
+    (re.compile(r'^(\d{4})-(\d{2})-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?$'), r'\1.\2'),  # YYYY-MM-DD → YYYY.MM
+    (re.compile(r'^(\d{4})(\d{2})$'), r'\1.\2'),  # YYYYMM → YYYY.MM
+]
+
+
+def clean_cell(value) -> str:
+    """清理单元格文本，防止数据内的特殊符号破坏 Markdown 表格结构"""
+    if value is None:
+        return ""
+    value = str(value).strip()
+    # 1. 把所有换行、回车、制表符替换为空格
+    value = re.sub(r'[\r\n\t]+', ' ', value)
+    # 2. 把 Markdown 表格的敏感字符 "|" 替换为全角 "｜"
+    return value.replace('|', '｜')
+
+
+def render_markdown_table(rows: List[dict], mapping: Dict[str, str]) -> str:
+    """将数据行渲染为 Markdown 表格（AI 最擅长理解的格式）"""
+    available_keys = [key for key in mapping if rows and key in rows[0]]
+    headers = [mapping[key] for key in available_keys]
+
+    lines = [
+        "| " + " | ".join(headers) + " |",
+        "| " + " | ".join(["---"] * len(headers)) + " |",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(clean_cell(row.get(key)) for key in available_keys) + " |")
+    return "\n".join(lines)
+
+
+def normalize_date(value: str) -> str:
+    """日期统一为 yyyy.MM（与结果表显示一致）"""
+    for pattern, replacement in DATE_PATTERNS:
+        if pattern.match(value):
+            return pattern.sub(replacement, value)
+    return value
+
+
+def encode_column(rows: List[dict], key: str) -> dict:
+    """清理并规范一列单元格，同时统计可字典编码的取值及其 Markdown 字符数（用于日志对比）"""
+    cells = []
+    markdown_chars = 0
+    for row in rows:
+        value = clean_cell(row.get(key))
+        markdown_chars += len(value)
+        if value and key.endswith('_date'):
+            value = normalize_date(value)
+        cells.append(value)
+    counts = Counter(value for value in cells if len(value) >= DICT_MIN_LENGTH)
+    for value in list(counts):
+        if NUMERIC_VALUE_PATTERN.match(value):
+            del counts[value]
+    return {'cells': cells, 'markdown_chars': markdown_chars, 'counts': counts, 'non_empty': any(cells)}
+
+
+class ContextFragmentCache:
+    """按结果集缓存各表各列已清理、编码的单元格，勾选列变化时只需重新拼装
+
+    以数据行列表对象本身标识结果集：查询或筛选后结果列表不同，对应表的缓存随之失效。
+    可在后台线程中使用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tables = {}  # 表名 -> {'rows': 数据行列表, 'limit': 行数上限, 'columns': 字段 -> 列片段}
+
+    def column(self, table_key: str, rows: List[dict], key: str, limit: int) -> dict:
+        with self._lock:
+            entry = self.tables.get(table_key)
+            if entry is None or entry['rows'] is not rows or entry['limit'] != limit:
+                entry = {'rows': rows, 'limit': limit, 'columns': {}}
+                self.tables[table_key] = entry
+            fragment = entry['columns'].get(key)
+            if fragment is None:
+                fragment = encode_column(rows[:limit], key)
+                entry['columns'][key] = fragment
+            return fragment
+
+
+def build_value_dictionary(counters: List[Counter]) -> Dict[str, str]:
+    """为反复出现的长取值（职务、单位、学历等）分配短编码，只保留确实能缩短文本的取值"""
+    counts = Counter()
+    for counter in counters:
+        counts.update(counter)
+    dictionary = {}
+    for value, count in counts.most_common():
+        if count < DICT_MIN_COUNT:
+            break
+        code = f"{DICT_CODE_PREFIX}{len(dictionary) + 1}"
+        # 节省的字符数需超过字典条目本身的长度
+        if (len(value) - len(code)) * count > len(code) + len(value) + 2:
+            dictionary[value] = code
+    return dictionary
+
+
+def render_compact_table(keys: List[str], columns: List[dict], mapping: Dict[str, str],
+                         dictionary: Dict[str, str]) -> str:
+    """渲染为制表符分隔的紧凑表格，首行为表头"""
+    lines = ["\t".join(mapping[key] for key in keys)]
+    for cells in zip(*(column['cells'] for column in columns)):
+        lines.append("\t".join(dictionary.get(value, value) for value in cells))
+    return "\n".join(lines)
+
+
+def markdown_table_length(columns: List[dict], headers: List[str], row_count: int) -> int:
+    """不实际渲染，按各列字符数计算 Markdown 表格的长度"""
+    separators = 4 + 3 * max(len(headers) - 1, 0)
+    return (separators + sum(len(header) for header in headers)
+            + separators + 3 * len(headers)
+            + row_count * separators + sum(column['markdown_chars'] for column in columns)
+            + row_count + 1)
+
+
+def build_compact_context(selected, limit_rows_per_table: int, cache: Optional[ContextFragmentCache] = None) -> str:
+    """紧凑格式：制表符分隔、去空列、日期规范化，反复出现的长取值以字典编码代替"""
+    prepared = []
+    markdown_length = 0
+    for table, rows in selected:
+        keys = [key for key in table['mapping'] if rows and key in rows[0]]
+        if cache is not None:
+            columns = [cache.column(table['key'], rows, key, limit_rows_per_table) for key in keys]
+        else:
+            limited = rows[:limit_rows_per_table]
+            columns = [encode_column(limited, key) for key in keys]
+        if keys:
+            markdown_length += markdown_table_length(columns, [table['mapping'][key] for key in keys],
+                                                     min(len(rows), limit_rows_per_table))
+        # 去掉全部为空的列
+        non_empty = [idx for idx, column in enumerate(columns) if column['non_empty']]
+        prepared.append((table, len(rows), [keys[idx] for idx in non_empty], [columns[idx] for idx in non_empty]))
+    dictionary = build_value_dictionary([column['counts'] for _, _, _, columns in prepared for column in columns])
+
+    blocks = []
+    if dictionary:
+        legend = "\n".join(f"{code}={value}" for value, code in dictionary.items())
+        blocks.append(f"### 取值字典（表格中以 {DICT_CODE_PREFIX} 开头的编码代表以下取值）:\n{legend}")
+
+    for table, total_count, keys, columns in prepared:
+        note = ""
+        if total_count > limit_rows_per_table:
+            note = f"\n(注：此表共有 {total_count} 条记录，为保证 AI 运行速度，仅传入前 {limit_rows_per_table} 条。)"
+        blocks.append(
+            f"### Data({table['title']}，制表符分隔，首行为表头):\n"
+            f"{render_compact_table(keys, columns, table['mapping'], dictionary)}\n"
+            f"{note}"
+        )
+    context = "\n\n".join(blocks)
+
+    if markdown_length:
+        saving = (1 - len(context) / markdown_length) * 100
+        logger.info(f"AI 数据上下文：Markdown {markdown_length} 字符 → 紧凑格式 {len(context)} 字符"
+                    f"（节省 {saving:.1f}%，字典 {len(dictionary)} 项）")
+    return context
+
+
+def build_data_context(tables: List[ContextTable], limit_rows_per_table: int = 1000,
+                       names: Optional[Set[str]] = None, compact: bool = True,
+                       cache: Optional[ContextFragmentCache] = None) -> str:
+    """组合各表的数据区块；给出 names 时只保留这些人员的数据
+
+    compact 为 True 时使用制表符分隔的紧凑格式（附取值字典），否则使用 Markdown 表格。
+    给出 cache 时复用各列已编码的单元格（按人员筛选时行集合不同，不使用缓存）。
+    """
+    selected = []
+    for table in tables:
+        rows = table['rows']
+        if names is not None:
+            rows = [row for row in rows if row.get('name') in names]
+        selected.append((table, rows))
+
+    if compact:
+        return build_compact_context(selected, limit_rows_per_table, cache if names is None else None)
+
+    blocks = []
+    for table, rows in selected:
+        total_count = len(rows)
+        note = ""
+        if total_count > limit_rows_per_table:
+            note = f"\n(注：此表共有 {total_count} 条记录，为保证 AI 运行速度，仅传入前 {limit_rows_per_table} 条。)"
+
+        blocks.append(
+            f"### Data({table['title']}):\n"
+            f"{render_markdown_table(rows[:limit_rows_per_table], table['mapping'])}\n"
+            f"{note}"
+        )
+    return "\n\n".join(blocks)
+
+
+def person_documents(tables: List[ContextTable]) -> Dict[str, str]:
+    """按人员汇总各表勾选字段，生成用于向量检索的文本（姓名 -> 文本）"""
+    documents = {}
+    for table in tables:
+        mapping = table['mapping']
+        for row in table['rows']:
+            name = row.get('name')
+            if not name:
+                continue
+            parts = []
+            for key, label in mapping.items():
+                value = clean_cell(row.get(key))
+                if key != 'name' and value:
+                    parts.append(f"{label}:{value}")
+            lines = documents.setdefault(name, [f"姓名:{name}"])
+            if parts:
+                lines.append(f"[{table['title']}] " + "；".join(parts))
+    return {name: "\n".join(lines) for name, lines in documents.items()}
+
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Optional
+
+from ai_cache import hash_text
+
+logger = logging.getLogger('AIConversations')
+
+# 以 JSON 文本保存的字段
+JSON_FIELDS = ('filter_spec', 'selected_columns', 'options', 'history')
+
+
+def query_hash(filter_spec, context_tables) -> str:
+    """查询条件、所选列及其数据的哈希；相同时此前保存的数据上下文可直接复用"""
+    tables = []
+    for table in context_tables:
+        fields = list(table['mapping'].keys())
+        tables.append([table['key'], table['mapping'],
+                       [[row.get(field) for field in fields] for row in table['rows']]])
+    return hash_text(filter_spec, tables)
+
+
+class ConversationStore:
+    """AI 对话的保存与恢复（ai_conversations 表）
+
+    除对话记录外还保存产生数据上下文的查询条件、所选列和上下文本身，
+    重新打开相同查询时无需重建上下文，系统提示词逐字相同，Ollama 可复用已缓存的提示词前缀。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def save(self, conversation: dict) -> int:
+        """新建或更新对话，返回对话 ID；更新时只写入会变化的字段，数据上下文只在新建时写入一次"""
+        now = datetime.now().isoformat(timespec='seconds')
+        values = (conversation.get('title'), conversation.get('model'), conversation.get('num_ctx'),
+                  conversation.get('compacted_turns') or 0,
+                  json.dumps(conversation.get('options'), ensure_ascii=False),
+                  json.dumps(conversation.get('history'), ensure_ascii=False))
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                if conversation.get('id'):
+                    conn.execute(
+                        "UPDATE ai_conversations SET title=?, model=?, num_ctx=?, compacted_turns=?, options=?, "
+                        "history=?, updated_at=? WHERE id=?",
+                        values + (now, conversation['id'])
+                    )
+                else:
+                    cursor = conn.execute(
+                        "INSERT INTO ai_conversations (title, model, num_ctx, compacted_turns, options, history, "
+                        "username, query_hash, context_hash, data_context, filter_spec, selected_columns, "
+                        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        values + (conversation.get('username'), conversation['query_hash'],
+                                  conversation.get('context_hash'), conversation.get('data_context'),
+                                  json.dumps(conversation.get('filter_spec'), ensure_ascii=False),
+                                  json.dumps(conversation.get('selected_columns'), ensure_ascii=False),
+                                  now, now)
+                    )
+                    conversation['id'] = cursor.lastrowid
+                    conversation['created_at'] = now
+                conversation['updated_at'] = now
+        except sqlite3.Error as e:
+            logger.error(f"保存 AI 对话失败: {e}")
+        return conversation.get('id')
+
+    def find_latest(self, username: Optional[str], query_hash_value: str) -> Optional[dict]:
+        """该用户基于相同查询的最近一次对话"""
+        return self._fetch_one(
+            "SELECT * FROM ai_conversations WHERE username IS ? AND query_hash=? ORDER BY updated_at DESC, id DESC LIMIT 1",
+            (username, query_hash_value)
+        )
+
+    def _fetch_one(self, sql: str, params: tuple) -> Optional[dict]:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                row = conn.execute(sql, params).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"读取 AI 对话失败: {e}")
+            return None
+        if row is None:
+            return None
+        conversation = dict(row)
+        for field in JSON_FIELDS:
+            conversation[field] = json.loads(conversation[field]) if conversation[field] else None
+        return conversation
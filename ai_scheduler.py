@@ -0,0 +1,166 @@
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger('AIScheduler')
+
+# 优先级：数值越小越先执行
+PRIORITY_INTERACTIVE = 0   # 用户正在等待的提问
+PRIORITY_BACKGROUND = 10   # 向量索引构建、批量任务等
+
+# 某个模型的队列空闲超过该时长（秒）后回收其调度线程
+IDLE_TIMEOUT_SECONDS = 60
+
+
+class AIJob:
+    """提交给调度器的一个 AI 请求"""
+
+    def __init__(self, model: str, func: Callable, priority: int, description: str = '',
+                 cancel: Optional[Callable[[], None]] = None):
+        self.model = model
+        self.func = func
+        self.priority = priority
+        self.description = description
+        self.cancel_callback = cancel  # 执行中被取消时调用（关闭正在读取的 HTTP 连接）
+        self.future = Future()
+        self.cancelled = False
+        self.thread = None
+
+
+class AIScheduler:
+    """全局 AI 请求调度：同一模型的请求依次执行，不同模型互不阻塞
+
+    每个模型一个优先级队列和一个调度线程，用户提问优先于后台任务；
+    排队中的请求取消后直接出队，执行中的请求通过取消回调关闭连接，使 Ollama 立即停止生成。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self.queues: Dict[str, list] = {}
+        self.running: Dict[str, AIJob] = {}
+        self.dispatchers: Dict[str, threading.Thread] = {}
+        self.listeners: List[Callable[[int], None]] = []
+
+    def submit(self, model: str, func: Callable, priority: int = PRIORITY_INTERACTIVE,
+               description: str = '', cancel: Optional[Callable[[], None]] = None) -> AIJob:
+        """提交请求，返回的 AIJob.future 在执行完成后给出结果"""
+        job = AIJob(model, func, priority, description, cancel)
+        with self._condition:
+            heapq.heappush(self.queues.setdefault(model, []), (priority, next(self._sequence), job))
+            if model not in self.dispatchers:
+                thread = threading.Thread(target=self._dispatch, args=(model,), daemon=True,
+                                          name=f"AIScheduler-{model}")
+                self.dispatchers[model] = thread
+                thread.start()
+            self._condition.notify_all()
+        logger.debug(f"提交 AI 请求: {description or func} (模型 {model}, 优先级 {priority})")
+        self._notify_listeners()
+        return job
+
+    def call(self, model: str, func: Callable, priority: int = PRIORITY_INTERACTIVE, description: str = ''):
+        """提交并等待结果；在该模型的调度线程内调用时直接执行，避免自己等待自己"""
+        with self._condition:
+            running = self.running.get(model)
+            inline = running is not None and running.thread is threading.current_thread()
+        if inline:
+            return func()
+        return self.submit(model, func, priority, description).future.result()
+
+    def cancel(self, job: AIJob):
+        """取消请求：排队中的直接出队，执行中的调用取消回调"""
+        with self._condition:
+            if job.cancelled or job.future.done():
+                return
+            job.cancelled = True
+            queue = self.queues.get(job.model, [])
+            entries = [entry for entry in queue if entry[2] is not job]
+            queued = len(entries) != len(queue)
+            if queued:
+                queue[:] = entries
+                heapq.heapify(queue)
+        if queued:
+            job.future.cancel()
+            logger.info(f"已取消排队中的 AI 请求: {job.description}")
+            self._notify_listeners()
+        elif job.cancel_callback is not None:
+            logger.info(f"正在中止执行中的 AI 请求: {job.description}")
+            job.cancel_callback()
+
+    def queue_depth(self, model: Optional[str] = None) -> int:
+        """等待执行的请求数（不含正在执行的）"""
+        with self._condition:
+            if model is not None:
+                return len(self.queues.get(model, []))
+            return sum(len(queue) for queue in self.queues.values())
+
+    def jobs_ahead(self, job: AIJob) -> int:
+        """排在该请求之前的请求数（含正在执行的）"""
+        with self._condition:
+            queue = self.queues.get(job.model, [])
+            position = next((entry for entry in queue if entry[2] is job), None)
+            if position is None:
+                return 0
+            ahead = sum(1 for entry in queue if entry[:2] < position[:2])
+            return ahead + (1 if job.model in self.running else 0)
+
+    def add_listener(self, callback: Callable[[int], None]):
+        """队列变化时以总排队数调用 callback（在任意线程中调用）"""
+        with self._condition:
+            self.listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[int], None]):
+        with self._condition:
+            if callback in self.listeners:
+                self.listeners.remove(callback)
+
+    def _notify_listeners(self):
+        depth = self.queue_depth()
+        with self._condition:
+            listeners = list(self.listeners)
+        for callback in listeners:
+            try:
+                callback(depth)
+            except RuntimeError:
+                # 监听者所属的窗口可能已关闭
+                self.remove_listener(callback)
+
+    def _dispatch(self, model: str):
+        while True:
+            with self._condition:
+                queue = self.queues.setdefault(model, [])
+                if not self._condition.wait_for(lambda: queue, IDLE_TIMEOUT_SECONDS):
+                    # 空闲过久，回收调度线程（之后提交时重新创建）
+                    del self.dispatchers[model]
+                    return
+                _, _, job = heapq.heappop(queue)
+                job.thread = threading.current_thread()
+                self.running[model] = job
+            self._notify_listeners()
+
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.func())
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._condition:
+                    self.running.pop(model, None)
+                self._notify_listeners()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> AIScheduler:
+    """获取全局共享的 AI 请求调度器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AIScheduler()
+        return _scheduler
@@ -0,0 +1,99 @@
+import logging
+from typing import Callable, List, Tuple
+
+from token_budget import message_chars
+
+logger = logging.getLogger('ChatHistory')
+
+# 历史对话（不含系统提示词和本轮问题）的 token 预算
+HISTORY_BUDGET_TOKENS = 3000
+
+# 超出预算时一次压缩到预算的该比例以下，使压缩后的前缀能在后续多轮中保持不变
+COMPACT_TARGET_RATIO = 0.6
+
+# 摘要中每条回答保留的字符数，以及摘要总长度上限
+SUMMARY_ANSWER_CHARS = 150
+SUMMARY_MAX_CHARS = 1500
+
+# 检索增强时用户消息中问题部分的标记
+QUESTION_MARKER = "### 问题\n"
+
+
+def split_turns(messages: List[dict]) -> Tuple[List[dict], List[List[dict]]]:
+    """拆分为 (开头的系统消息, 对话轮次)，每轮以用户消息开始"""
+    index = 0
+    while index < len(messages) and messages[index]['role'] == 'system':
+        index += 1
+    turns = []
+    for msg in messages[index:]:
+        if msg['role'] == 'user' or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return messages[:index], turns
+
+
+def question_text(content: str) -> str:
+    """取用户消息中的问题部分（去掉检索增强附带的数据）"""
+    if QUESTION_MARKER in content:
+        return content.split(QUESTION_MARKER, 1)[1]
+    return content
+
+
+def summarize_turns(turns: List[List[dict]]) -> str:
+    """将较早的对话轮次压缩为摘要：保留问题，回答只保留开头部分"""
+    entries = []
+    for turn in turns:
+        lines = []
+        for msg in turn:
+            if msg['role'] == 'user':
+                lines.append(f"问：{question_text(msg['content']).strip()}")
+            elif msg['role'] == 'assistant':
+                answer = msg['content'].strip().replace('\n', ' ')
+                if len(answer) > SUMMARY_ANSWER_CHARS:
+                    answer = answer[:SUMMARY_ANSWER_CHARS] + "…"
+                lines.append(f"答：{answer}")
+        entries.append("\n".join(lines))
+
+    # 超出长度上限时只保留较近的摘要条目
+    kept, total = [], 0
+    for entry in reversed(entries):
+        total += len(entry) + 1
+        if total > SUMMARY_MAX_CHARS and kept:
+            break
+        kept.append(entry)
+    return "\n".join(reversed(kept))
+
+
+def compact_history(messages: List[dict], compacted_turns: int,
+                    estimate_tokens: Callable[[int], int],
+                    budget_tokens: int = HISTORY_BUDGET_TOKENS) -> int:
+    """返回应折叠进摘要的最早轮次数（只增不减，最后一轮即本轮问题不折叠）"""
+    _, turns = split_turns(messages)
+
+    def history_tokens(folded: int) -> int:
+        return estimate_tokens(message_chars([msg for turn in turns[folded:-1] for msg in turn]))
+
+    if history_tokens(compacted_turns) <= budget_tokens:
+        return compacted_turns
+
+    target = budget_tokens * COMPACT_TARGET_RATIO
+    folded = compacted_turns
+    while folded < len(turns) - 1 and history_tokens(folded) > target:
+        folded += 1
+    logger.info(f"对话历史压缩：{len(turns) - 1} 轮中较早的 {folded} 轮已折叠为摘要")
+    return folded
+
+
+def build_request_messages(messages: List[dict], compacted_turns: int) -> List[dict]:
+    """生成实际发送的消息：系统提示词（含数据）始终在最前且不变，便于 Ollama 复用提示词缓存"""
+    system_messages, turns = split_turns(messages)
+    request = list(system_messages)
+    if compacted_turns:
+        request.append({
+            "role": "system",
+            "content": f"### 此前对话摘要\n{summarize_turns(turns[:compacted_turns])}",
+        })
+    for turn in turns[compacted_turns:]:
+        request.extend(turn)
+    return request
@@ -0,0 +1,238 @@
+import html
+import logging
+from collections import OrderedDict
+
+import markdown
+from PyQt5.QtWidgets import (QListView, QStyledItemDelegate, QAbstractItemView, QApplication, QMenu,
+                             QStyle)
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRectF
+from PyQt5.QtGui import QTextDocument, QTextCursor, QPen, QColor, QKeySequence
+
+logger = logging.getLogger('ChatView')
+
+# 每条消息在对话列表中的数据角色
+MESSAGE_ROLE = Qt.UserRole + 1
+
+# 最多保留的已排版消息文档数，超出后按最近最少使用释放（需要时由缓存的 HTML 重建）
+MAX_CACHED_DOCUMENTS = 60
+
+# 消息内边距与分隔线颜色
+MESSAGE_MARGIN = 8
+SEPARATOR_COLOR = '#e0e0e0'
+
+# 所有消息共用的样式表（原先每条回答都内嵌一份 <style>）
+MESSAGE_STYLE_SHEET = """
+table { border-collapse: collapse; margin: 10px 0; }
+th, td { border: 1px solid #ddd; padding: 8px; }
+th { background-color: #f2f2f2; }
+"""
+
+USER_HEADER = "<span style='color: #0277bd; '><b>👤 我{label}：</b></span>"
+AI_HEADER = "<span style='color: #9c27b0; '><b>🤖 AI：</b></span>"
+
+
+def render_markdown(text: str) -> str:
+    try:
+        return markdown.markdown(text, extensions=['extra', 'tables'])
+    except Exception:
+        return html.escape(text).replace('\n', '<br>')
+
+
+class ChatMessageModel(QAbstractListModel):
+    """对话消息列表；每条消息只在加入时渲染一次 HTML"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages = []
+        self._next_key = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        message = self.messages[index.row()]
+        if role == MESSAGE_ROLE:
+            return message
+        if role == Qt.DisplayRole:
+            return message['text']
+        return None
+
+    def append(self, kind: str, text: str, html_text: str, streaming: bool = False) -> int:
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.messages.append({
+            'key': self._next_key,
+            'kind': kind,
+            'text': text,
+            'html': html_text,
+            'streaming': streaming,
+            'heights': {},  # 按排版宽度缓存的高度
+        })
+        self._next_key += 1
+        self.endInsertRows()
+        return row
+
+    def remove(self, row: int):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.messages[row]
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.messages = []
+        self.endResetModel()
+
+
+class ChatMessageDelegate(QStyledItemDelegate):
+    """用 QTextDocument 绘制单条消息；文档按 LRU 缓存，高度按宽度缓存，滚动与追加时不重新排版旧消息"""
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.documents = OrderedDict()
+
+    def content_width(self) -> int:
+        return max(self.view.viewport().width() - 2, 100)
+
+    def document(self, message: dict, width: int) -> QTextDocument:
+        doc = self.documents.get(message['key'])
+        if doc is None:
+            doc = QTextDocument()
+            doc.setDefaultStyleSheet(MESSAGE_STYLE_SHEET)
+            doc.setDocumentMargin(MESSAGE_MARGIN)
+            doc.setHtml(message['html'])
+            self.documents[message['key']] = doc
+            while len(self.documents) > MAX_CACHED_DOCUMENTS:
+                self.documents.popitem(last=False)
+        else:
+            self.documents.move_to_end(message['key'])
+        if doc.textWidth() != width:
+            doc.setTextWidth(width)
+        return doc
+
+    def forget(self, message: dict):
+        self.documents.pop(message['key'], None)
+
+    def sizeHint(self, option, index):
+        message = index.data(MESSAGE_ROLE)
+        width = self.content_width()
+        height = message['heights'].get(width)
+        if height is None:
+            height = int(self.document(message, width).size().height()) + 1
+            message['heights'][width] = height
+        return QSize(width, height)
+
+    def paint(self, painter, option, index):
+        message = index.data(MESSAGE_ROLE)
+        width = self.content_width()
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, QColor('#f5f9ff'))
+        painter.translate(option.rect.topLeft())
+        clip = QRectF(0, 0, width, option.rect.height())
+        self.document(message, width).drawContents(painter, clip)
+        # 回答之后画一条浅色分隔线
+        if message['kind'] == 'assistant' and not message['streaming']:
+            painter.setPen(QPen(QColor(SEPARATOR_COLOR)))
+            y = option.rect.height() - 1
+            painter.drawLine(MESSAGE_MARGIN, y, width - MESSAGE_MARGIN, y)
+        painter.restore()
+
+
+class ChatView(QListView):
+    """对话记录视图：每条消息是独立的列表项，只渲染新增或变化的消息，历史消息可完整滚动查看"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.message_model = ChatMessageModel(self)
+        self.delegate = ChatMessageDelegate(self)
+        self.setModel(self.message_model)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(False)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.show_context_menu)
+        self.stream_row = None
+
+    def at_bottom(self) -> bool:
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+
+    def _append(self, kind: str, text: str, html_text: str, streaming: bool = False, follow: bool = False) -> int:
+        follow = follow or self.at_bottom()
+        row = self.message_model.append(kind, text, html_text, streaming)
+        if follow:
+            self.scrollToBottom()
+        return row
+
+    def add_user_message(self, question: str, label: str = '') -> int:
+        # 用户刚发送的问题总是滚动到可见位置
+        return self._append('user', question, USER_HEADER.format(label=label) + html.escape(question), follow=True)
+
+    def add_assistant_message(self, answer: str) -> int:
+        return self._append('assistant', answer, f"{AI_HEADER}<br>{render_markdown(answer)}", follow=True)
+
+    def add_notice(self, text: str, color: str = 'gray') -> int:
+        return self._append('notice', text, f"<p style='color:{color};'><i>{html.escape(text)}</i></p>")
+
+    def begin_stream(self) -> int:
+        """插入一条正在生成的回答，后续增量文本以纯文本追加"""
+        self.stream_row = self._append('assistant', '', f"{AI_HEADER}<br>", streaming=True)
+        return self.stream_row
+
+    def append_stream(self, text: str):
+        """只更新正在生成的那一条消息"""
+        if self.stream_row is None:
+            return
+        follow = self.at_bottom()
+        message = self.message_model.messages[self.stream_row]
+        message['text'] += text
+        message['html'] = f"{AI_HEADER}<br>" + html.escape(message['text']).replace('\n', '<br>')
+        doc = self.delegate.documents.get(message['key'])
+        if doc is not None:
+            cursor = QTextCursor(doc)
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        message['heights'] = {}
+        index = self.message_model.index(self.stream_row)
+        self.delegate.sizeHintChanged.emit(index)
+        if follow:
+            self.scrollToBottom()
+
+    def remove_stream(self):
+        """移除正在生成的回答（最终结果另行渲染）"""
+        if self.stream_row is None:
+            return
+        self.delegate.forget(self.message_model.messages[self.stream_row])
+        self.message_model.remove(self.stream_row)
+        self.stream_row = None
+
+    def clear_messages(self):
+        self.delegate.documents.clear()
+        self.message_model.clear()
+        self.stream_row = None
+
+    def copy_selected(self):
+        index = self.currentIndex()
+        if index.isValid():
+            QApplication.clipboard().setText(index.data(Qt.DisplayRole))
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy):
+            self.copy_selected()
+            return
+        super().keyPressEvent(event)
+
+    def show_context_menu(self, pos):
+        index = self.indexAt(pos)
+        if not index.isValid():
+            return
+        self.setCurrentIndex(index)
+        menu = QMenu(self)
+        menu.addAction("复制", self.copy_selected)
+        menu.exec_(self.viewport().mapToGlobal(pos))
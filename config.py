@@ -1,5 +1,8 @@
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
 import sys
 from pathlib import Path
 from PyQt5.QtGui import QFont
@@ -24,6 +27,16 @@ class Config:
         # 日志配置
         self.LOG_LEVEL = logging.INFO
         self.LOG_FILE = self.get_log_path()
+        # 日志文件轮转：'size' 按大小，'midnight' 每天零点
+        self.LOG_ROTATION = 'size'
+        self.LOG_MAX_BYTES = 5 * 1024 * 1024
+        self.LOG_BACKUP_COUNT = 5
+        # 各模块日志级别（未列出的沿用 LOG_LEVEL），可用环境变量 PERSONNEL_LOG_LEVELS="Database=DEBUG,AIChat=INFO" 覆盖
+        self.LOGGER_LEVELS = {
+            'urllib3': logging.WARNING,
+        }
+        self.log_listener = None
+        self.log_file_handler = None
 
         # 创建必要目录和日志文件
         self.create_app_directories()
@@ -53,6 +66,7 @@ class Config:
             'openpyxl',  # 处理Excel文件（特别是合并单元格）
             'requests',  # 【新增】用于调用本地 Ollama API
             'markdown',  # 【新增】用于渲染 AI 返回的 Markdown 文本
+            'numpy',  # 【新增】用于 AI 检索增强的向量相似度计算
         ]
 
     def get_external_dir(self):
@@ -109,24 +123,74 @@ class Config:
         return f"backup_{timestamp}.db"
 
     def configure_logging(self):
-        """配置日志系统，确保使用UTF-8编码"""
+        """配置日志系统：各线程只把日志记录放入队列，由后台监听线程写入按大小/时间轮转的文件（UTF-8）和控制台"""
         root_logger = logging.getLogger()
         root_logger.setLevel(self.LOG_LEVEL)
 
         # 移除默认处理器（如果有）
         for handler in root_logger.handlers[:]:
             root_logger.removeHandler(handler)
+        if self.log_listener is not None:
+            self.log_listener.stop()
 
-        # 创建文件处理器并设置UTF-8编码
         formatter = logging.Formatter(self.LOG_FORMAT)
-        file_handler = logging.FileHandler(self.LOG_FILE, encoding='utf-8')
+        if self.LOG_ROTATION == 'midnight':
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                self.LOG_FILE, when='midnight', backupCount=self.LOG_BACKUP_COUNT, encoding='utf-8')
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                self.LOG_FILE, maxBytes=self.LOG_MAX_BYTES, backupCount=self.LOG_BACKUP_COUNT, encoding='utf-8')
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
-
-        # 添加控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        root_logger.addHandler(console_handler)
+        handlers = [file_handler]
+
+        # 添加控制台处理器（无控制台的打包程序没有 stderr）
+        if sys.stderr is not None:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(-1)
+        root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.log_file_handler = file_handler
+        self.log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.log_listener.start()
+        # 退出前写完队列中剩余的日志
+        atexit.register(self.stop_logging)
+
+        for name, level in self.logger_levels().items():
+            logging.getLogger(name).setLevel(level)
+
+    def logger_levels(self) -> dict:
+        """各模块的日志级别：配置中的默认值，再叠加环境变量中的设置"""
+        levels = dict(self.LOGGER_LEVELS)
+        for item in os.getenv('PERSONNEL_LOG_LEVELS', '').split(','):
+            name, _, level = item.partition('=')
+            level = logging.getLevelName(level.strip().upper())
+            if name.strip() and isinstance(level, int):
+                levels[name.strip()] = level
+        return levels
+
+    def stop_logging(self):
+        """停止后台日志线程（会先写完队列中的记录）"""
+        if self.log_listener is not None:
+            self.log_listener.stop()
+            self.log_listener = None
+
+    def clear_log(self):
+        """清空当前日志文件：先让后台线程写完队列中已有的记录，再截断文件"""
+        listener = self.log_listener
+        if listener is not None:
+            listener.stop()
+        try:
+            handler = self.log_file_handler
+            if handler is not None and handler.stream is not None:
+                handler.stream.close()
+                handler.stream = None  # 下次写入时重新打开
+            with open(self.LOG_FILE, 'w', encoding='utf-8'):
+                pass
+        finally:
+            if listener is not None:
+                listener.start()
 
     def font(self):
         """获取配置的字体对象"""
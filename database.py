@@ -1,13 +1,69 @@
 import os
 import sqlite3
 import re
+import json
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from resume_parser import parse_resumes
+from query_dsl import compile_filter, personnel_filter
+
 # 设置日志
 logger = logging.getLogger('Database')
 
+# 旧版 base_info 中按位置存放年度考核结果的列（年份另存于 system_config）
+LEGACY_ASSESSMENT_COLUMNS = [f"assessment_{idx}" for idx in range(5)]
+
+# 导入/查询结果中年度考核字段的键名，如 assessment_2024
+ASSESSMENT_KEY_PATTERN = re.compile(r'assessment_(\d{4})')
+
+# 由文本日期派生、仅供检索使用的整数列（YYYYMM），不随查询结果返回
+DERIVED_COLUMNS = {
+    'rewards': ['reward_ym', 'punishment_ym', 'impact_end_ym'],
+}
+
+YEAR_MONTH_PATTERN = re.compile(r'^\s*(\d{4})\s*[.\-/年]\s*(\d{1,2})')
+PERIOD_PATTERN = re.compile(r'(\d+|[一二三四五六七八九十]+)\s*(个月|月|年)')
+CHINESE_NUMBERS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6,
+                   '七': 7, '八': 8, '九': 9, '十': 10, '十一': 11, '十二': 12,
+                   '十八': 18, '二十四': 24}
+
+
+def parse_year_month(text) -> Optional[int]:
+    """将 2023.06 / 2023-06-01 / 2023年6月 等日期文本转换为 YYYYMM 整数"""
+    if text is None:
+        return None
+    match = YEAR_MONTH_PATTERN.match(str(text))
+    if not match:
+        return None
+    year, month_text = int(match.group(1)), match.group(2)
+    # Excel 数值日期 2022.10 会被读成 "2022.1"
+    month = 10 if month_text == '1' and str(text).strip() == f"{year}.1" else int(month_text)
+    if not 1 <= month <= 12:
+        return None
+    return year * 100 + month
+
+
+def parse_period_months(text) -> Optional[int]:
+    """将影响期文本（如 6个月、1年、十二个月）转换为月数"""
+    if text is None:
+        return None
+    match = PERIOD_PATTERN.search(str(text))
+    if not match:
+        return None
+    number_text, unit = match.groups()
+    number = int(number_text) if number_text.isdigit() else CHINESE_NUMBERS.get(number_text)
+    if number is None:
+        return None
+    return number * 12 if unit == '年' else number
+
+
+def add_months(year_month: int, months: int) -> int:
+    """YYYYMM 整数加上若干个月"""
+    total = (year_month // 100) * 12 + (year_month % 100 - 1) + months
+    return (total // 12) * 100 + total % 12 + 1
+
 
 class Database:
     def __init__(self, db_path=None):
@@ -15,6 +71,7 @@ class Database:
         os.environ["DISABLE_XML"] = "1"
 
         self.conn = None
+        self.db_path = None  # 实际连接的数据库文件（供后台线程自行建立连接）
         self.connect(db_path)
         self.create_tables()
 
@@ -28,6 +85,7 @@ class Database:
             path = db_path if db_path else config.DB_PATH
             self.conn = sqlite3.connect(path)
             self.conn.row_factory = sqlite3.Row  # 允许按列名访问
+            self.db_path = path
             logger.info(f"成功连接到数据库: {path}")
         except sqlite3.Error as e:
             logger.error(f"数据库连接失败: {e}")
@@ -38,6 +96,7 @@ class Database:
             default_path = 'personnel_system.db'
             self.conn = sqlite3.connect(default_path)
             self.conn.row_factory = sqlite3.Row
+            self.db_path = default_path
             logger.info(f"使用默认路径连接数据库: {default_path}")
 
     def create_tables(self):
@@ -74,15 +133,19 @@ class Database:
                     parttime_education TEXT,
                     parttime_school TEXT,
                     rewards TEXT,
-                    -- 改为通用标记字段
-                    assessment_0 TEXT,
-                    assessment_1 TEXT,
-                    assessment_2 TEXT,
-                    assessment_3 TEXT,
-                    assessment_4 TEXT,
                     remarks TEXT
                 );
             """,
+            'assessments': """
+                CREATE TABLE IF NOT EXISTS assessments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    person_id INTEGER NOT NULL,
+                    year INTEGER NOT NULL,
+                    result TEXT,
+                    UNIQUE(person_id, year),
+                    FOREIGN KEY(person_id) REFERENCES base_info(id)
+                );
+            """,
             'system_config': """
                 CREATE TABLE IF NOT EXISTS system_config (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -103,7 +166,10 @@ class Database:
                     punishment_date TEXT,
                     punishment_unit TEXT,
                     punishment_authority_type TEXT,
-                    impact_period TEXT
+                    impact_period TEXT,
+                    reward_ym INTEGER,
+                    punishment_ym INTEGER,
+                    impact_end_ym INTEGER
                 );
             """,
             'family': """
@@ -127,6 +193,91 @@ class Database:
                     resume_text TEXT
                 );
             """,
+            'career_events': """
+                CREATE TABLE IF NOT EXISTS career_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    person_id INTEGER,
+                    name TEXT NOT NULL,
+                    start_ym INTEGER NOT NULL,
+                    end_ym INTEGER NOT NULL,
+                    unit TEXT,
+                    position TEXT
+                );
+            """,
+            'person_embeddings': """
+                CREATE TABLE IF NOT EXISTS person_embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY(model, text_hash)
+                );
+            """,
+            'ai_response_cache': """
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    num_ctx INTEGER,
+                    question TEXT,
+                    answer TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at TEXT,
+                    last_used_at TEXT,
+                    hit_count INTEGER DEFAULT 0
+                );
+            """,
+            'ai_batch_runs': """
+                CREATE TABLE IF NOT EXISTS ai_batch_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT,
+                    model TEXT NOT NULL,
+                    num_ctx INTEGER,
+                    mode TEXT,
+                    filter_spec TEXT,
+                    person_count INTEGER,
+                    context_chars INTEGER,
+                    context_build_ms REAL,
+                    status TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                );
+            """,
+            'ai_batch_answers': """
+                CREATE TABLE IF NOT EXISTS ai_batch_answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT,
+                    status TEXT NOT NULL,
+                    started_at TEXT,
+                    wait_seconds REAL,
+                    first_token_seconds REAL,
+                    duration_seconds REAL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    FOREIGN KEY(run_id) REFERENCES ai_batch_runs(id)
+                );
+            """,
+            'ai_conversations': """
+                CREATE TABLE IF NOT EXISTS ai_conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT,
+                    title TEXT,
+                    query_hash TEXT NOT NULL,
+                    context_hash TEXT,
+                    data_context TEXT,
+                    model TEXT,
+                    num_ctx INTEGER,
+                    compacted_turns INTEGER DEFAULT 0,
+                    filter_spec TEXT,
+                    selected_columns TEXT,
+                    options TEXT,
+                    history TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                );
+            """,
             'users': """
                 CREATE TABLE IF NOT EXISTS users (
                     username TEXT PRIMARY KEY,
@@ -153,6 +304,174 @@ class Database:
                 logger.error(f"创建表 {table_name} 失败: {e}")
                 raise
 
+        # 旧库补齐派生列
+        for table_name, derived_columns in DERIVED_COLUMNS.items():
+            existing_columns = self.get_table_columns(table_name)
+            for column in derived_columns:
+                if column not in existing_columns:
+                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} INTEGER")
+                    logger.info(f"表 {table_name} 新增派生列 {column}")
+
+        # 年度考核按 (结果, 年份) 聚合统计时使用的覆盖索引
+        indexes = {
+            'idx_assessments_result_year': (
+                "CREATE INDEX IF NOT EXISTS idx_assessments_result_year "
+                "ON assessments (result, year, person_id)"
+            ),
+            # 任职经历按时间区间检索时使用的覆盖索引（"至今"以 PRESENT_YM 表示）
+            'idx_career_events_period': (
+                "CREATE INDEX IF NOT EXISTS idx_career_events_period "
+                "ON career_events (start_ym, end_ym, unit, name)"
+            ),
+            'idx_career_events_name': (
+                "CREATE INDEX IF NOT EXISTS idx_career_events_name "
+                "ON career_events (name)"
+            ),
+            # 跨表条件按姓名做 EXISTS 关联子查询时使用的索引
+            'idx_base_info_name': (
+                "CREATE INDEX IF NOT EXISTS idx_base_info_name ON base_info (name)"
+            ),
+            'idx_rewards_name_reward': (
+                "CREATE INDEX IF NOT EXISTS idx_rewards_name_reward "
+                "ON rewards (name, reward_ym)"
+            ),
+            'idx_rewards_name_impact': (
+                "CREATE INDEX IF NOT EXISTS idx_rewards_name_impact "
+                "ON rewards (name, impact_end_ym)"
+            ),
+            'idx_family_name_status': (
+                "CREATE INDEX IF NOT EXISTS idx_family_name_status "
+                "ON family (name, political_status)"
+            ),
+            'idx_resume_name': (
+                "CREATE INDEX IF NOT EXISTS idx_resume_name ON resume (name)"
+            ),
+            'idx_ai_batch_answers_run': (
+                "CREATE INDEX IF NOT EXISTS idx_ai_batch_answers_run ON ai_batch_answers (run_id, seq)"
+            ),
+            'idx_ai_conversations_query': (
+                "CREATE INDEX IF NOT EXISTS idx_ai_conversations_query "
+                "ON ai_conversations (username, query_hash, updated_at)"
+            ),
+        }
+        for index_name, ddl in indexes.items():
+            try:
+                cursor.execute(ddl)
+            except sqlite3.Error as e:
+                logger.error(f"创建索引 {index_name} 失败: {e}")
+                raise
+
+        self.migrate_legacy_assessments()
+        self.backfill_career_events()
+        self.backfill_rewards_dates()
+
+    def migrate_legacy_assessments(self):
+        """将旧版 assessment_0~4 列中的考核结果迁移到 assessments 表（只执行一次）"""
+        legacy_columns = [c for c in LEGACY_ASSESSMENT_COLUMNS if c in self.get_table_columns('base_info')]
+        if not legacy_columns:
+            return
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT config_value FROM system_config WHERE config_key='assessment_years'")
+        row = cursor.fetchone()
+        if not row:
+            return
+
+        try:
+            years = json.loads(row[0])
+            for idx, year in enumerate(years[:len(legacy_columns)]):
+                column = legacy_columns[idx]
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO assessments (person_id, year, result)
+                    SELECT id, ?, {column} FROM base_info
+                    WHERE {column} IS NOT NULL AND {column} != ''
+                """, (int(year),))
+            # 删除旧的年份配置，作为迁移完成的标记
+            cursor.execute("DELETE FROM system_config WHERE config_key='assessment_years'")
+            self.conn.commit()
+            logger.info(f"已将旧版年度考核数据迁移到 assessments 表，年份: {years}")
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            logger.error(f"迁移旧版年度考核数据失败: {e}")
+
+    def backfill_career_events(self):
+        """为已导入但尚未解析的简历生成任职经历（仅在任职经历表为空时执行）"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM career_events)")
+        if cursor.fetchone()[0]:
+            return
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM resume)")
+        if not cursor.fetchone()[0]:
+            return
+
+        try:
+            cursor.execute("SELECT name, resume_text FROM resume")
+            self._rebuild_career_events(cursor, cursor.fetchall())
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"生成任职经历失败: {e}")
+
+    def backfill_rewards_dates(self):
+        """为旧数据补算奖惩表的派生日期列"""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id, reward_date, punishment_date, impact_period FROM rewards
+            WHERE reward_ym IS NULL AND punishment_ym IS NULL
+        """)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        updates = []
+        for row in rows:
+            derived = self.derive_rewards_dates(row['reward_date'], row['punishment_date'], row['impact_period'])
+            if any(value is not None for value in derived):
+                updates.append(derived + (row['id'],))
+        if not updates:
+            return
+
+        try:
+            cursor.executemany(
+                "UPDATE rewards SET reward_ym = ?, punishment_ym = ?, impact_end_ym = ? WHERE id = ?",
+                updates
+            )
+            self.conn.commit()
+            logger.info(f"已补算 {len(updates)} 条奖惩记录的日期字段")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"补算奖惩日期字段失败: {e}")
+
+    @staticmethod
+    def derive_rewards_dates(reward_date, punishment_date, impact_period) -> tuple:
+        """计算 (奖励年月, 惩处年月, 影响期截止年月)，无法解析的返回 None"""
+        reward_ym = parse_year_month(reward_date)
+        punishment_ym = parse_year_month(punishment_date)
+        impact_end_ym = None
+        if punishment_ym is not None:
+            impact_months = parse_period_months(impact_period)
+            impact_end_ym = add_months(punishment_ym, impact_months) if impact_months else punishment_ym
+        return reward_ym, punishment_ym, impact_end_ym
+
+    def _rebuild_career_events(self, cursor, resumes: List[tuple]):
+        """解析简历文本并批量写入 career_events，覆盖相关人员原有的经历记录"""
+        resumes = [(name, text) for name, text in resumes if name]
+        if not resumes:
+            return
+
+        names = list({name for name, _ in resumes})
+        cursor.executemany("DELETE FROM career_events WHERE name = ?", [(name,) for name in names])
+
+        cursor.execute("SELECT name, MAX(id) FROM base_info GROUP BY name")
+        person_ids = {row[0]: row[1] for row in cursor.fetchall()}
+
+        events = parse_resumes(resumes)
+        cursor.executemany(
+            "INSERT INTO career_events (person_id, name, start_ym, end_ym, unit, position) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(person_ids.get(event[0]),) + event for event in events]
+        )
+
     def normalize_column_name(self, name: str) -> str:
         """规范化Excel列名到数据库字段的映射，自动处理空格和换行符"""
         # 1. 清理列名中的空格和换行符
@@ -241,25 +560,21 @@ class Database:
         normalized = re.sub(r'[^\w]', '', cleaned_name).lower()
         return normalized
 
-    def get_assessment_years(self):
-        """获取年度考核年份配置"""
+    def get_assessment_years(self) -> List[int]:
+        """获取已导入的全部年度考核年份（升序）"""
         cursor = self.conn.cursor()
-        cursor.execute("SELECT config_value FROM system_config WHERE config_key='assessment_years'")
-        row = cursor.fetchone()
-        return eval(row[0]) if row else None
+        cursor.execute("SELECT DISTINCT year FROM assessments ORDER BY year")
+        return [row[0] for row in cursor.fetchall()]
 
-    def set_assessment_years(self, years):
-        """设置年度考核年份配置"""
-        try:
-            cursor = self.conn.cursor()
-            # 使用REPLACE INTO确保唯一性
-            cursor.execute("REPLACE INTO system_config (config_key, config_value) VALUES (?, ?)",
-                           ('assessment_years', str(years)))
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"设置考核年份配置失败: {e}")
-            return False
+    def get_assessment_window(self, recent_years: int) -> Optional[tuple]:
+        """获取"最近N年"对应的年份区间 (起始年, 结束年)，以已导入的最新年份为准"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(year) FROM assessments")
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            return None
+        latest_year = row[0]
+        return latest_year - recent_years + 1, latest_year
 
     def import_excel_data(self, table_name: str, data: List[Dict[str, Any]]):
         """将Excel数据导入到数据库"""
@@ -278,16 +593,25 @@ class Database:
         valid_columns = self.get_table_columns(table_name)
         placeholders = []
         normalized_data = []
+        assessment_data = []
 
-        # 添加列名映射调试信息
+        # 列名映射按列计算一次（调试日志也只按列记录，不再逐个单元格输出）
+        column_names = {}
         for row in data:
             normalized_row = {}
+            row_assessments = {}
             for col_name, value in row.items():
-                original_col = col_name
-                normalized_col = self.normalize_column_name(col_name)
-
-                # 记录映射关系
-                logger.debug(f"列名映射: '{original_col}' -> '{normalized_col}'")
+                normalized_col = column_names.get(col_name)
+                if normalized_col is None:
+                    normalized_col = column_names[col_name] = self.normalize_column_name(col_name)
+                    logger.debug(f"列名映射: '{col_name}' -> '{normalized_col}'")
+
+                # 年度考核结果单独存入 assessments 表
+                match = ASSESSMENT_KEY_PATTERN.fullmatch(normalized_col)
+                if match and table_name == 'base_info':
+                    if value:
+                        row_assessments[int(match.group(1))] = value
+                    continue
 
                 if normalized_col in valid_columns:
                     # 直接使用原始值，不进行任何日期格式转换
@@ -296,18 +620,36 @@ class Database:
                         placeholders.append(normalized_col)
             if normalized_row:
                 normalized_data.append(normalized_row)
+                assessment_data.append(row_assessments)
         if not placeholders:
             logger.warning(f"导入到表 {table_name} 时未找到有效字段，跳过导入")
             return
 
+        # 奖惩表同步计算检索用的派生日期列
+        if table_name == 'rewards':
+            for row in normalized_data:
+                row['reward_ym'], row['punishment_ym'], row['impact_end_ym'] = self.derive_rewards_dates(
+                    row.get('reward_date'), row.get('punishment_date'), row.get('impact_period')
+                )
+            placeholders.extend(DERIVED_COLUMNS['rewards'])
+
         columns = ', '.join(placeholders)
         values_placeholder = ', '.join(['?'] * len(placeholders))
         sql = f"INSERT INTO {table_name} ({columns}) VALUES ({values_placeholder})"
 
         cursor = self.conn.cursor()
         try:
-            values_to_insert = [[row.get(col) for col in placeholders] for row in normalized_data]
-            cursor.executemany(sql, values_to_insert)
+            if table_name == 'base_info':
+                self._upsert_base_info(cursor, sql, placeholders, normalized_data, assessment_data)
+            else:
+                values_to_insert = [[row.get(col) for col in placeholders] for row in normalized_data]
+                cursor.executemany(sql, values_to_insert)
+
+            # 简历导入时同步解析任职经历
+            if table_name == 'resume' and 'resume_text' in placeholders:
+                self._rebuild_career_events(
+                    cursor, [(row.get('name'), row.get('resume_text')) for row in normalized_data]
+                )
             self.conn.commit()
             logger.info(f"成功导入 {len(normalized_data)} 条数据到表 {table_name}")
         except sqlite3.Error as e:
@@ -315,123 +657,140 @@ class Database:
             logger.error(f"导入数据到表 {table_name} 失败: {e}")
             raise
 
+    def _upsert_base_info(self, cursor, insert_sql: str, placeholders: List[str],
+                          normalized_data: List[Dict[str, Any]], assessment_data: List[Dict[int, str]]):
+        """按姓名和出生年月更新或新增人员基本信息，并增量写入年度考核结果
+
+        已存在的人员只更新其基本信息，不会重复插入；导入数据没有出生年月时，
+        仅在库中同名人员唯一时按姓名匹配。同一批导入的多行从不合并为同一人，
+        同名的不同人员各自保留。考核结果按 (人员, 年份) 覆盖，因此导入新的考核年度时无需清空数据库。
+        """
+        identity_ids = {}  # (姓名, 出生年月) -> 人员 ID
+        name_ids = {}  # 姓名 -> 人员 ID 列表
+        cursor.execute("SELECT id, name, birth_date FROM base_info ORDER BY id")
+        for person_id, name, birth_date in cursor.fetchall():
+            identity_ids[(name, self._identity_value(birth_date))] = person_id
+            name_ids.setdefault(name, []).append(person_id)
+
+        update_columns = [col for col in placeholders if col != 'name']
+        update_sql = None
+        if update_columns:
+            assignments = ', '.join(f"{col} = ?" for col in update_columns)
+            update_sql = f"UPDATE base_info SET {assignments} WHERE id = ?"
+
+        assessment_rows = []
+        batch_ids = set()
+        for row, row_assessments in zip(normalized_data, assessment_data):
+            name = row.get('name')
+            birth_date = self._identity_value(row.get('birth_date'))
+            person_id = None
+            if name:
+                same_name = name_ids.get(name, [])
+                person_id = identity_ids.get((name, birth_date))
+                if person_id is None and len(same_name) == 1:
+                    # 导入数据或库中记录缺少出生年月时，唯一的同名人员视为同一人
+                    only_id = same_name[0]
+                    if birth_date is None or (name, None) in identity_ids:
+                        person_id = only_id
+                elif person_id is None and birth_date is None and len(same_name) > 1:
+                    logger.warning(f"库中有 {len(same_name)} 名同名人员“{name}”且导入数据无出生年月，按新人员导入")
+            if person_id in batch_ids:
+                person_id = None
+            if person_id is None:
+                cursor.execute(insert_sql, [row.get(col) for col in placeholders])
+                person_id = cursor.lastrowid
+                if name:
+                    identity_ids[(name, birth_date)] = person_id
+                    name_ids.setdefault(name, []).append(person_id)
+            elif update_sql:
+                cursor.execute(update_sql, [row.get(col) for col in update_columns] + [person_id])
+
+            batch_ids.add(person_id)
+            for year, result in row_assessments.items():
+                assessment_rows.append((person_id, year, result))
+
+        if assessment_rows:
+            cursor.executemany(
+                "REPLACE INTO assessments (person_id, year, result) VALUES (?, ?, ?)",
+                assessment_rows
+            )
+            logger.info(f"写入年度考核结果 {len(assessment_rows)} 条")
+
+    @staticmethod
+    def _identity_value(value) -> Optional[str]:
+        """用于识别人员的字段值：去除首尾空白，空值视为缺失"""
+        if value is None:
+            return None
+        value = str(value).strip()
+        return value or None
+
     def get_table_columns(self, table_name: str) -> List[str]:
         """获取指定表的所有列名"""
         cursor = self.conn.cursor()
         cursor.execute(f"PRAGMA table_info({table_name})")
         return [col[1] for col in cursor.fetchall()]
 
-    def search_personnel(self, name: str = None,
-                         grades: list = None,
-                         position: list = None,
-                         birth_start: str = None,
-                         birth_end: str = None,
-                         education: str = None,  # 修改为字符串类型
-                         parttime_education: str = None):  # 修改为字符串类型
-        """搜索人员信息，返回所有相关表的数据"""
-        try:
-            # 构建基础查询条件
-            base_conditions = []
-            params = []
+    def search_personnel(self, **criteria):
+        """按综合查询界面的条件搜索人员信息（兼容旧接口，条件含义见 query_dsl.personnel_filter）"""
+        return self.search(personnel_filter(**criteria))
 
-            # 添加姓名条件
-            if name:
-                base_conditions.append("name LIKE ?")
-                params.append(f"%{name}%")
-
-            # 添加职级/等级条件（支持多值）
-            if grades:
-                # 创建OR条件列表
-                grade_conditions = []
-                for grade in grades:
-                    grade_conditions.append("current_grade LIKE ?")
-                    params.append(f"%{grade}%")
-
-                # 将多个OR条件组合为一个条件组
-                base_conditions.append(f"({' OR '.join(grade_conditions)})")
-
-            # 添加现任职务条件
-            if position:
-                # 创建OR条件列表
-                position_conditions = []
-                for pos in position:
-                    position_conditions.append("current_position = ?")
-                    params.append(pos)  # 直接使用完整职位名称
-
-                # 将多个OR条件组合为一个条件组
-                base_conditions.append(f"({' OR '.join(position_conditions)})")
-
-            # 处理出生年月范围条件（格式为yyyy.MM）
-            if birth_start and birth_end:
-                base_conditions.append("(REPLACE(birth_date, '-', '.') BETWEEN ? AND ?)")
-                params.append(birth_start)
-                params.append(birth_end)
-            elif birth_start:
-                base_conditions.append("REPLACE(birth_date, '-', '.') >= ?")
-                params.append(birth_start)
-            elif birth_end:
-                base_conditions.append("REPLACE(birth_date, '-', '.') <= ?")
-                params.append(birth_end)
-
-            # 添加全日制学历学位条件（模糊查询）
-            if education:
-                edu_conditions = []
-                for keyword in education:
-                    edu_conditions.append("fulltime_education LIKE ?")
-                    params.append(f"%{keyword}%")
-                base_conditions.append(f"({' OR '.join(edu_conditions)})")
-
-
-            # 修改在职学历学位条件处理
-            if parttime_education:
-                parttime_conditions = []
-                for keyword in parttime_education:
-                    parttime_conditions.append("parttime_education LIKE ?")
-                    params.append(f"%{keyword}%")
-                base_conditions.append(f"({' OR '.join(parttime_conditions)})")
+    def search(self, filter_spec: Optional[Dict[str, Any]] = None) -> Dict[str, List[Dict]]:
+        """按查询条件树搜索人员信息，返回所有相关表的数据
+
+        filter_spec 的格式见 query_dsl 模块，例如：
+        {"and": [{"field": "current_grade", "op": "like", "value": "副科"},
+                 {"field": "family.political_status", "op": "eq", "value": "中共党员"}]}
+        """
+        try:
+            where_sql, params = compile_filter(filter_spec)
 
             # 构建基础查询SQL
             base_sql = "SELECT * FROM base_info"
-            if base_conditions:
-                base_sql += " WHERE " + " AND ".join(base_conditions)
+            if where_sql:
+                base_sql += " WHERE " + where_sql
 
             cursor = self.conn.cursor()
             cursor.execute(base_sql, params)
             base_results = cursor.fetchall()
 
+            # 查询匹配人员的年度考核结果（长表转为 assessment_年份 字段）
+            assessment_years = self.get_assessment_years()
+            person_assessments = {}
+            if base_results and assessment_years:
+                id_sql = base_sql.replace("SELECT *", "SELECT id", 1)
+                cursor.execute(
+                    f"SELECT person_id, year, result FROM assessments WHERE person_id IN ({id_sql})",
+                    params
+                )
+                for person_id, year, result in cursor.fetchall():
+                    person_assessments.setdefault(person_id, {})[f"assessment_{year}"] = result
+
             # 转换为字典列表
             base_info_data = []
-            matching_names = []
-
             for row in base_results:
                 row_dict = dict(row)
+                for legacy_col in LEGACY_ASSESSMENT_COLUMNS:
+                    row_dict.pop(legacy_col, None)
+                for year in assessment_years:
+                    row_dict[f"assessment_{year}"] = ''
+                row_dict.update(person_assessments.get(row_dict['id'], {}))
                 base_info_data.append(row_dict)
-                matching_names.append(row_dict['name'])
 
             # 查询相关的其他表数据
             results = {'base_info': base_info_data}
 
-            if matching_names:
-                # 构建IN条件
-                name_placeholders = ','.join(['?' for _ in matching_names])
-
-                # 查询奖惩信息
-                rewards_sql = f"SELECT * FROM rewards WHERE name IN ({name_placeholders})"
-                cursor.execute(rewards_sql, matching_names)
-                rewards_data = [dict(row) for row in cursor.fetchall()]
-                results['rewards'] = rewards_data
-
-                # 查询家庭成员信息
-                family_sql = f"SELECT * FROM family WHERE name IN ({name_placeholders})"
-                cursor.execute(family_sql, matching_names)
-                family_data = [dict(row) for row in cursor.fetchall()]
-                results['family'] = family_data
-
-                # 查询简历信息
-                resume_sql = f"SELECT * FROM resume WHERE name IN ({name_placeholders})"
-                cursor.execute(resume_sql, matching_names)
-                resume_data = [dict(row) for row in cursor.fetchall()]
-                results['resume'] = resume_data
+            if base_info_data:
+                # 关联表按匹配人员的姓名子查询获取，避免拼接超长的参数列表
+                name_sql = base_sql.replace("SELECT *", "SELECT name", 1)
+                for child_table in ['rewards', 'family', 'resume']:
+                    cursor.execute(f"SELECT * FROM {child_table} WHERE name IN ({name_sql})", params)
+                    child_data = []
+                    for row in cursor.fetchall():
+                        row_dict = dict(row)
+                        for derived_col in DERIVED_COLUMNS.get(child_table, []):
+                            row_dict.pop(derived_col, None)
+                        child_data.append(row_dict)
+                    results[child_table] = child_data
             else:
                 results['rewards'] = []
                 results['family'] = []
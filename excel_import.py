@@ -11,6 +11,9 @@ from database import Database
 
 logger = logging.getLogger('ExcelImport')
 
+# 年度考核列名，如"2024年年度考核结果"
+ASSESSMENT_COLUMN_PATTERN = re.compile(r'(\d{4})年年度考核结果')
+
 
 def clean_column_name(name: str) -> str:
     """清理Excel列名，处理空格和换行符，保留特殊符号"""
@@ -183,60 +186,32 @@ def import_specific_table(file_path: str, db: Database, table_name: str) -> (boo
         # 记录导入后的数据样本
         logger.debug(f"导入后数据样本: \n{df.head(5).to_string()}")
 
-        # ==== 新增：处理base_info表的年度考核字段 ====
-        year_to_index = {}  # 年份到通用标记的映射
+        # ==== 处理base_info表的年度考核字段 ====
+        # 年度考核结果按年份写入 assessments 长表，年份数量不限，
+        # 已导入过的年份会被覆盖，新年份增量追加，无需清空数据库
+        year_columns = {}  # 列名到年份的映射
 
         if table_name == 'base_info':
-            # 1. 识别年度考核字段
-            assessment_years = []
-
             for col in df.columns:
-                match = re.search(r'(\d{4})年年度考核结果', col)
+                match = ASSESSMENT_COLUMN_PATTERN.search(col)
                 if match:
-                    year = int(match.group(1))
-                    assessment_years.append(year)
-
-            # 2. 验证是否为连续五年
-            if assessment_years:
-                assessment_years.sort()
-                if len(assessment_years) != 5:
-                    return False, "必须包含连续的五个年度考核字段"
-
-                for i in range(1, 5):
-                    if assessment_years[i] - assessment_years[i - 1] != 1:
-                        return False, "年度考核字段必须为连续五年"
+                    year_columns[col] = int(match.group(1))
 
-                # 3. 检查年份配置是否已存在
-                existing_years = db.get_assessment_years()
-                if existing_years and existing_years != assessment_years:
-                    return False, f"年度考核区间不匹配（已配置: {existing_years}，当前: {assessment_years}），请先清空数据库"
-
-                # 4. 存储年份配置
-                if not existing_years:
-                    if not db.set_assessment_years(assessment_years):
-                        return False, "保存年度考核配置失败"
-
-                # 5. 创建年份到通用标记的映射
-                year_to_index = {year: f"assessment_{idx}" for idx, year in enumerate(assessment_years)}
+            if year_columns:
+                logger.info(f"识别到年度考核年份: {sorted(year_columns.values())}")
 
         # 转换为字典列表
         records: List[Dict[str, Any]] = []
         for _, row in df.iterrows():
             record = {}
             for col_name, value in row.items():
-                # 清理列名
-                cleaned_name = clean_column_name(col_name)
-
                 # 年度考核字段特殊处理
-                match = re.search(r'(\d{4})年年度考核结果', col_name)
-                if match and table_name == 'base_info':
-                    year = int(match.group(1))
-                    if year in year_to_index:
-                        record[year_to_index[year]] = convert_excel_date(value)
-                        continue  # 跳过常规处理
+                if col_name in year_columns:
+                    record[f"assessment_{year_columns[col_name]}"] = convert_excel_date(value)
+                    continue  # 跳过常规处理
 
                 # 常规字段处理
-                record[cleaned_name] = convert_excel_date(value)
+                record[clean_column_name(col_name)] = convert_excel_date(value)
 
             records.append(record)
 
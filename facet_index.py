@@ -0,0 +1,145 @@
+import time
+import logging
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger('FacetIndex')
+
+# 参与分面筛选的分类字段（数据库字段名 -> 显示名称），年度考核字段按年份动态追加
+FACET_FIELDS = {
+    'gender': '性别',
+    'ethnicity': '民族',
+    'current_grade': '职级/等级',
+    'fulltime_education': '全日制学历学位',
+    'parttime_education': '在职学历学位',
+}
+
+# 空值在分面中的显示名称
+EMPTY_VALUE = '(空)'
+
+
+def popcount(bits: int) -> int:
+    """统计位集合中 1 的个数（兼容 Python 3.8，不使用 int.bit_count）"""
+    return bin(bits).count('1')
+
+
+def positions_to_bits(positions: Iterable[int], size: int) -> int:
+    """将行位置列表转换为位集合"""
+    buffer = bytearray((size + 7) // 8)
+    for pos in positions:
+        buffer[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class FacetIndex:
+    """分类字段的内存位图索引：每个字段的取值编码为整数，每个取值对应一个位集合
+
+    第 i 位表示 base_info 中按 id 排序后的第 i 个人员，筛选与计数全部通过位运算完成。
+    """
+
+    def __init__(self):
+        self.row_ids: List[int] = []
+        self.positions: Dict[int, int] = {}
+        self.fields: Dict[str, str] = {}
+        self.codes: Dict[str, Dict[str, int]] = {}
+        self.values: Dict[str, List[str]] = {}
+        self.bitmaps: Dict[str, List[int]] = {}
+        self.all_bits = 0
+        self.built_changes = None
+
+    def is_stale(self, db) -> bool:
+        """数据库在本连接上发生过修改（导入、清空等）后索引需要重建"""
+        return self.built_changes != db.conn.total_changes
+
+    def refresh(self, db) -> bool:
+        """必要时重建索引，返回是否发生了重建"""
+        if not self.is_stale(db):
+            return False
+        self.build(db)
+        return True
+
+    def build(self, db):
+        """从 base_info 与 assessments 表构建位图索引"""
+        start_time = time.perf_counter()
+        cursor = db.conn.cursor()
+        columns = ', '.join(FACET_FIELDS)
+        cursor.execute(f"SELECT id, {columns} FROM base_info ORDER BY id")
+        rows = cursor.fetchall()
+
+        self.row_ids = [row[0] for row in rows]
+        self.positions = {row_id: pos for pos, row_id in enumerate(self.row_ids)}
+        self.fields = dict(FACET_FIELDS)
+        size = len(rows)
+
+        # 先按取值收集行位置，最后一次性转换为位集合
+        value_positions: Dict[str, Dict[str, List[int]]] = {field: {} for field in FACET_FIELDS}
+        for pos, row in enumerate(rows):
+            for idx, field in enumerate(FACET_FIELDS, start=1):
+                value = str(row[idx]).strip() if row[idx] is not None else ''
+                value_positions[field].setdefault(value or EMPTY_VALUE, []).append(pos)
+
+        assessment_years = db.get_assessment_years()
+        assessed_positions = {year: set() for year in assessment_years}
+        for year in assessment_years:
+            field = f"assessment_{year}"
+            self.fields[field] = f"{year}年年度考核结果"
+            value_positions[field] = {}
+        cursor.execute("SELECT person_id, year, result FROM assessments")
+        for person_id, year, result in cursor.fetchall():
+            pos = self.positions.get(person_id)
+            if pos is None or year not in assessed_positions:
+                continue
+            value = str(result).strip() if result is not None else ''
+            value_positions[f"assessment_{year}"].setdefault(value or EMPTY_VALUE, []).append(pos)
+            assessed_positions[year].add(pos)
+        for year, assessed in assessed_positions.items():
+            missing = [pos for pos in range(size) if pos not in assessed]
+            if missing:
+                value_positions[f"assessment_{year}"].setdefault(EMPTY_VALUE, []).extend(missing)
+
+        self.codes, self.values, self.bitmaps = {}, {}, {}
+        for field, positions_by_value in value_positions.items():
+            ordered_values = sorted(positions_by_value, key=lambda v: (v == EMPTY_VALUE, v))
+            self.values[field] = ordered_values
+            self.codes[field] = {value: code for code, value in enumerate(ordered_values)}
+            self.bitmaps[field] = [positions_to_bits(positions_by_value[v], size) for v in ordered_values]
+
+        self.all_bits = (1 << size) - 1
+        self.built_changes = db.conn.total_changes
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"分面位图索引构建完成：{size} 人，{len(self.fields)} 个字段，耗时 {elapsed_ms:.1f} ms")
+
+    def bits_for_ids(self, row_ids: Iterable[int]) -> int:
+        """将 base_info id 列表转换为位集合（索引中不存在的 id 被忽略）"""
+        positions = [self.positions[row_id] for row_id in row_ids if row_id in self.positions]
+        return positions_to_bits(positions, len(self.row_ids))
+
+    def ids_for_bits(self, bits: int) -> List[int]:
+        """将位集合转换回 base_info id 列表"""
+        reversed_bits = bin(bits)[:1:-1]
+        return [self.row_ids[pos] for pos, flag in enumerate(reversed_bits) if flag == '1']
+
+    def match(self, selections: Dict[str, Set[str]], base_bits: int = None) -> int:
+        """同一字段内多个取值为 OR，不同字段之间为 AND"""
+        bits = self.all_bits if base_bits is None else base_bits
+        for field, selected_values in selections.items():
+            if not selected_values or field not in self.codes:
+                continue
+            field_bits = 0
+            for value in selected_values:
+                code = self.codes[field].get(value)
+                if code is not None:
+                    field_bits |= self.bitmaps[field][code]
+            bits &= field_bits
+        return bits
+
+    def counts(self, selections: Dict[str, Set[str]], base_bits: int = None) -> Dict[str, List[Tuple[str, int]]]:
+        """计算每个字段各取值的人数；某字段的计数只受其他字段已选条件的影响"""
+        result = {}
+        for field in self.fields:
+            other_selections = {f: v for f, v in selections.items() if f != field}
+            scope_bits = self.match(other_selections, base_bits)
+            result[field] = [
+                (value, popcount(bitmap & scope_bits))
+                for value, bitmap in zip(self.values[field], self.bitmaps[field])
+            ]
+        return result
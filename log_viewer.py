@@ -1,33 +1,199 @@
 import os
 import time
+import codecs
 import chardet
 import logging
-from PyQt5.QtWidgets import (QDialog, QTextEdit, QPushButton, QVBoxLayout,
+import threading
+from array import array
+from itertools import accumulate
+from PyQt5.QtWidgets import (QDialog, QListView, QPushButton, QVBoxLayout,
                              QHBoxLayout, QLabel, QFileDialog, QApplication,
-                             QComboBox, QMainWindow)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QFont, QTextCursor
+                             QComboBox, QAbstractItemView)
+from PyQt5.QtCore import (Qt, QTimer, QAbstractListModel, QModelIndex, QFileSystemWatcher,
+                          pyqtSignal)
+from PyQt5.QtGui import QFont, QKeySequence
+
+logger = logging.getLogger('LogViewer')
+
+# 建立行索引时每次读取的字节数
+INDEX_CHUNK_BYTES = 4 * 1024 * 1024
+
+# 显示时一次读入的字节块大小（可见行通常落在同一块内）
+READ_BLOCK_BYTES = 256 * 1024
+
+# 单行最多显示的字节数，超长行截断显示
+MAX_LINE_BYTES = 16 * 1024
+
+# 文件变化通知的合并间隔（毫秒），日志持续写入时避免频繁刷新
+WATCH_DEBOUNCE_MS = 200
+
+# 识别日志文件是否被轮转替换时比较的开头字节数
+FILE_HEAD_BYTES = 256
+
+# 常见的编码映射
+ENCODING_MAP = {
+    'gb2312': 'gbk',
+    'gb18030': 'gbk',
+    'big5': 'cp950',
+}
+
+
+def scan_line_starts(file_path, start, end, chunk_bytes=INDEX_CHUNK_BYTES):
+    """以二进制方式扫描 [start, end) 字节区间，返回其中每个换行符之后的字节偏移（即下一行的起点）
+
+    按字节处理，与文件编码无关（UTF-8、GBK 的多字节字符中都不会出现 0x0A）。
+    每次只读取一块，读完即关闭文件，不妨碍日志轮转时重命名文件。
+    """
+    starts = array('Q')
+    position = start
+    while position < end:
+        with open(file_path, 'rb') as f:
+            f.seek(position)
+            chunk = f.read(min(chunk_bytes, end - position))
+        if not chunk:
+            break
+        parts = chunk.split(b'\n')
+        # 除最后一段外每段后面都是换行符，累加长度即得各行起点
+        starts.extend(offset + position for offset in accumulate(len(part) + 1 for part in parts[:-1]))
+        position += len(chunk)
+    return starts, position
+
+
+def file_identity(file_path, head_bytes=FILE_HEAD_BYTES):
+    """文件标识 (设备号, 文件索引号, 开头若干字节)，日志轮转换成新文件后标识随之改变"""
+    stat = os.stat(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(head_bytes)
+    return stat.st_dev, stat.st_ino, head
+
+
+def is_same_file(old, new):
+    """判断两次取得的标识是否为同一文件；FAT 等文件系统没有文件索引号（为 0）时只比较开头字节"""
+    old_dev, old_ino, old_head = old
+    new_dev, new_ino, new_head = new
+    if old_ino and new_ino and (old_dev, old_ino) != (new_dev, new_ino):
+        return False
+    # 原先不足 FILE_HEAD_BYTES 的开头在文件追加后应保持不变
+    return new_head[:len(old_head)] == old_head
+
+
+class LogLineModel(QAbstractListModel):
+    """按行虚拟化的日志模型：只保存各行的起始字节偏移，显示时才读取并解码可见行"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.file_path = None
+        self.encoding = 'utf-8'
+        self.starts = array('Q', [0])
+        self.end = 0  # 已建立索引的字节数
+        self.block_start = 0
+        self.block = b''
+
+    def reset(self, file_path, encoding):
+        self.beginResetModel()
+        self.file_path = file_path
+        self.encoding = encoding
+        self.starts = array('Q', [0])
+        self.end = 0
+        self.block_start = 0
+        self.block = b''
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        # 文件以换行结尾时最后一个起点之后没有内容
+        return len(self.starts) - (1 if self.starts[-1] >= self.end else 0)
+
+    def extend(self, starts, end):
+        """追加新建立索引的区间；之前未写完的最后一行可能有了新内容"""
+        old_rows = self.rowCount()
+        partial_row = old_rows - 1 if old_rows and self.starts[-1] < self.end else None
+        self.starts.extend(starts)
+        self.end = end
+        self.block = b''
+        new_rows = self.rowCount()
+        if partial_row is not None:
+            index = self.index(partial_row)
+            self.dataChanged.emit(index, index)
+        if new_rows > old_rows:
+            self.beginInsertRows(QModelIndex(), old_rows, new_rows - 1)
+            self.endInsertRows()
+
+    def line_bytes(self, row):
+        start = self.starts[row]
+        stop = self.starts[row + 1] if row + 1 < len(self.starts) else self.end
+        stop = min(stop, start + MAX_LINE_BYTES)
+        if not (self.block_start <= start and stop <= self.block_start + len(self.block)):
+            # 从该行起读入一整块，后续相邻的可见行直接从块中取
+            with open(self.file_path, 'rb') as f:
+                f.seek(start)
+                self.block = f.read(max(READ_BLOCK_BYTES, stop - start))
+            self.block_start = start
+        return self.block[start - self.block_start:stop - self.block_start]
+
+    def line_text(self, row):
+        try:
+            data = self.line_bytes(row)
+        except OSError as e:
+            return f"读取文件失败: {e}"
+        return data.decode(self.encoding, errors='replace').rstrip('\r\n')
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.line_text(index.row())
+
+
+class LogListView(QListView):
+    """日志行列表：行高一致，便于快速滚动；Ctrl+C 复制所选行"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Copy):
+            rows = sorted(index.row() for index in self.selectedIndexes())
+            if rows:
+                QApplication.clipboard().setText("\n".join(self.model().line_text(row) for row in rows))
+            return
+        super().keyPressEvent(event)
 
 
 class LogViewer(QDialog):
+    # 后台建立的行索引：(加载批次, 行起点偏移, 已索引到的字节位置, 是否扫描完毕)
+    index_ready = pyqtSignal(int, object, int, bool)
+
     def __init__(self, log_file_path=None, parent=None):
         super().__init__(parent)
         self.setWindowTitle("日志查看器")
         self.setMinimumSize(800, 600)
 
         self.log_file_path = log_file_path
-        self.last_position = 0
-        self.file_modified = 0
-        self.file_size = 0
         self.encoding = "utf-8"  # 默认编码
         self.encoding_cache = {}  # 文件路径到编码的映射缓存
-
+        # 每次重新加载递增，丢弃已过时的后台索引结果
+        self.generation = 0
+        self.indexing = False
+        self.update_pending = False
+        self.index_started_at = None
+        self.indexed_file_id = None  # 已建立索引的文件的标识，用于发现日志轮转
+
+        self.model = LogLineModel(self)
+        self.index_ready.connect(self.on_index_ready)
         self.setup_ui()
 
-        # 设置定时器实时更新日志
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_logs)
-        self.timer.start(1000)  # 每秒检查一次
+        # 文件变化时增量更新（替代定时轮询），多次通知合并为一次
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.watcher.directoryChanged.connect(self.on_file_changed)
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(WATCH_DEBOUNCE_MS)
+        self.update_timer.timeout.connect(self.update_logs)
 
         # 如果提供了日志文件路径，初始加载日志
         if self.log_file_path and os.path.exists(self.log_file_path):
@@ -72,16 +238,18 @@ class LogViewer(QDialog):
 
         layout.addLayout(encoding_layout)
 
-        # 日志显示区域
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
-        self.log_text.setFont(QFont("Consolas", 10))  # 等宽字体适合显示日志
-        self.log_text.setLineWrapMode(QTextEdit.NoWrap)  # 禁用自动换行
-        layout.addWidget(self.log_text, 1)
+        # 日志显示区域：按行虚拟化，只读取和解码可见的行
+        self.log_view = LogListView()
+        self.log_view.setModel(self.model)
+        self.log_view.setFont(QFont("Consolas", 10))  # 等宽字体适合显示日志
+        layout.addWidget(self.log_view, 1)
 
         # 按钮区域
         btn_layout = QHBoxLayout()
 
+        self.status_label = QLabel("")
+        btn_layout.addWidget(self.status_label, 1)
+
         # 顶部按钮
         self.top_btn = QPushButton("顶部")
         self.top_btn.clicked.connect(self.go_to_top)
@@ -137,41 +305,16 @@ class LogViewer(QDialog):
             return 'utf-8'
         return selected_encoding.lower()
 
-    def read_file_content(self, file_path, start=0, length=None):
-        """读取文件内容，使用检测到的编码"""
-        encoding = self.get_file_encoding()
-
-        # 常见的编码映射
-        encoding_map = {
-            'gb2312': 'gbk',
-            'gb18030': 'gbk',
-            'big5': 'cp950',
-        }
-
-        # 应用映射
-        final_encoding = encoding_map.get(encoding.lower(), encoding)
 
+    def decoding(self):
+        """显示时使用的解码器名称（无法识别的编码回退为 UTF-8）"""
+        encoding = self.get_file_encoding()
+        encoding = ENCODING_MAP.get(encoding.lower(), encoding)
         try:
-            # 尝试读取
-            with open(file_path, 'r', encoding=final_encoding, errors='replace') as f:
-                if start > 0:
-                    f.seek(start)
-                content = f.read(length) if length else f.read()
-            return content
-        except UnicodeDecodeError:
-            # 尝试其他可能的编码
-            for alt_encoding in ['utf-8', 'gbk', 'cp936', 'latin1']:
-                try:
-                    with open(file_path, 'r', encoding=alt_encoding, errors='replace') as f:
-                        if start > 0:
-                            f.seek(start)
-                        content = f.read(length) if length else f.read()
-                    return content
-                except:
-                    continue
-            return "无法解码文件内容"
-        except Exception as e:
-            return f"读取文件失败: {str(e)}"
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = 'utf-8'
+        return encoding
 
     def select_log_file(self):
         """选择日志文件"""
@@ -181,105 +324,137 @@ class LogViewer(QDialog):
         if file_path:
             self.log_file_path = file_path
             self.path_label.setText(file_path)
-            self.last_position = 0
             self.reload_logs()
 
     def reload_logs(self):
         """重新加载日志文件"""
         if self.log_file_path and os.path.exists(self.log_file_path):
-            self.last_position = 0
             self.load_initial_logs()
 
     def load_initial_logs(self):
-        """加载初始日志内容"""
+        """重建行索引：后台分块扫描，已扫描的部分即可显示；之后由文件监视增量追加"""
         if not self.log_file_path or not os.path.exists(self.log_file_path):
             return
 
         try:
-            # 获取文件状态和大小
-            stat = os.stat(self.log_file_path)
-            self.file_modified = stat.st_mtime
-            self.file_size = stat.st_size
+            file_size = os.path.getsize(self.log_file_path)
+            self.indexed_file_id = file_identity(self.log_file_path)
+        except OSError as e:
+            self.status_label.setText(f"加载日志失败: {e}")
+            return
 
-            # 读取文件内容
-            content = self.read_file_content(self.log_file_path)
-            self.log_text.setPlainText(content)
-            self.last_position = self.file_size
+        self.generation += 1
+        self.update_pending = False
+        self.model.reset(self.log_file_path, self.decoding())
+
+        # 同时监视所在目录：日志轮转时文件被重命名，需要重新加入监视
+        watched = self.watcher.files() + self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
+        self.watcher.addPath(self.log_file_path)
+        self.watcher.addPath(os.path.dirname(os.path.abspath(self.log_file_path)))
+
+        self.index_started_at = time.perf_counter()
+        self.start_indexing(0, file_size)
+
+    def start_indexing(self, start, end):
+        """在后台线程中扫描 [start, end) 区间，每扫描一块就交给界面显示"""
+        self.indexing = True
+        self.index_target = end
+        generation = self.generation
+        file_path = self.log_file_path
+
+        def worker():
+            position = start
+            done = False
+            while not done:
+                chunk_end = min(position + INDEX_CHUNK_BYTES, end)
+                try:
+                    starts, scanned = scan_line_starts(file_path, position, chunk_end)
+                except OSError as e:
+                    logger.warning(f"读取日志文件失败: {e}")
+                    starts, scanned = array('Q'), position
+                # 文件在扫描期间被截断时提前结束
+                done = scanned >= end or scanned < chunk_end
+                position = scanned
+                try:
+                    self.index_ready.emit(generation, starts, position, done)
+                except RuntimeError:
+                    # 窗口可能已关闭
+                    return
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_index_ready(self, generation, starts, end, done):
+        if generation != self.generation:
+            return
+        follow = self.at_bottom()
+        self.model.extend(starts, end)
+        if follow:
+            self.log_view.scrollToBottom()
 
-            # 滚动到底部
-            self.go_to_bottom()
-        except Exception as e:
-            self.log_text.append(f"加载日志失败: {str(e)}")
+        if not done:
+            self.status_label.setText(f"正在建立索引... {end * 100 // max(self.index_target, 1)}%")
+            return
+        self.indexing = False
+        self.status_label.setText(f"共 {self.model.rowCount()} 行，{end / 1024 / 1024:.1f} MB")
+        if self.index_started_at is not None:
+            logger.debug(f"日志索引耗时 {time.perf_counter() - self.index_started_at:.2f} 秒")
+            self.index_started_at = None
+        if self.update_pending:
+            self.update_pending = False
+            self.update_logs()
+
+    def on_file_changed(self, path):
+        """文件或所在目录变化：重新加入被轮转移走的文件，合并短时间内的多次通知"""
+        if self.log_file_path and os.path.exists(self.log_file_path) \
+                and self.log_file_path not in self.watcher.files():
+            self.watcher.addPath(self.log_file_path)
+        self.update_timer.start()
 
     def update_logs(self):
-        """更新日志内容（增量更新）"""
+        """更新日志内容（只为新增的字节建立索引）"""
         if not self.log_file_path or not os.path.exists(self.log_file_path):
             return
+        if self.indexing:
+            self.update_pending = True
+            return
 
         try:
-            # 检查文件是否被修改
-            stat = os.stat(self.log_file_path)
-            if stat.st_mtime <= self.file_modified and stat.st_size == self.file_size:
-                return  # 文件未修改
-
-            # 更新文件状态
-            self.file_modified = stat.st_mtime
-            new_size = stat.st_size
-
-            # 文件被截断的情况（例如日志轮转）
-            if new_size < self.last_position:
-                # 如果文件变小，重新加载整个文件
-                self.reload_logs()
-                return
-
-            # 读取新增内容
-            if new_size > self.last_position:
-                # 计算要读取的大小
-                read_size = new_size - self.last_position
-
-                # 读取新增内容
-                new_content = self.read_file_content(
-                    self.log_file_path,
-                    start=self.last_position,
-                    length=read_size
-                )
-
-                # 添加到日志显示区域
-                if new_content.strip():
-                    self.log_text.append(new_content)
-
-                # 如果当前在底部，自动滚动
-                scrollbar = self.log_text.verticalScrollBar()
-                auto_scroll = scrollbar.value() == scrollbar.maximum()
-
-                # 更新最后位置
-                self.last_position = new_size
-
-                # 如果设置了自动滚动，滚动到底部
-                if auto_scroll:
-                    self.go_to_bottom()
-
-            self.file_size = new_size
-        except Exception as e:
-            self.log_text.append(f"更新日志失败: {str(e)}")
+            new_size = os.path.getsize(self.log_file_path)
+            identity = file_identity(self.log_file_path)
+        except OSError:
+            return
+
+        # 文件被截断或换成了新文件（日志轮转后新文件可能已比原索引更大），重新加载整个文件
+        if new_size < self.model.end or self.indexed_file_id is None \
+                or not is_same_file(self.indexed_file_id, identity):
+            self.reload_logs()
+            return
+        self.indexed_file_id = identity
+        if new_size > self.model.end:
+            self.start_indexing(self.model.end, new_size)
+
+    def at_bottom(self):
+        scrollbar = self.log_view.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum()
 
     def go_to_top(self):
         """滚动到日志顶部"""
-        cursor = self.log_text.textCursor()
-        cursor.movePosition(QTextCursor.Start)
-        self.log_text.setTextCursor(cursor)
+        self.log_view.scrollToTop()
 
     def go_to_bottom(self):
         """滚动到日志底部"""
-        cursor = self.log_text.textCursor()
-        cursor.movePosition(QTextCursor.End)
-        self.log_text.setTextCursor(cursor)
-        self.log_text.ensureCursorVisible()
+        self.log_view.scrollToBottom()
 
 
     def closeEvent(self, event):
-        """关闭时停止定时器"""
-        self.timer.stop()
+        """关闭时停止监视文件，并丢弃仍在进行的索引结果"""
+        self.generation += 1
+        self.update_timer.stop()
+        watched = self.watcher.files() + self.watcher.directories()
+        if watched:
+            self.watcher.removePaths(watched)
         super().closeEvent(event)
 
 
@@ -289,6 +464,6 @@ if __name__ == "__main__":
 
     # 启动日志查看器
     app = QApplication(sys.argv)
-    viewer = LogViewer()
+    viewer = LogViewer(sys.argv[1] if len(sys.argv) > 1 else None)
     viewer.exec_()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
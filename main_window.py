@@ -3,7 +3,7 @@ import logging
 import sys
 from pathlib import Path
 import pandas as pd
-from ollama_manager import LocalOllamaManager
+from ollama_manager import get_manager
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (
@@ -51,8 +51,8 @@ class MainWindow(QMainWindow):
             logger.info(f"管理员账号 {username} 获得所有权限")
 
         self.init_ui()
-        self.ollama_manager = LocalOllamaManager()
-        self.ollama_manager.start()
+        # 内置 Ollama 服务在首次使用 AI 功能时才启动，不拖慢程序启动
+        self.ollama_manager = get_manager()
         logger.info(f"主窗口已创建，当前用户: {self.username}")
         logger.info(
             f"用户权限: base_info={self.permissions['base_info']}, rewards={self.permissions['rewards']}, family={self.permissions['family']}, resume={self.permissions['resume']}")
@@ -79,7 +79,7 @@ class MainWindow(QMainWindow):
             # 根据权限添加查询标签页
             if self.permissions.get('base_info'):
                 from query import QueryTab
-                self.query_tab = QueryTab(self.db, self.permissions)
+                self.query_tab = QueryTab(self.db, self.permissions, self.username)
                 self.tab_widget.addTab(self.query_tab, "综合查询")
             else:
                 # 如果没有任何权限，显示提示信息
@@ -284,8 +284,7 @@ class MainWindow(QMainWindow):
 
         if reply == QMessageBox.Yes:
             try:
-                with open(config.LOG_FILE, 'w') as f:
-                    f.write("")
+                config.clear_log()
                 QMessageBox.information(self, "成功", "日志文件已清空")
                 logger.info("用户清空了日志文件")
             except Exception as e:
@@ -347,12 +346,13 @@ class MainWindow(QMainWindow):
         """实际执行数据库清空操作（移除内部的确认对话框）"""
         try:
             # 清空所有业务表
-            tables = ['base_info', 'rewards', 'family', 'resume']
+            tables = ['base_info', 'assessments', 'rewards', 'family', 'resume', 'career_events', 'person_embeddings',
+                      'ai_response_cache', 'ai_conversations', 'ai_batch_runs', 'ai_batch_answers']
             cursor = self.db.conn.cursor()
             for tbl in tables:
                 cursor.execute(f"DELETE FROM {tbl}")
 
-            # 清空年度考核配置
+            # 清空旧版年度考核年份配置
             cursor.execute("DELETE FROM system_config WHERE config_key='assessment_years'")
 
             self.db.conn.commit()
@@ -0,0 +1,115 @@
+import logging
+from typing import Dict, List
+
+from ai_context import ContextTable, build_data_context, clean_cell
+
+logger = logging.getLogger('MapReduce')
+
+# 同时向本地 Ollama 发起的分块请求数（过多只会排队并占用内存）
+MAP_CONCURRENCY = 2
+
+# 自动模式下分块分析使用的上下文长度：较小的窗口生成更快、占用内存更少
+MAP_REDUCE_NUM_CTX = 8192
+
+# 每块提示词中除数据外的开销（系统提示词、问题）及每块回答预留的 token 数
+# （分块与中间合并的回答以 num_predict 限制在预留范围内）
+MAP_PROMPT_OVERHEAD_TOKENS = 600
+MAP_ANSWER_RESERVE_TOKENS = 1024
+
+# 合并提示词中每条部分结果的标题等额外字符数
+PARTIAL_HEADER_CHARS = 20
+
+MAP_SYSTEM_PROMPT = (
+    "### 角色\n你是一名专业的人力资源数据分析师。\n\n"
+    "### 核心任务\n下面是完整数据中的一个分块（第 {index}/{total} 块），请只根据本块数据，"
+    "提取回答用户问题所需的全部信息：符合条件的人员及其相关字段、需要统计的数量等。\n"
+    "### 铁律\n"
+    "1. 只输出本块中能找到直接证据的内容，禁止推测、捏造或补充本块以外的信息。\n"
+    "2. 涉及计数时给出本块的准确数字；列出人员时使用 Markdown 表格。\n"
+    "3. 本块中没有相关信息时只回答“无”。\n\n"
+    "### 数据内容\n{data}\n"
+)
+
+REDUCE_SYSTEM_PROMPT = (
+    "### 角色\n你是一名专业的人力资源数据分析师。\n\n"
+    "### 核心任务\n完整数据被分成多个分块分别分析，下面给出各分块针对同一问题的部分结果，"
+    "请合并为对完整数据的最终回答。\n"
+    "### 合并规则\n"
+    "1. 计数类结果需把各分块的数字相加；人员列表需合并去重。\n"
+    "2. 回答“无”的分块表示该分块没有相关信息，直接忽略。\n"
+    "3. 只使用部分结果中的信息，禁止推测、捏造。\n\n"
+    "### 输出规则\n"
+    "1. 在输出多条数据时，使用 Markdown 表格列出多条数据。\n"
+    "2. 回复简洁、专业，只需要在最后进行总结。\n"
+)
+
+
+def person_sizes(tables: List[ContextTable]) -> Dict[str, int]:
+    """按人员统计其各表数据编码后的大致字符数（保持首次出现的顺序）"""
+    sizes = {}
+    for table in tables:
+        keys = list(table['mapping'])
+        for row in table['rows']:
+            name = row.get('name')
+            if not name:
+                continue
+            row_chars = sum(len(clean_cell(row.get(key))) + 1 for key in keys)
+            sizes[name] = sizes.get(name, 0) + row_chars
+    return sizes
+
+
+def partition_people(tables: List[ContextTable], max_chars: int) -> List[List[str]]:
+    """按人员顺序贪心分块，同一人员的各表数据始终在同一块内"""
+    groups, current, current_chars = [], [], 0
+    for name, size in person_sizes(tables).items():
+        if current and current_chars + size > max_chars:
+            groups.append(current)
+            current, current_chars = [], 0
+        current.append(name)
+        current_chars += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_chunks(tables: List[ContextTable], max_chars: int) -> List[str]:
+    """生成各分块的数据上下文（每块不再截断行数）"""
+    groups = partition_people(tables, max_chars)
+    row_limit = max(len(table['rows']) for table in tables) if tables else 0
+    chunks = [build_data_context(tables, limit_rows_per_table=row_limit, names=set(group)) for group in groups]
+    logger.info(f"分块分析：{sum(len(group) for group in groups)} 人分为 {len(chunks)} 块")
+    return chunks
+
+
+def map_messages(chunk: str, index: int, total: int, question: str) -> List[dict]:
+    return [
+        {"role": "system", "content": MAP_SYSTEM_PROMPT.format(index=index, total=total, data=chunk)},
+        {"role": "user", "content": question},
+    ]
+
+
+def reduce_content(question: str, partials: List[str]) -> str:
+    parts = "\n\n".join(f"#### 分块 {idx} 的结果\n{text.strip()}" for idx, text in enumerate(partials, start=1))
+    return f"### 问题\n{question}\n\n### 各分块的部分结果\n{parts}"
+
+
+def partial_chars(partials: List[str]) -> int:
+    """部分结果写入合并提示词后的大致字符数"""
+    return sum(len(text.strip()) + PARTIAL_HEADER_CHARS for text in partials)
+
+
+def group_partials(partials: List[str], max_chars: int) -> List[List[str]]:
+    """按字符数贪心分组待合并的部分结果；每组至少两条，保证逐级合并时结果数不断减少"""
+    groups, current, current_chars = [], [], 0
+    for text in partials:
+        size = partial_chars([text])
+        if len(current) >= 2 and current_chars + size > max_chars:
+            groups.append(current)
+            current, current_chars = [], 0
+        current.append(text)
+        current_chars += size
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
@@ -0,0 +1,279 @@
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+logger = logging.getLogger('MockOllama')
+
+# 默认监听端口（与真实 Ollama 的 11434 错开，避免冲突）
+DEFAULT_PORT = 11435
+
+# 模拟的已安装模型
+DEFAULT_MODELS = ['qwen2.5:7b', 'nomic-embed-text:latest']
+
+# 模拟回答的文本片段，按顺序循环输出
+ANSWER_TOKENS = [
+    "根据", "提供", "的数据", "，", "共有", "若干", "名", "人员", "。", "\n\n",
+    "### ", "分析", "结论", "\n\n", "| ", "项目", " | ", "人数", " |", "\n",
+    "|---|---|", "\n", "| ", "示例", " | ", "1", " |", "\n\n",
+    "- ", "以上", "统计", "仅", "供", "参考", "。", "\n",
+]
+
+# 模拟的向量维度
+EMBEDDING_DIM = 64
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """由文本哈希生成确定性的单位向量，相同文本得到相同向量"""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode('utf-8')).digest()
+        values.extend((byte - 127.5) / 127.5 for byte in digest)
+        counter += 1
+    values = values[:dim]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    """实现 Ollama 接口的最小子集：/api/tags、/api/ps、/api/chat、/api/generate、/api/show、/api/embed(dings)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body.decode('utf-8')) if body else {}
+
+    def send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def model_exists(self, payload: dict) -> bool:
+        model = payload.get('model') or payload.get('name')
+        if model in self.settings['models']:
+            return True
+        self.send_json({"error": f"model '{model}' not found"}, status=404)
+        return False
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self.send_json({"models": [
+                {"name": name, "model": name, "size": 4 * 1024 ** 3,
+                 "details": {"parameter_size": "7B", "quantization_level": "Q4_K_M"}}
+                for name in self.settings['models']
+            ]})
+        elif self.path == '/api/ps':
+            self.send_json({"models": []})
+        elif self.path == '/api/version':
+            self.send_json({"version": "0.0.0-mock"})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self.read_json()
+        routes = {
+            '/api/chat': self.handle_chat,
+            '/api/generate': self.handle_generate,
+            '/api/show': self.handle_show,
+            '/api/embed': self.handle_embed,
+            '/api/embeddings': self.handle_embeddings,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            self.send_json({"error": "not found"}, status=404)
+            return
+        with self.server.stats_lock:
+            self.server.request_counts[self.path] = self.server.request_counts.get(self.path, 0) + 1
+        handler(payload)
+
+    def usage(self, payload: dict, eval_count: int, started: float) -> dict:
+        """按提示词字符数估算 prompt_eval_count，字段与真实 Ollama 一致（时长单位为纳秒）"""
+        prompt_chars = sum(len(msg.get('content') or '') for msg in payload.get('messages', []))
+        total_ns = int((time.perf_counter() - started) * 1e9)
+        eval_ns = int(eval_count / self.settings['tokens_per_second'] * 1e9)
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": int(prompt_chars * self.settings['tokens_per_char']),
+            "prompt_eval_duration": max(total_ns - eval_ns, 0),
+            "eval_count": eval_count,
+            "eval_duration": eval_ns,
+            "total_duration": total_ns,
+        }
+
+    def answer_tokens(self) -> List[str]:
+        count = self.settings['answer_tokens']
+        return [ANSWER_TOKENS[i % len(ANSWER_TOKENS)] for i in range(count)]
+
+    def handle_chat(self, payload: dict):
+        if not self.model_exists(payload):
+            return
+        started = time.perf_counter()
+        model = payload['model']
+        tokens = self.answer_tokens()
+        interval = 1.0 / self.settings['tokens_per_second']
+        time.sleep(self.settings['first_token_latency'])
+
+        if not payload.get('stream', True):
+            time.sleep(interval * len(tokens))
+            data = {"model": model, "message": {"role": "assistant", "content": ''.join(tokens)}}
+            data.update(self.usage(payload, len(tokens), started))
+            self.send_json(data)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in tokens:
+                self.write_chunk({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+                time.sleep(interval)
+            final = {"model": model, "message": {"role": "assistant", "content": ""}}
+            final.update(self.usage(payload, len(tokens), started))
+            self.write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中止了生成（关闭连接）
+            logger.debug("客户端提前关闭了流式连接")
+            self.close_connection = True
+
+    def write_chunk(self, data: dict):
+        line = json.dumps(data, ensure_ascii=False).encode('utf-8') + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode('ascii') + line + b"\r\n")
+        self.wfile.flush()
+
+    def handle_generate(self, payload: dict):
+        """不带提示词的 generate 请求用于预热模型"""
+        if not self.model_exists(payload):
+            return
+        time.sleep(self.settings['load_latency'])
+        self.send_json({"model": payload['model'], "response": "", "done": True, "done_reason": "load"})
+
+    def handle_show(self, payload: dict):
+        if not self.model_exists(payload):
+            return
+        self.send_json({
+            "details": {"family": "qwen2", "parameter_size": "7.6B", "quantization_level": "Q4_K_M"},
+            "model_info": {
+                "general.architecture": "qwen2",
+                "general.parameter_count": 7615616512,
+                "qwen2.context_length": 32768,
+                "qwen2.block_count": 28,
+                "qwen2.attention.head_count_kv": 4,
+                "qwen2.attention.head_count": 28,
+                "qwen2.embedding_length": 3584,
+            },
+        })
+
+    def handle_embed(self, payload: dict):
+        if not self.model_exists(payload):
+            return
+        texts = payload.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+        self.send_json({"model": payload['model'], "embeddings": [fake_embedding(text) for text in texts]})
+
+    def handle_embeddings(self, payload: dict):
+        if not self.model_exists(payload):
+            return
+        self.send_json({"embedding": fake_embedding(payload.get('prompt') or '')})
+
+
+class MockOllamaServer:
+    """在后台线程运行的模拟 Ollama 服务，可配置输出速度与延迟，用于无模型环境下的测试与基准"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                 tokens_per_second: float = 30.0, first_token_latency: float = 0.3,
+                 load_latency: float = 0.0, answer_tokens: int = 200,
+                 tokens_per_char: float = 0.55, models: List[str] = None):
+        self.httpd = ThreadingHTTPServer((host, port), MockOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = {
+            'tokens_per_second': max(tokens_per_second, 0.1),
+            'first_token_latency': first_token_latency,
+            'load_latency': load_latency,
+            'answer_tokens': answer_tokens,
+            'tokens_per_char': tokens_per_char,
+            'models': list(models or DEFAULT_MODELS),
+        }
+        self.httpd.request_counts = {}
+        self.httpd.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_counts(self) -> dict:
+        return dict(self.httpd.request_counts)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"模拟 Ollama 服务已启动: {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join(timeout=5)
+        logger.info("模拟 Ollama 服务已停止")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="模拟 Ollama 服务（用于无模型环境下调试与基准测试 AI 功能）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--tokens-per-second', type=float, default=30.0, help='生成速度（token/秒）')
+    parser.add_argument('--first-token-latency', type=float, default=0.3, help='首个 token 前的延迟（秒）')
+    parser.add_argument('--load-latency', type=float, default=0.0, help='模型预热请求的延迟（秒）')
+    parser.add_argument('--answer-tokens', type=int, default=200, help='每个回答输出的 token 数')
+    parser.add_argument('--model', action='append', dest='models', help='模拟的模型名称，可重复指定')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = MockOllamaServer(args.host, args.port, args.tokens_per_second, args.first_token_latency,
+                              args.load_latency, args.answer_tokens, models=args.models)
+    print(f"模拟 Ollama 服务: {server.base_url}（设置环境变量 OLLAMA_BASE_URL={server.base_url} 后启动程序即可使用）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+import time
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('OllamaClient')
+
+# 本地 Ollama 服务地址（可通过环境变量指向模拟服务，见 mock_ollama）
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+
+# 模型在最后一次请求后保持加载的时长（Ollama keep_alive 参数格式）
+DEFAULT_KEEP_ALIVE = "30m"
+
+# 模型列表缓存的有效期（秒），有效期内打开对话框不再请求 /api/tags
+MODEL_LIST_TTL_SECONDS = 300
+
+
+class OllamaClient:
+    """共享的 Ollama 客户端：复用连接池，并负责模型预热与保活"""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, keep_alive: str = DEFAULT_KEEP_ALIVE):
+        self.base_url = base_url.rstrip('/')
+        self.keep_alive = keep_alive
+        # 推理线程数，由服务管理器按本机物理核心数设置；None 表示使用 Ollama 默认值
+        self.num_thread = None
+        # 最近一次获取的模型列表 (获取时间, 模型列表)
+        self.models_cache = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        self.session.mount('http://', adapter)
+
+        # 正在预热的 (模型, 上下文长度)，避免重复发起加载请求
+        self._preloading = set()
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def list_models(self, timeout: float = 3) -> List[str]:
+        """获取本地已安装的模型名称（按名称排序）"""
+        response = self.session.get(self.url("/api/tags"), timeout=timeout)
+        response.raise_for_status()
+        models = [model['name'] for model in response.json().get('models', [])]
+        models.sort()
+        self.models_cache = (time.monotonic(), models)
+        return list(models)
+
+    def cached_models(self, max_age: float = None) -> Optional[List[str]]:
+        """返回最近一次获取的模型列表；没有缓存或超过 max_age 秒时返回 None"""
+        cache = self.models_cache
+        if cache is None:
+            return None
+        fetched_at, models = cache
+        if max_age is not None and time.monotonic() - fetched_at > max_age:
+            return None
+        return list(models)
+
+    def show(self, model: str, timeout: float = 5) -> dict:
+        """获取模型详情（参数量、量化方式、层数等，见 /api/show）"""
+        response = self.session.post(self.url("/api/show"), json={"model": model}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def running_models(self, timeout: float = 3) -> List[dict]:
+        """获取当前已加载到内存的模型（/api/ps）"""
+        response = self.session.get(self.url("/api/ps"), timeout=timeout)
+        response.raise_for_status()
+        return response.json().get('models', [])
+
+    def runtime_options(self, options: dict = None) -> dict:
+        """补充运行参数；预热与正式请求的参数必须一致，否则 Ollama 会重新加载模型"""
+        merged = dict(options or {})
+        if self.num_thread:
+            merged.setdefault("num_thread", self.num_thread)
+        return merged
+
+    def chat(self, model: str, messages: list, options: dict = None,
+             stream: bool = True, timeout: float = 300) -> requests.Response:
+        """调用 /api/chat，返回原始响应（流式时由调用方逐行读取）"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": self.runtime_options(options),
+        }
+        return self.session.post(self.url("/api/chat"), json=payload, stream=stream, timeout=timeout)
+
+    def embed(self, model: str, texts: List[str], timeout: float = 120) -> List[List[float]]:
+        """计算文本向量；旧版 Ollama 没有批量接口 /api/embed 时逐条调用 /api/embeddings"""
+        response = self.session.post(
+            self.url("/api/embed"),
+            json={"model": model, "input": texts, "keep_alive": self.keep_alive},
+            timeout=timeout,
+        )
+        if response.status_code != 404:
+            response.raise_for_status()
+            return response.json()['embeddings']
+
+        embeddings = []
+        for text in texts:
+            response = self.session.post(
+                self.url("/api/embeddings"),
+                json={"model": model, "prompt": text, "keep_alive": self.keep_alive},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            embeddings.append(response.json()['embedding'])
+        return embeddings
+
+    def preload(self, model: str, num_ctx: int = None, timeout: float = 300) -> bool:
+        """预先加载模型到内存（不带提示词的 generate 请求只加载模型，不生成内容）
+
+        num_ctx 必须与正式提问时一致，否则 Ollama 会按新的上下文长度重新加载模型。
+        """
+        payload = {"model": model, "keep_alive": self.keep_alive,
+                   "options": self.runtime_options({"num_ctx": num_ctx} if num_ctx else None)}
+        try:
+            response = self.session.post(self.url("/api/generate"), json=payload, timeout=timeout)
+            response.raise_for_status()
+            logger.info(f"模型预热完成: {model} (num_ctx={num_ctx})")
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"模型预热失败: {model} (num_ctx={num_ctx}): {e}")
+            return False
+
+    def preload_async(self, model: str, num_ctx: int = None,
+                      callback: Optional[Callable[[str, bool], None]] = None) -> bool:
+        """在后台线程预热模型，同一模型与上下文长度同时只发起一次；返回是否发起了新的预热"""
+        key = (model, num_ctx)
+        with self._lock:
+            if key in self._preloading:
+                return False
+            self._preloading.add(key)
+
+        def worker():
+            ok = False
+            try:
+                ok = self.preload(model, num_ctx)
+            finally:
+                with self._lock:
+                    self._preloading.discard(key)
+                if callback:
+                    try:
+                        callback(model, ok)
+                    except RuntimeError:
+                        # 回调所属的窗口可能已关闭
+                        pass
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return True
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """获取全局共享的 Ollama 客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
@@ -1,15 +1,144 @@
 import os
+import re
 import sys
+import time
+import ctypes
 import subprocess
 import logging
 import platform
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from ollama_client import get_client
 
 logger = logging.getLogger('OllamaManager')
 
+# 等待服务就绪的最长时间（秒），首次启动需要加载运行库，较慢的机器上可能需要数十秒
+STARTUP_TIMEOUT_SECONDS = 60
+
+# 就绪探测的退避间隔（秒）：从初始值开始按倍数增长，不超过上限
+PROBE_INITIAL_DELAY = 0.1
+PROBE_BACKOFF_FACTOR = 1.5
+PROBE_MAX_DELAY = 2.0
+
+# 为系统和其他程序保留的内存，模型占用超出后会频繁换页，生成速度大幅下降
+MEMORY_HEADROOM_BYTES = 1536 * 1024 ** 2
+
+# 模型运行时除权重与 KV 缓存外的额外开销（计算缓冲区等）
+RUNTIME_OVERHEAD_BYTES = 512 * 1024 ** 2
+
+# 常见量化格式每个参数的平均位数
+QUANT_BITS = {
+    'Q2_K': 3.35, 'Q3_K_S': 3.5, 'Q3_K_M': 3.9, 'Q3_K_L': 4.3,
+    'Q4_0': 4.5, 'Q4_1': 5.0, 'Q4_K_S': 4.6, 'Q4_K_M': 4.85,
+    'Q5_0': 5.5, 'Q5_1': 6.0, 'Q5_K_S': 5.5, 'Q5_K_M': 5.7,
+    'Q6_K': 6.6, 'Q8_0': 8.5, 'F16': 16, 'BF16': 16, 'F32': 32,
+}
+DEFAULT_QUANT_BITS = 4.85
+
+# /api/show 缺少注意力结构信息时使用的每 token KV 缓存估算值（字节）
+DEFAULT_KV_BYTES_PER_TOKEN = 128 * 1024
+
+# 内存评估结果的有效期（秒），可用内存随其他程序变化，过期后重新评估
+RECOMMENDATION_TTL_SECONDS = 300
+
+
+def memory_status() -> Tuple[Optional[int], Optional[int]]:
+    """返回 (物理内存总量, 当前可用内存)，单位字节；无法获取时为 None"""
+    try:
+        if platform.system() == "Windows":
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong),
+                    ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong),
+                    ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong),
+                    ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong),
+                    ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys, status.ullAvailPhys
+            return None, None
+
+        meminfo = {}
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                meminfo[key] = int(value.split()[0]) * 1024
+        return meminfo.get('MemTotal'), meminfo.get('MemAvailable', meminfo.get('MemFree'))
+    except Exception as e:
+        logger.warning(f"获取内存信息失败: {e}")
+        return None, None
+
+
+def physical_cpu_cores() -> int:
+    """物理核心数（超线程的逻辑核心对推理没有帮助，反而增加争用）"""
+    logical = os.cpu_count() or 1
+    try:
+        if platform.system() == "Windows":
+            class SYSTEM_LOGICAL_PROCESSOR_INFORMATION(ctypes.Structure):
+                _fields_ = [
+                    ('ProcessorMask', ctypes.c_size_t),
+                    ('Relationship', ctypes.c_int),
+                    ('Reserved', ctypes.c_ulonglong * 2),
+                ]
+
+            length = ctypes.c_ulong(0)
+            ctypes.windll.kernel32.GetLogicalProcessorInformation(None, ctypes.byref(length))
+            count = length.value // ctypes.sizeof(SYSTEM_LOGICAL_PROCESSOR_INFORMATION)
+            buffer = (SYSTEM_LOGICAL_PROCESSOR_INFORMATION * count)()
+            if ctypes.windll.kernel32.GetLogicalProcessorInformation(buffer, ctypes.byref(length)):
+                # RelationProcessorCore = 0
+                cores = sum(1 for info in buffer if info.Relationship == 0)
+                return cores or logical
+            return logical
+
+        cores = set()
+        physical_id = None
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                key = key.strip()
+                if key == 'physical id':
+                    physical_id = value.strip()
+                elif key == 'core id':
+                    cores.add((physical_id, value.strip()))
+        return len(cores) or logical
+    except Exception as e:
+        logger.warning(f"获取 CPU 核心数失败: {e}")
+        return logical
+
+
+def parse_parameter_size(text: str) -> Optional[int]:
+    """解析 "7.6B"、"500M" 形式的参数量"""
+    match = re.match(r'([\d.]+)\s*([BM])', text or '', re.IGNORECASE)
+    if not match:
+        return None
+    scale = 1e9 if match.group(2).upper() == 'B' else 1e6
+    return int(float(match.group(1)) * scale)
+
 
 class LocalOllamaManager:
+    """内置 Ollama 服务的管理：首次使用 AI 功能时才启动，并在后台探测服务就绪"""
+
     def __init__(self):
         self.process = None
+        # 本次启动（或检测已有服务）的结果：True 表示服务可用
+        self.ready_future = None
+        self._lock = threading.Lock()
+        # 各模型的内存需求（来自 /api/show），模型文件不变则结果不变
+        self.model_profiles: Dict[str, dict] = {}
+        # 各模型最近一次的内存评估 {(模型, 上下文档位): (评估时间, 结果)}
+        self.recommendations: Dict[tuple, tuple] = {}
+        self.cpu_cores = physical_cpu_cores()
+        get_client().num_thread = self.cpu_cores
 
         # 判断是否为 PyInstaller 打包后的环境
         if getattr(sys, 'frozen', False):
@@ -28,8 +157,171 @@ class LocalOllamaManager:
         # 定义模型存放路径 (同样使用外部路径)
         self.models_dir = os.path.join(external_base_dir, "models")
 
+    def probe(self, timeout: float = 1) -> bool:
+        """服务是否已可响应 /api/tags"""
+        try:
+            get_client().list_models(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def is_ready(self) -> bool:
+        future = self.ready_future
+        return future is not None and future.done() and future.result()
+
+    def ensure_started(self) -> Future:
+        """按需启动服务，返回就绪结果（Future[bool]）；已在启动或已就绪时返回同一个结果
+
+        上次启动失败时重新尝试。探测与等待在后台线程进行，不阻塞界面。
+        """
+        with self._lock:
+            future = self.ready_future
+            if future is not None and (not future.done() or future.result()):
+                return future
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self.ready_future = future
+
+        thread = threading.Thread(target=self._start_and_wait, args=(future,), daemon=True)
+        thread.start()
+        return future
+
+    def wait_ready(self, timeout: float = STARTUP_TIMEOUT_SECONDS) -> bool:
+        """阻塞等待服务就绪（供后台线程使用）"""
+        try:
+            return self.ensure_started().result(timeout=timeout)
+        except Exception:
+            return False
+
+    def _start_and_wait(self, future: Future):
+        start_time = time.perf_counter()
+        ok = False
+        try:
+            # 系统中已有 Ollama 服务在运行（例如用户自行安装的版本）时直接使用
+            if self.probe():
+                logger.info("检测到已在运行的 Ollama 服务，无需启动内置服务")
+                ok = True
+            elif self.start():
+                ok = self._wait_until_ready(start_time)
+        except Exception as e:
+            logger.error(f"启动 Ollama 服务时发生异常: {e}")
+        finally:
+            future.set_result(ok)
+
+    def _wait_until_ready(self, start_time: float) -> bool:
+        """以指数退避轮询 /api/tags，直到服务就绪、进程退出或超时"""
+        delay = PROBE_INITIAL_DELAY
+        attempts = 0
+        while time.perf_counter() - start_time < STARTUP_TIMEOUT_SECONDS:
+            attempts += 1
+            if self.probe():
+                elapsed = time.perf_counter() - start_time
+                logger.info(f"内置 Ollama 服务已就绪，启动耗时 {elapsed:.2f} 秒（探测 {attempts} 次）")
+                return True
+            process = self.process
+            if process is None or process.poll() is not None:
+                logger.error("内置 Ollama 服务进程已退出，启动失败")
+                return False
+            time.sleep(delay)
+            delay = min(delay * PROBE_BACKOFF_FACTOR, PROBE_MAX_DELAY)
+
+        logger.error(f"等待内置 Ollama 服务就绪超时（{STARTUP_TIMEOUT_SECONDS} 秒，探测 {attempts} 次）")
+        return False
+
+    def model_profile(self, model: str) -> Optional[dict]:
+        """估算模型的权重内存与每 token 的 KV 缓存大小；无法获取模型信息时返回 None"""
+        if model in self.model_profiles:
+            return self.model_profiles[model]
+        try:
+            data = get_client().show(model)
+        except Exception as e:
+            logger.warning(f"获取模型 {model} 的详情失败: {e}")
+            return None
+
+        details = data.get('details') or {}
+        info = data.get('model_info') or {}
+        arch = info.get('general.architecture', '')
+        parameter_count = info.get('general.parameter_count') or parse_parameter_size(details.get('parameter_size'))
+        if not parameter_count:
+            return None
+        bits = QUANT_BITS.get((details.get('quantization_level') or '').upper(), DEFAULT_QUANT_BITS)
+
+        # KV 缓存（f16）：层数 × KV 头数 × (键维度 + 值维度) × 2 字节
+        block_count = info.get(f'{arch}.block_count')
+        head_count = info.get(f'{arch}.attention.head_count')
+        head_count_kv = info.get(f'{arch}.attention.head_count_kv') or head_count
+        embedding_length = info.get(f'{arch}.embedding_length')
+        kv_bytes_per_token = DEFAULT_KV_BYTES_PER_TOKEN
+        if block_count and head_count and head_count_kv and embedding_length:
+            key_length = info.get(f'{arch}.attention.key_length') or embedding_length // head_count
+            value_length = info.get(f'{arch}.attention.value_length') or embedding_length // head_count
+            kv_bytes_per_token = block_count * head_count_kv * (key_length + value_length) * 2
+
+        profile = {
+            'weights_bytes': int(parameter_count * bits / 8),
+            'kv_bytes_per_token': kv_bytes_per_token,
+            'context_length': info.get(f'{arch}.context_length'),
+        }
+        self.model_profiles[model] = profile
+        return profile
+
+    def memory_budget(self) -> Optional[int]:
+        """可供模型使用的内存：当前可用内存 + 已加载模型占用（切换时会被释放）- 保留余量"""
+        _, available = memory_status()
+        if available is None:
+            return None
+        loaded = 0
+        try:
+            loaded = sum(model.get('size', 0) - model.get('size_vram', 0)
+                         for model in get_client().running_models())
+        except Exception:
+            pass
+        return available + loaded - MEMORY_HEADROOM_BYTES
+
+    def cached_recommendation(self, model: str, ctx_buckets: List[int]) -> Optional[dict]:
+        """最近一次的内存评估结果（不发起请求，供界面线程使用）"""
+        cached = self.recommendations.get((model, tuple(ctx_buckets)))
+        return cached[1] if cached else None
+
+    def recommend(self, model: str, ctx_buckets: List[int], max_age: float = RECOMMENDATION_TTL_SECONDS) -> dict:
+        """按本机内存推荐模型可用的最大上下文长度（max_age 秒内的评估结果直接复用）
+
+        返回 {'max_ctx': 最大可用档位, 'fits': 最小档位能否放下, 'required': 最小档位所需内存, 'budget': 可用内存}；
+        无法获取内存或模型信息时不做限制。
+        """
+        key = (model, tuple(ctx_buckets))
+        cached = self.recommendations.get(key)
+        if cached and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+        recommendation = self._evaluate(model, ctx_buckets)
+        self.recommendations[key] = (time.monotonic(), recommendation)
+        return recommendation
+
+    def _evaluate(self, model: str, ctx_buckets: List[int]) -> dict:
+        recommendation = {'max_ctx': ctx_buckets[-1], 'fits': True, 'required': None, 'budget': None}
+        profile = self.model_profile(model)
+        budget = self.memory_budget()
+        if profile is None or budget is None:
+            return recommendation
+
+        def required(num_ctx):
+            return profile['weights_bytes'] + RUNTIME_OVERHEAD_BYTES + profile['kv_bytes_per_token'] * num_ctx
+
+        candidates = [ctx for ctx in ctx_buckets
+                      if not profile['context_length'] or ctx <= profile['context_length']] or ctx_buckets[:1]
+        fitting = [ctx for ctx in candidates if required(ctx) <= budget]
+        recommendation.update(
+            max_ctx=fitting[-1] if fitting else candidates[0],
+            fits=bool(fitting),
+            required=required(candidates[0]),
+            budget=budget,
+        )
+        logger.info(f"模型 {model} 内存评估：可用 {budget / 1024 ** 3:.1f} GB，"
+                    f"最小上下文需 {recommendation['required'] / 1024 ** 3:.1f} GB，推荐最大上下文 {recommendation['max_ctx']}")
+        return recommendation
+
     def start(self):
-        """静默启动内部打包的 Ollama 服务"""
+        """静默启动内部打包的 Ollama 服务（只负责启动进程，就绪与否见 ensure_started）"""
         if not os.path.exists(self.exe_path):
             logger.error(f"未找到内置的 Ollama 程序: {self.exe_path}")
             return False
@@ -57,32 +349,35 @@ class LocalOllamaManager:
                 stderr=subprocess.DEVNULL,
                 creationflags=creationflags
             )
-            logger.info("内置 Ollama 服务启动成功！")
+            logger.info("内置 Ollama 服务进程已启动，等待服务就绪...")
             return True
         except Exception as e:
             logger.error(f"启动 Ollama 失败: {e}")
             return False
 
     def stop(self):
-        """关闭 Ollama 服务及其所有子进程"""
-        if self.process:
-            logger.info("正在关闭内置 Ollama 服务及其子进程...")
-            try:
-                if platform.system() == "Windows":
-                    # 【修改点 1】：把 call 改为 Popen
-                    subprocess.Popen(
-                        ['taskkill', '/F', '/T', '/PID', str(self.process.pid)],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                        creationflags=subprocess.CREATE_NO_WINDOW # 避免闪黑框
-                    )
-                else:
-                    # Mac/Linux 逻辑
-                    self.process.terminate()
-            except Exception as e:
-                logger.error(f"关闭 Ollama 进程树时发生异常: {e}")
-            finally:
-                self.process = None
+        """关闭 Ollama 服务及其所有子进程（未启动过内置服务时不做任何处理）"""
+        if not self.process:
+            return
+
+        logger.info("正在关闭内置 Ollama 服务及其子进程...")
+        try:
+            if platform.system() == "Windows":
+                # 【修改点 1】：把 call 改为 Popen
+                subprocess.Popen(
+                    ['taskkill', '/F', '/T', '/PID', str(self.process.pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    creationflags=subprocess.CREATE_NO_WINDOW # 避免闪黑框
+                )
+            else:
+                # Mac/Linux 逻辑
+                self.process.terminate()
+        except Exception as e:
+            logger.error(f"关闭 Ollama 进程树时发生异常: {e}")
+        finally:
+            self.process = None
+            self.ready_future = None
 
         # 终极保险：万一进程树没杀干净，按名字再补一刀
         if platform.system() == "Windows":
@@ -96,3 +391,16 @@ class LocalOllamaManager:
                 )
             except:
                 pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> LocalOllamaManager:
+    """获取全局共享的 Ollama 服务管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = LocalOllamaManager()
+        return _manager
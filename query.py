@@ -1,7 +1,9 @@
 from datetime import datetime
 import re
+import time
 import logging
 import json
+import threading
 from ai_chat import AIChatDialog
 
 from PyQt5.QtWidgets import (
@@ -10,11 +12,19 @@ from PyQt5.QtWidgets import (
     QTableWidgetItem, QComboBox, QGroupBox,
     QMessageBox, QHeaderView, QDialog,
     QVBoxLayout, QCheckBox, QDialogButtonBox,
-    QScrollArea, QAbstractItemView, QGridLayout, QFrame
+    QScrollArea, QAbstractItemView, QGridLayout, QFrame,
+    QTreeWidget, QTreeWidgetItem, QSplitter
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont, QIntValidator
 from database import Database
+from query_dsl import personnel_filter
+from schema import TABLE_TITLES, get_table_fields
+from facet_index import FacetIndex
+from ai_context import ContextFragmentCache, build_data_context
+from ai_cache import hash_text
+from ai_conversations import ConversationStore, query_hash
+from sql_analyst import SQLAnalyst
 
 logger = logging.getLogger('QueryTab')
 
@@ -293,20 +303,121 @@ class MultiTableColumnSelectionDialog(QDialog):
         return result
 
 
+class FacetPanel(QWidget):
+    """分面筛选侧栏：按分类字段显示当前结果中各取值的人数，勾选即在结果内筛选"""
+    selection_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.summary_label = QLabel("分面筛选：请先执行查询")
+        layout.addWidget(self.summary_label)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.itemChanged.connect(self.on_item_changed)
+        layout.addWidget(self.tree)
+
+        self.clear_btn = QPushButton("清除筛选")
+        self.clear_btn.clicked.connect(self.on_clear_clicked)
+        layout.addWidget(self.clear_btn)
+
+        self.setLayout(layout)
+
+    def on_item_changed(self, item, column):
+        """只有取值项（子节点）的勾选变化才触发筛选"""
+        if item.parent() is not None:
+            self.selection_changed.emit()
+
+    def on_clear_clicked(self):
+        self.clear_selections()
+        self.selection_changed.emit()
+
+    def selections(self) -> dict:
+        """返回已勾选的取值 -> {字段名: {取值, ...}}"""
+        result = {}
+        for i in range(self.tree.topLevelItemCount()):
+            field_item = self.tree.topLevelItem(i)
+            values = set()
+            for j in range(field_item.childCount()):
+                value_item = field_item.child(j)
+                if value_item.checkState(0) == Qt.Checked:
+                    values.add(value_item.data(0, Qt.UserRole))
+            if values:
+                result[field_item.data(0, Qt.UserRole)] = values
+        return result
+
+    def clear_selections(self):
+        """取消全部勾选（不触发筛选信号）"""
+        self.tree.blockSignals(True)
+        for i in range(self.tree.topLevelItemCount()):
+            field_item = self.tree.topLevelItem(i)
+            for j in range(field_item.childCount()):
+                field_item.child(j).setCheckState(0, Qt.Unchecked)
+        self.tree.blockSignals(False)
+
+    def set_counts(self, fields: dict, counts: dict, selections: dict, matched_count: int, total_count: int):
+        """刷新各取值的人数，保留展开状态、勾选状态与滚动位置"""
+        expanded_fields = set()
+        for i in range(self.tree.topLevelItemCount()):
+            field_item = self.tree.topLevelItem(i)
+            if field_item.isExpanded():
+                expanded_fields.add(field_item.data(0, Qt.UserRole))
+        scroll_value = self.tree.verticalScrollBar().value()
+
+        self.tree.blockSignals(True)
+        self.tree.clear()
+        for field, label in fields.items():
+            field_item = QTreeWidgetItem([label])
+            field_item.setData(0, Qt.UserRole, field)
+            selected_values = selections.get(field, set())
+            for value, count in counts.get(field, []):
+                # 当前范围内没有人的取值不显示（已勾选的除外）
+                if count == 0 and value not in selected_values:
+                    continue
+                value_item = QTreeWidgetItem([f"{value} ({count})"])
+                value_item.setData(0, Qt.UserRole, value)
+                value_item.setFlags(value_item.flags() | Qt.ItemIsUserCheckable)
+                value_item.setCheckState(0, Qt.Checked if value in selected_values else Qt.Unchecked)
+                field_item.addChild(value_item)
+            if field_item.childCount():
+                self.tree.addTopLevelItem(field_item)
+                field_item.setExpanded(field in expanded_fields or field in selections)
+        self.tree.blockSignals(False)
+        self.tree.verticalScrollBar().setValue(scroll_value)
+
+        self.summary_label.setText(f"分面筛选：{matched_count} / {total_count} 人")
+
+
 class QueryTab(QWidget):
-    def __init__(self, db: Database, permissions: dict):
+    ai_context_ready = pyqtSignal(object)  # 后台准备的 AI 数据上下文（或可恢复的对话）
+
+    def __init__(self, db: Database, permissions: dict, username: str = None):
         """查询标签页初始化
 
         参数:
         - db: Database实例
         - permissions: 用户权限字典
+        - username: 当前用户（AI 对话按用户保存）
         """
         super().__init__()
         self.db = db
         self.permissions = permissions
+        self.username = username
         self.ai_dialog = None  # 【新增】初始化 AI 对话框引用
+        # 按结果集缓存的各表各列上下文片段，调整勾选列后只需重新拼装
+        self.context_cache = ContextFragmentCache()
         self.current_results = []  # 保存当前基础信息查询结果
         self.current_results_dict = {}  # 保存完整查询结果
+        self.current_filter = None  # 保存产生当前结果的查询条件树
+        self.query_results_dict = {}  # 保存分面筛选前的完整查询结果
+        self.facet_index = FacetIndex()  # 分类字段位图索引（数据变化后自动重建）
+        self.facet_base_bits = 0  # 当前查询结果对应的位集合
         # 【新增】记录当前显示的表格名称，默认为基本信息
         self.current_table_name = 'base_info'
         # 职位名称映射表（简洁名称 → 完整名称列表）
@@ -378,8 +489,9 @@ class QueryTab(QWidget):
         self.birth_start_year.setValidator(QIntValidator(1900, 2100, self))
         self.birth_start_year.setFixedWidth(200)
         self.birth_start_month = QComboBox()
-        self.birth_start_month.addItem("不限")
-        self.birth_start_month.addItems([f"{month:02d}" for month in range(1, 13)])
+        self.birth_start_month.addItem("不限", "")
+        for month in range(1, 13):
+            self.birth_start_month.addItem(f"{month:02d}", f"{month:02d}")
         self.birth_start_month.setFixedWidth(200)
         birth_start_layout.addWidget(self.birth_start_year)
         birth_start_layout.addWidget(QLabel("年"))
@@ -395,8 +507,9 @@ class QueryTab(QWidget):
         self.birth_end_year.setValidator(QIntValidator(1900, 2100, self))
         self.birth_end_year.setFixedWidth(200)
         self.birth_end_month = QComboBox()
-        self.birth_end_month.addItem("不限")
-        self.birth_end_month.addItems([f"{month:02d}" for month in range(1, 13)])
+        self.birth_end_month.addItem("不限", "")
+        for month in range(1, 13):
+            self.birth_end_month.addItem(f"{month:02d}", f"{month:02d}")
         self.birth_end_month.setFixedWidth(200)
         birth_end_layout.addWidget(self.birth_end_year)
         birth_end_layout.addWidget(QLabel("年"))
@@ -457,7 +570,113 @@ class QueryTab(QWidget):
         self.parttime_combo.setMinimumWidth(120)
         grid_layout.addWidget(self.parttime_combo, row, 4)  # 移动到第4列
 
-        # ======== 第四行：按钮 ========
+        # ======== 第四行：年度考核 ========
+        row += 1
+
+        # 年度考核结果 - 左对齐
+        grid_layout.addWidget(QLabel("年度考核结果:"), row, 0, Qt.AlignRight)
+        self.assessment_combo = QComboBox()
+        self.assessment_combo.addItem("不限", "")
+        for result in ["优秀", "称职", "合格", "基本称职", "不称职", "不合格"]:
+            self.assessment_combo.addItem(result, result)
+        self.assessment_combo.setMinimumWidth(120)
+        grid_layout.addWidget(self.assessment_combo, row, 1)
+
+        # 分隔列
+        grid_layout.addWidget(QLabel(""), row, 2)  # 空标签作为分隔
+
+        # 考核次数 - 右对齐：近 N 年内至少 M 次
+        grid_layout.addWidget(QLabel("考核次数:"), row, 3, Qt.AlignRight)
+        assessment_count_layout = QHBoxLayout()
+        assessment_count_layout.addWidget(QLabel("近"))
+        self.assessment_years_combo = QComboBox()
+        self.assessment_years_combo.addItems([str(n) for n in range(1, 11)])
+        self.assessment_years_combo.setCurrentText("5")
+        assessment_count_layout.addWidget(self.assessment_years_combo)
+        assessment_count_layout.addWidget(QLabel("年内至少"))
+        self.assessment_count_combo = QComboBox()
+        self.assessment_count_combo.addItems([str(n) for n in range(1, 11)])
+        self.assessment_count_combo.setCurrentText("3")
+        assessment_count_layout.addWidget(self.assessment_count_combo)
+        assessment_count_layout.addWidget(QLabel("次"))
+        assessment_count_layout.addStretch()
+        grid_layout.addLayout(assessment_count_layout, row, 4)
+
+        # ======== 第五行：任职经历 ========
+        row += 1
+
+        # 任职单位 - 左对齐
+        grid_layout.addWidget(QLabel("曾任职单位:"), row, 0, Qt.AlignRight)
+        self.career_unit_input = QLineEdit()
+        self.career_unit_input.setPlaceholderText("输入单位名称（来自简历）")
+        self.career_unit_input.setMinimumWidth(150)
+        grid_layout.addWidget(self.career_unit_input, row, 1)
+
+        # 分隔列
+        grid_layout.addWidget(QLabel(""), row, 2)  # 空标签作为分隔
+
+        # 任职年份区间 - 右对齐
+        grid_layout.addWidget(QLabel("任职年份范围:"), row, 3, Qt.AlignRight)
+        career_period_layout = QHBoxLayout()
+        career_period_layout.addWidget(QLabel("从"))
+        self.career_start_year = QLineEdit()
+        self.career_start_year.setPlaceholderText("输入年份")
+        self.career_start_year.setValidator(QIntValidator(1900, 2100, self))
+        self.career_start_year.setFixedWidth(200)
+        career_period_layout.addWidget(self.career_start_year)
+        career_period_layout.addWidget(QLabel("至"))
+        self.career_end_year = QLineEdit()
+        self.career_end_year.setPlaceholderText("输入年份")
+        self.career_end_year.setValidator(QIntValidator(1900, 2100, self))
+        self.career_end_year.setFixedWidth(200)
+        career_period_layout.addWidget(self.career_end_year)
+        career_period_layout.addStretch()
+        grid_layout.addLayout(career_period_layout, row, 4)
+
+        # ======== 第六行：奖惩 + 家庭成员（跨表条件） ========
+        row += 1
+
+        # 奖励时间 - 左对齐
+        grid_layout.addWidget(QLabel("获奖时间不早于:"), row, 0, Qt.AlignRight)
+        reward_since_layout = QHBoxLayout()
+        self.reward_since_year = QLineEdit()
+        self.reward_since_year.setPlaceholderText("输入年份")
+        self.reward_since_year.setValidator(QIntValidator(1900, 2100, self))
+        self.reward_since_month = QComboBox()
+        self.reward_since_month.addItem("不限")
+        self.reward_since_month.addItems([f"{month:02d}" for month in range(1, 13)])
+        reward_since_layout.addWidget(self.reward_since_year)
+        reward_since_layout.addWidget(QLabel("年"))
+        reward_since_layout.addWidget(self.reward_since_month)
+        reward_since_layout.addWidget(QLabel("月"))
+        grid_layout.addLayout(reward_since_layout, row, 1)
+
+        # 分隔列
+        grid_layout.addWidget(QLabel(""), row, 2)  # 空标签作为分隔
+
+        # 处分影响期 + 家庭成员政治面貌 - 右对齐
+        grid_layout.addWidget(QLabel("家庭成员政治面貌:"), row, 3, Qt.AlignRight)
+        cross_table_layout = QHBoxLayout()
+        self.family_status_combo = QComboBox()
+        self.family_status_combo.addItem("不限", "")
+        for status in ["中共党员", "中共预备党员", "共青团员", "民主党派", "无党派人士", "群众"]:
+            self.family_status_combo.addItem(status, status)
+        self.family_status_combo.setMinimumWidth(120)
+        cross_table_layout.addWidget(self.family_status_combo)
+        self.punishment_check = QCheckBox("处于处分影响期内")
+        cross_table_layout.addWidget(self.punishment_check)
+        cross_table_layout.addStretch()
+        grid_layout.addLayout(cross_table_layout, row, 4)
+
+        # 跨表条件需要相应表的查看权限
+        has_rewards_permission = self.permissions.get('rewards', False)
+        has_family_permission = self.permissions.get('family', False)
+        self.reward_since_year.setEnabled(has_rewards_permission)
+        self.reward_since_month.setEnabled(has_rewards_permission)
+        self.punishment_check.setEnabled(has_rewards_permission)
+        self.family_status_combo.setEnabled(has_family_permission)
+
+        # ======== 第七行：按钮 ========
         row += 1
         button_layout = QHBoxLayout()
         button_layout.setSpacing(15)
@@ -529,6 +748,7 @@ class QueryTab(QWidget):
                 """)
         # 绑定点击事件 (open_ai_chat 方法需要你在后面定义)
         self.ai_btn.clicked.connect(self.open_ai_chat)
+        self.ai_context_ready.connect(self.on_ai_context_ready)
         # ======== 【新增】AI 分析按钮结束 ========
 
         button_layout.addStretch()
@@ -587,7 +807,16 @@ class QueryTab(QWidget):
         # 禁用行选择功能 - 新增
         self.result_table.setSelectionMode(QAbstractItemView.NoSelection)
         self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        result_layout.addWidget(self.result_table)
+
+        # 左侧分面筛选栏 + 右侧结果表
+        self.facet_panel = FacetPanel()
+        self.facet_panel.selection_changed.connect(self.apply_facets)
+        result_splitter = QSplitter(Qt.Horizontal)
+        result_splitter.addWidget(self.facet_panel)
+        result_splitter.addWidget(self.result_table)
+        result_splitter.setStretchFactor(1, 1)
+        result_splitter.setSizes([240, 1000])
+        result_layout.addWidget(result_splitter)
 
         result_group.setLayout(result_layout)
         main_layout.addWidget(result_group)
@@ -643,126 +872,147 @@ class QueryTab(QWidget):
         self.education_combo.setCurrentIndex(0)
         self.parttime_combo.setCurrentIndex(0)
 
+        # 重置年度考核条件
+        self.assessment_combo.setCurrentIndex(0)
+        self.assessment_years_combo.setCurrentText("5")
+        self.assessment_count_combo.setCurrentText("3")
+
+        # 清空任职经历条件
+        self.career_unit_input.clear()
+        self.career_start_year.clear()
+        self.career_end_year.clear()
+
+        # 清空跨表条件
+        self.reward_since_year.clear()
+        self.reward_since_month.setCurrentIndex(0)
+        self.punishment_check.setChecked(False)
+        self.family_status_combo.setCurrentIndex(0)
+
     def view_all_data(self):
         """查看全部数据"""
         try:
             # 直接查询所有数据，不使用任何条件
-            results_dict = self.db.search_personnel()
-            self.current_results_dict = results_dict
-            self.current_results = results_dict.get('base_info', [])
-
-            # 【新增】重置当前表名为 base_info
-            self.current_table_name = 'base_info'
-
-            # 显示基础信息表
-            self.setup_table_headers('base_info')
-            self.display_results(self.current_results, 'base_info')
-
-            # 启用按钮（仅当有查询结果时）
-            has_results = len(self.current_results) > 0
-            self.base_info_btn.setEnabled(has_results and self.permissions.get('base_info', False))
-            self.rewards_btn.setEnabled(has_results and self.permissions.get('rewards', False))
-            self.family_btn.setEnabled(has_results and self.permissions.get('family', False))
-            self.resume_btn.setEnabled(has_results and self.permissions.get('resume', False))
+            results_dict = self.db.search()
+            self.current_filter = None
+            self.set_query_results(results_dict)
 
             QMessageBox.information(self, "查询完成", f"共找到 {len(self.current_results)} 条记录")
         except Exception as e:
             logger.error(f"查看全部数据失败: {e}")
             QMessageBox.critical(self, "查询错误", f"查看全部数据时发生错误: {e}")
 
+    def build_query_filter(self) -> dict:
+        """将界面上的查询条件转换为查询条件树（格式见 query_dsl 模块）"""
+        # 收集所有查询条件
+        name = self.name_input.text().strip() or None
+
+        # 获取现任职务条件
+        selected_level = self.position_combo.currentData()
+        position = None
+        if selected_level:
+            # 特殊处理"副科级以上"级别
+            if selected_level == "副科级以上":
+                # 合并所有副科级及以上的职位
+                position = []
+                for level in ["副科", "正科", "副县", "正县", "副厅"]:
+                    position.extend(self.position_mapping[level])
+            else:
+                # 使用映射表获取实际职位列表
+                position = self.position_mapping.get(selected_level, [])
+
+        # 获取职级/等级条件 - 使用 grade_display
+        grades = []
+        grade_text = self.grade_display.text().strip()
+        if grade_text:
+            grades = [g.strip() for g in grade_text.split(",") if g.strip()]
+
+        # 处理出生年月范围条件（格式为yyyy.MM）
+        birth_start = None
+        birth_end = None
+
+        # 获取起始年月
+        start_year = self.birth_start_year.text().strip()
+        start_month = self.birth_start_month.currentData()
+        if start_year and start_month:  # 年份和月份都填写
+            birth_start = f"{start_year}.{start_month}"
+        elif start_year:  # 只填写了年份
+            # 处理为年份范围（从该年1月到12月）
+            birth_start = f"{start_year}.01"
+            # 如果结束年月没有设置，自动设置为该年12月
+            if not birth_end and not self.birth_end_year.text().strip():
+                birth_end = f"{start_year}.12"
+
+        # 获取结束年月
+        end_year = self.birth_end_year.text().strip()
+        end_month = self.birth_end_month.currentData()
+        if end_year and end_month:  # 年份和月份都填写
+            birth_end = f"{end_year}.{end_month}"
+        elif end_year:  # 只填写了年份
+            # 处理为年份范围（从该年1月到12月）
+            birth_end = f"{end_year}.12"
+            # 如果开始年月没有设置，自动设置为该年1月
+            if not birth_start and not self.birth_start_year.text().strip():
+                birth_start = f"{end_year}.01"
+
+        # 处理学历条件
+        education_keywords = []
+        if self.education_combo.currentData():
+            selected_level = self.education_combo.currentData()
+            education_keywords = self.get_education_keywords(selected_level)
+
+        # 处理在职学历学位条件 - 不再使用列表，直接使用字符串
+        parttime_keywords = []
+        if self.parttime_combo.currentData():
+            selected_level = self.parttime_combo.currentData()
+            parttime_keywords = self.get_education_keywords(selected_level)
+
+        # 处理年度考核条件（近N年内至少M次为指定结果）
+        assessment_result = self.assessment_combo.currentData() or None
+        assessment_min_count = int(self.assessment_count_combo.currentText())
+        assessment_recent_years = int(self.assessment_years_combo.currentText())
+
+        # 处理任职经历条件（某年份区间内曾在某单位任职）
+        career_unit = self.career_unit_input.text().strip() or None
+        career_start_year = self.career_start_year.text().strip() or None
+        career_end_year = self.career_end_year.text().strip() or None
+
+        # 处理跨表条件（奖惩、家庭成员）
+        reward_since = None
+        reward_year = self.reward_since_year.text().strip()
+        if reward_year:
+            reward_month = self.reward_since_month.currentText().strip()
+            reward_since = f"{reward_year}.{reward_month if reward_month != '不限' else '01'}"
+        punishment_in_effect = self.punishment_check.isChecked()
+        family_political_status = self.family_status_combo.currentData() or None
+
+        return personnel_filter(
+            name=name,
+            grades=grades if grades else None,
+            position=position,
+            birth_start=birth_start,
+            birth_end=birth_end,
+            education=education_keywords,  # 传入关键词列表
+            parttime_education=parttime_keywords,  # 传入关键词列表
+            assessment_result=assessment_result,
+            assessment_min_count=assessment_min_count,
+            assessment_recent_years=assessment_recent_years,
+            career_unit=career_unit,
+            career_start_year=career_start_year,
+            career_end_year=career_end_year,
+            reward_since=reward_since,
+            punishment_in_effect=punishment_in_effect,
+            family_political_status=family_political_status
+        )
+
     def execute_query(self):
         """执行数据库查询操作"""
         try:
-            # 收集所有查询条件
-            name = self.name_input.text().strip() or None
-
-            # 获取现任职务条件
-            selected_level = self.position_combo.currentData()
-            position = None
-            if selected_level:
-                # 特殊处理"副科级以上"级别
-                if selected_level == "副科级以上":
-                    # 合并所有副科级及以上的职位
-                    position = []
-                    for level in ["副科", "正科", "副县", "正县", "副厅"]:
-                        position.extend(self.position_mapping[level])
-                else:
-                    # 使用映射表获取实际职位列表
-                    position = self.position_mapping.get(selected_level, [])
-
-            # 获取职级/等级条件 - 使用 grade_display
-            grades = []
-            grade_text = self.grade_display.text().strip()
-            if grade_text:
-                grades = [g.strip() for g in grade_text.split(",") if g.strip()]
-
-            # 处理出生年月范围条件（格式为yyyy.MM）
-            birth_start = None
-            birth_end = None
-
-            # 获取起始年月
-            start_year = self.birth_start_year.text().strip()
-            start_month = self.birth_start_month.currentText().strip()  # 去掉可能的空格
-            if start_year and start_month:  # 年份和月份都填写
-                birth_start = f"{start_year}.{start_month}"
-            elif start_year:  # 只填写了年份
-                # 处理为年份范围（从该年1月到12月）
-                birth_start = f"{start_year}.01"
-                # 如果结束年月没有设置，自动设置为该年12月
-                if not birth_end and not self.birth_end_year.text().strip():
-                    birth_end = f"{start_year}.12"
-
-            # 获取结束年月
-            end_year = self.birth_end_year.text().strip()
-            end_month = self.birth_end_month.currentText().strip()  # 去掉可能的空格
-            if end_year and end_month:  # 年份和月份都填写
-                birth_end = f"{end_year}.{end_month}"
-            elif end_year:  # 只填写了年份
-                # 处理为年份范围（从该年1月到12月）
-                birth_end = f"{end_year}.12"
-                # 如果开始年月没有设置，自动设置为该年1月
-                if not birth_start and not self.birth_start_year.text().strip():
-                    birth_start = f"{end_year}.01"
-
-            # 处理学历条件
-            education_keywords = []
-            if self.education_combo.currentData():
-                selected_level = self.education_combo.currentData()
-                education_keywords = self.get_education_keywords(selected_level)
-
-            # 处理在职学历学位条件 - 不再使用列表，直接使用字符串
-            parttime_keywords = []
-            if self.parttime_combo.currentData():
-                selected_level = self.parttime_combo.currentData()
-                parttime_keywords = self.get_education_keywords(selected_level)
-
             # 调用数据库接口
-            results_dict = self.db.search_personnel(
-                name=name,
-                grades=grades if grades else None,
-                position=position,
-                birth_start=birth_start,
-                birth_end=birth_end,
-                education=education_keywords,  # 传入关键词列表
-                parttime_education=parttime_keywords  # 传入关键词列表
-            )
-
-            self.current_results_dict = results_dict
-            self.current_results = results_dict.get('base_info', [])
-
-            # 【新增】重置当前表名为 base_info
-            self.current_table_name = 'base_info'
-
-            # 显示基础信息表
-            self.setup_table_headers('base_info')
-            self.display_results(self.current_results, 'base_info')
+            filter_spec = self.build_query_filter()
+            results_dict = self.db.search(filter_spec)
+            self.current_filter = filter_spec
 
-            # 启用按钮（仅当有查询结果时）
-            has_results = len(self.current_results) > 0
-            self.base_info_btn.setEnabled(has_results and self.permissions.get('base_info', False))
-            self.rewards_btn.setEnabled(has_results and self.permissions.get('rewards', False))
-            self.family_btn.setEnabled(has_results and self.permissions.get('family', False))
-            self.resume_btn.setEnabled(has_results and self.permissions.get('resume', False))
+            self.set_query_results(results_dict)
 
             QMessageBox.information(self, "查询完成", f"找到 {len(self.current_results)} 条记录")
 
@@ -770,89 +1020,74 @@ class QueryTab(QWidget):
             logger.error(f"查询执行失败: {e}")
             QMessageBox.critical(self, "查询错误", f"执行查询时发生错误: {e}")
 
-    def get_full_field_mapping(self, table_name: str) -> dict:
-        """
-        获取指定表的所有字段映射（数据库字段名 -> 中文表头名）
-        用于确保 AI 能读取到所有列，且能理解列的含义
-        """
-        if table_name == 'base_info':
-            mapping = {
-                "sequence": "序号",
-                "name": "姓名",
-                "next_promotion": "距离下次职级晋升时间",
-                "current_position": "现任职务",
-                "current_position_date": "任现职务时间",
-                "current_grade": "职级/等级",
-                "current_grade_date": "任现职级/等级时间",
-                "previous_position1": "前一职务",
-                "previous_position1_date": "前一职务任职时间",
-                "previous_position2": "前二职务",
-                "previous_position2_date": "前二职务任职时间",
-                "current_legal_position": "现任法律职务",
-                "current_legal_position_date": "现任法律职务任职时间",
-                "previous_legal_position": "前一法律职务",
-                "previous_legal_position_date": "前一法律职务任职时间",
-                "admission_date": "入额时间",
-                "entry_date": "进入检察机关时间",
-                "gender": "性别",
-                "birth_date": "出生年月",
-                "ethnicity": "民族",
-                "hometown": "籍贯出生地",
-                "work_start_date": "参加工作时间",
-                "party_date": "入党时间",
-                "fulltime_education": "全日制学历学位",
-                "fulltime_school": "全日制毕业院校及专业",
-                "parttime_education": "在职学历学位",
-                "parttime_school": "在职毕业院校及专业",
-                "rewards": "奖惩",
-                "rewards": "奖惩",
-            }
+    def set_query_results(self, results_dict: dict):
+        """保存查询结果，重置分面筛选并显示基础信息表"""
+        self.query_results_dict = results_dict
+        self.facet_index.refresh(self.db)
+        self.facet_base_bits = self.facet_index.bits_for_ids(
+            row['id'] for row in results_dict.get('base_info', [])
+        )
+        self.facet_panel.clear_selections()
 
-            # 2. 动态添加年度考核字段
-            assessment_years = self.db.get_assessment_years() or []
-            for idx, year in enumerate(assessment_years):
-                mapping[f"assessment_{idx}"] = f"{year}年年度考核结果"
+        # 【新增】重置当前表名为 base_info
+        self.current_table_name = 'base_info'
+        self.apply_facets()
+
+    def apply_facets(self):
+        """按分面勾选在当前查询结果内筛选（位图求交），并刷新各取值人数与结果表"""
+        if self.facet_index.refresh(self.db):
+            # 数据变化后索引位置会改变，重新计算查询结果的位集合
+            self.facet_base_bits = self.facet_index.bits_for_ids(
+                row['id'] for row in self.query_results_dict.get('base_info', [])
+            )
 
-            # 3. 最后再把"备注"加到字典末尾
-            mapping["remarks"] = "备注"
+        start_time = time.perf_counter()
+        selections = self.facet_panel.selections()
+        matched_bits = self.facet_index.match(selections, self.facet_base_bits)
+        counts = self.facet_index.counts(selections, self.facet_base_bits)
+        elapsed_us = (time.perf_counter() - start_time) * 1_000_000
+        logger.debug(f"分面筛选耗时 {elapsed_us:.0f} 微秒")
+
+        base_rows = self.query_results_dict.get('base_info', [])
+        if selections:
+            matched_ids = set(self.facet_index.ids_for_bits(matched_bits))
+            base_rows = [row for row in base_rows if row['id'] in matched_ids]
+            matched_names = {row['name'] for row in base_rows}
+            self.current_results_dict = {'base_info': base_rows}
+            for child_table in ['rewards', 'family', 'resume']:
+                self.current_results_dict[child_table] = [
+                    row for row in self.query_results_dict.get(child_table, [])
+                    if row['name'] in matched_names
+                ]
+        else:
+            self.current_results_dict = dict(self.query_results_dict)
+        self.current_results = base_rows
 
-            return mapping
+        self.facet_panel.set_counts(
+            self.facet_index.fields, counts, selections,
+            len(base_rows), len(self.query_results_dict.get('base_info', []))
+        )
 
-        elif table_name == 'rewards':
-            return {
-                "sequence": "序号",
-                "name": "姓名",
-                "reward_name": "奖励名称",
-                "reward_date": "奖励批准日期",
-                "reward_unit": "奖励批准单位",
-                "reward_authority_type": "批准机关性质",
-                "punishment_name": "惩戒名称",
-                "punishment_date": "惩处批准日期",
-                "punishment_unit": "惩戒批准单位",
-                "punishment_authority_type": "惩戒批准机关性质",
-                "impact_period": "影响期",
-            }
-
-        elif table_name == 'family':
-            return {
-                "sequence": "序号",
-                "name": "姓名",
-                "relation": "称谓",
-                "family_name": "家庭成员姓名",
-                "birth_date": "出生日期",
-                "political_status": "政治面貌",
-                "work_unit": "家庭成员工作单位",
-                "position": "职务",
-            }
+        # 刷新当前查看的表
+        if not self.permissions.get(self.current_table_name, False):
+            self.current_table_name = 'base_info'
+        self.setup_table_headers(self.current_table_name)
+        self.display_results(self.current_results_dict.get(self.current_table_name, []), self.current_table_name)
 
-        elif table_name == 'resume':
-            return {
-                "sequence": "序号",
-                "name": "姓名",
-                "resume_text": "简历信息",
-            }
+        # 启用按钮（仅当有查询结果时）
+        has_results = len(self.current_results) > 0
+        self.base_info_btn.setEnabled(has_results and self.permissions.get('base_info', False))
+        self.rewards_btn.setEnabled(has_results and self.permissions.get('rewards', False))
+        self.family_btn.setEnabled(has_results and self.permissions.get('family', False))
+        self.resume_btn.setEnabled(has_results and self.permissions.get('resume', False))
 
-        return {}
+    def get_full_field_mapping(self, table_name: str) -> dict:
+        """
+        获取指定表的所有字段映射（数据库字段名 -> 中文表头名）
+        用于确保 AI 能读取到所有列，且能理解列的含义
+        """
+        assessment_years = self.db.get_assessment_years() if table_name == 'base_info' else None
+        return get_table_fields(table_name, assessment_years)
 
     def open_ai_chat(self):
         """
@@ -901,95 +1136,120 @@ class QueryTab(QWidget):
                 return
             # ==============================================================
 
-            # 3. 提取用户选中的多表数据并构建上下文
-            final_data_contexts = []
-            limit_rows_per_table = 1000  # 每个表最多传入的行数（防 token 爆仓）
-
+            # 3. 提取用户选中的多表数据
+            context_tables = []
             for t_key, selected_headers in selected_data_config.items():
-                current_data = self.current_results_dict.get(t_key, [])
                 full_mapping = available_tables[t_key]['mapping']
+                context_tables.append({
+                    'key': t_key,
+                    'title': self.get_table_name(t_key),
+                    'rows': self.current_results_dict.get(t_key, []),
+                    # 过滤 mapping：只保留用户勾选的字段
+                    'mapping': {k: v for k, v in full_mapping.items() if v in selected_headers},
+                })
+
+            # 4. 在后台线程中查找可恢复的对话并构建数据上下文，完成后再打开对话窗口
+            conversation = {
+                'username': self.username,
+                'title': f"{'、'.join(self.get_table_name(k) for k in selected_data_config)}"
+                         f"（{len(self.current_results_dict.get('base_info', []))} 人）",
+                'filter_spec': self.current_filter,
+                'selected_columns': selected_data_config,
+            }
+            self.prepare_ai_context(context_tables, conversation, allow_restore=True)
 
-                # 过滤 mapping：只保留用户勾选的字段
-                filtered_mapping = {k: v for k, v in full_mapping.items() if v in selected_headers}
-
-                available_keys = []
-                if current_data:
-                    sample_row = current_data[0]
-                    for db_key in filtered_mapping.keys():
-                        if db_key in sample_row:
-                            available_keys.append(db_key)
-
-                # ==== 改用 AI 最擅长理解的 Markdown 表格格式 ====
-                markdown_lines = []
-
-                # 1. 生成 Markdown 表头
-                headers = [filtered_mapping[k] for k in available_keys]
-                markdown_lines.append("| " + " | ".join(headers) + " |")
-
-                # 2. 生成 Markdown 分隔线
-                separators = ["---"] * len(headers)
-                markdown_lines.append("| " + " | ".join(separators) + " |")
-
-                # 3. 提取本表数据
-                process_data = current_data[:limit_rows_per_table]
-                for person in process_data:
-                    row_values = []
-                    for key in available_keys:
-                        val = person.get(key)
-                        if val is None:
-                            val = ""
-                        val = str(val).strip()
-
-                        # 核心清理操作：防止数据内的特殊符号破坏 Markdown 表格结构
-                        # 1. 把所有换行、回车、制表符替换为空格
-                        val = re.sub(r'[\r\n\t]+', ' ', val)
-                        # 2. 把 Markdown 表格的敏感字符 "|" 替换为全角 "｜" 或逗号
-                        val = val.replace('|', '｜')
-
-                        row_values.append(val)
-
-                    markdown_lines.append("| " + " | ".join(row_values) + " |")
-
-                # 将列表组合为字符串
-                context_str = "\n".join(markdown_lines)
-
-                total_count = len(current_data)
-                note = ""
-                if total_count > limit_rows_per_table:
-                    note = f"\n(注：此表共有 {total_count} 条记录，为保证 AI 运行速度，仅传入前 {limit_rows_per_table} 条。)"
-
-                # 拼接本表数据区块
-                table_block = (
-                    f"### Data({self.get_table_name(t_key)}):\n"
-                    f"{context_str}\n"
-                    f"{note}"
-                )
-                final_data_contexts.append(table_block)
-
-            # 4. 组合所有表的文本
-            final_data_context = "\n\n".join(final_data_contexts)
-
-            # 5. 打开 AI 对话窗口
-            try:
-                import ai_chat
-                if hasattr(self, 'ai_dialog') and self.ai_dialog is not None:
-                    self.ai_dialog.close()
+        except Exception as e:
+            import traceback
+            logger.error(f"AI Logic Error: {traceback.format_exc()}")
+            QMessageBox.critical(self, "错误", f"AI分析准备阶段出错：\n{str(e)}")
 
-                self.ai_dialog = ai_chat.AIChatDialog(final_data_context, self)
-                # 修改标题以反馈当前为多表综合分析
-                table_names = [self.get_table_name(k) for k in selected_data_config.keys()]
-                self.ai_dialog.setWindowTitle(f"智能分析 - 涉及 [{', '.join(table_names)}]")
-                self.ai_dialog.show()
+    def prepare_ai_context(self, context_tables: list, conversation: dict, allow_restore: bool):
+        """后台计算查询哈希、查找相同查询的已保存对话，未找到时构建数据上下文（复用各列已编码的单元格）"""
+        self.ai_btn.setEnabled(False)
+        self.ai_btn.setText("正在准备数据...")
+        store = ConversationStore(self.db.db_path)
 
+        def worker():
+            result = {'context_tables': context_tables, 'conversation': conversation, 'saved': None}
+            try:
+                conversation['query_hash'] = query_hash(conversation['filter_spec'], context_tables)
+                saved = store.find_latest(conversation['username'], conversation['query_hash']) if allow_restore else None
+                if saved and saved['history'] and saved['data_context']:
+                    # 相同查询条件、所选列和数据的对话已保存过，询问是否恢复后再决定是否构建
+                    result['saved'] = saved
+                else:
+                    # 每个表最多传入 1000 行，防 token 爆仓
+                    data_context = build_data_context(context_tables, limit_rows_per_table=1000,
+                                                      cache=self.context_cache)
+                    conversation['data_context'] = data_context
+                    conversation['context_hash'] = hash_text(data_context)
             except Exception as e:
                 import traceback
-                logger.error(f"AI Dialog Error: {traceback.format_exc()}")
-                QMessageBox.critical(self, "组件错误", f"无法打开 AI 窗口：\n{e}")
+                logger.error(f"AI Context Error: {traceback.format_exc()}")
+                result['error'] = str(e)
+            try:
+                self.ai_context_ready.emit(result)
+            except RuntimeError:
+                # 窗口可能已关闭
+                pass
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_ai_context_ready(self, result: dict):
+        self.ai_btn.setEnabled(True)
+        self.ai_btn.setText("AI 智能分析")
+        if result.get('error'):
+            QMessageBox.critical(self, "错误", f"AI分析准备阶段出错：\n{result['error']}")
+            return
+
+        conversation = result['conversation']
+        saved = result['saved']
+        if saved is not None:
+            reply = QMessageBox.question(
+                self, "恢复对话",
+                f"发现基于相同查询条件的 AI 对话（最后更新于 {saved['updated_at']}），是否继续该对话？\n\n"
+                f"选择【否】将开始新的对话。",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+            )
+            if reply != QMessageBox.Yes:
+                self.prepare_ai_context(result['context_tables'], conversation, allow_restore=False)
+                return
+            # 沿用保存的数据上下文，无需重新构建
+            conversation = saved
+        self.show_ai_dialog(result['context_tables'], conversation)
+
+    def show_ai_dialog(self, context_tables: list, conversation: dict):
+        """打开 AI 对话窗口"""
+        try:
+            import ai_chat
+            if hasattr(self, 'ai_dialog') and self.ai_dialog is not None:
+                self.ai_dialog.close()
+
+            # 统计查询模式可使用全部有权限的表，范围限定为当前查询结果中的人员
+            table_keys = ['base_info', 'rewards', 'family', 'resume']
+            sql_analyst = SQLAnalyst(
+                self.db.db_path,
+                {t_key: {'title': self.get_table_name(t_key), 'mapping': self.get_full_field_mapping(t_key)}
+                 for t_key in table_keys if self.permissions.get(t_key, False)},
+                [row['id'] for row in self.current_results_dict.get('base_info', [])],
+                self.db.get_assessment_years(),
+            )
+
+            # 同时传入原始数据，供对话框按问题检索相关人员（检索增强）
+            self.ai_dialog = ai_chat.AIChatDialog(conversation['data_context'], self,
+                                                  context_tables=context_tables,
+                                                  db_path=self.db.db_path,
+                                                  sql_analyst=sql_analyst,
+                                                  conversation=conversation)
+            # 修改标题以反馈当前为多表综合分析
+            table_names = [table['title'] for table in context_tables]
+            self.ai_dialog.setWindowTitle(f"智能分析 - 涉及 [{', '.join(table_names)}]")
+            self.ai_dialog.show()
 
         except Exception as e:
             import traceback
-            logger.error(f"AI Logic Error: {traceback.format_exc()}")
-            QMessageBox.critical(self, "错误", f"AI分析准备阶段出错：\n{str(e)}")
+            logger.error(f"AI Dialog Error: {traceback.format_exc()}")
+            QMessageBox.critical(self, "组件错误", f"无法打开 AI 窗口：\n{e}")
 
     def show_table_data(self, table_name: str):
         """显示指定表的数据"""
@@ -1016,13 +1276,7 @@ class QueryTab(QWidget):
 
     def get_table_name(self, table_name: str) -> str:
         """获取表的中文名称"""
-        table_names = {
-            'base_info': '人员基本信息',
-            'rewards': '人员奖惩信息',
-            'family': '人员家庭成员信息',
-            'resume': '人员简历信息'
-        }
-        return table_names.get(table_name, table_name)
+        return TABLE_TITLES.get(table_name, table_name)
 
 
     def setup_table_headers(self, table_name: str):
@@ -1108,75 +1362,8 @@ class QueryTab(QWidget):
             self.result_table.setRowCount(0)
             return
 
-        # 根据表类型创建不同的字段映射
-        if table_name == 'base_info':
-            field_mapping = {
-                "序号": "sequence",
-                "姓名": "name",
-                "距离下次职级晋升时间": "next_promotion",
-                "现任职务": "current_position",
-                "任现职务时间": "current_position_date",
-                "职级/等级": "current_grade",
-                "任现职级/等级时间": "current_grade_date",
-                "前一职务": "previous_position1",
-                "前一职务任职时间": "previous_position1_date",
-                "前二职务": "previous_position2",
-                "前二职务任职时间": "previous_position2_date",
-                "现任法律职务": "current_legal_position",
-                "现任法律职务任职时间": "current_legal_position_date",
-                "前一法律职务": "previous_legal_position",
-                "前一法律职务任职时间": "previous_legal_position_date",
-                "入额时间": "admission_date",
-                "进入检察机关时间": "entry_date",
-                "性别": "gender",
-                "出生年月": "birth_date",
-                "民族": "ethnicity",
-                "籍贯出生地": "hometown",
-                "参加工作时间": "work_start_date",
-                "入党时间": "party_date",
-                "全日制学历学位": "fulltime_education",
-                "全日制毕业院校及专业": "fulltime_school",
-                "在职学历学位": "parttime_education",
-                "在职毕业院校及专业": "parttime_school",
-                "奖惩": "rewards",
-                "备注": "remarks",
-            }
-            # 添加年度考核字段映射
-            assessment_years = self.db.get_assessment_years() or []
-            for idx, year in enumerate(assessment_years):
-                field_mapping[f"{year}年年度考核结果"] = f"assessment_{idx}"
-        elif table_name == 'rewards':
-            field_mapping = {
-                "序号": "sequence",
-                "姓名": "name",
-                "奖励名称": "reward_name",
-                "奖励批准日期": "reward_date",
-                "奖励批准单位": "reward_unit",
-                "批准机关性质": "reward_authority_type",
-                "惩戒名称": "punishment_name",
-                "惩处批准日期": "punishment_date",
-                "惩戒批准单位": "punishment_unit",
-                "惩戒批准机关性质": "punishment_authority_type",
-                "影响期": "impact_period",
-            }
-        elif table_name == 'family':
-            field_mapping = {
-                "序号": "sequence",
-                "姓名": "name",
-                "称谓": "relation",
-                "家庭成员姓名": "family_name",
-                "出生日期": "birth_date",
-                "政治面貌": "political_status",
-                "家庭成员工作单位": "work_unit",
-                "职务": "position",
-            }
-        elif table_name == 'resume':
-            field_mapping = {
-                "序号": "sequence",
-                "姓名": "name",
-                "简历信息": "resume_text",
-            }
-
+        # 根据表类型创建字段映射（中文表头 -> 数据库字段名）
+        field_mapping = {label: field for field, label in self.get_full_field_mapping(table_name).items()}
 
         # 获取表格列数
         col_count = self.result_table.columnCount()
@@ -0,0 +1,91 @@
+import sys
+import csv
+import json
+import argparse
+import logging
+
+from database import Database
+from query_dsl import QueryFilterError, describe_fields, plan_cache_info, required_permissions
+from schema import TABLE_TITLES
+
+logger = logging.getLogger('QueryCLI')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="人员信息命令行查询（无界面），查询条件使用与综合查询相同的条件树格式",
+    )
+    parser.add_argument('--filter', help='JSON 格式的查询条件，如 {"field": "gender", "op": "eq", "value": "女"}')
+    parser.add_argument('--filter-file', help='包含 JSON 查询条件的文件路径')
+    parser.add_argument('--table', default='base_info', choices=list(TABLE_TITLES),
+                        help='输出哪张表的数据（默认 base_info）')
+    parser.add_argument('--format', default='json', choices=['json', 'csv'], help='输出格式')
+    parser.add_argument('--user', help='按该用户的表格权限输出（默认不限制）')
+    parser.add_argument('--db', help='数据库文件路径（默认使用程序配置）')
+    parser.add_argument('--list-fields', action='store_true', help='列出可检索字段后退出')
+    return parser.parse_args(argv)
+
+
+def load_filter(args):
+    """读取命令行给出的查询条件"""
+    if args.filter_file:
+        with open(args.filter_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if args.filter:
+        return json.loads(args.filter)
+    return None
+
+
+def write_rows(rows, output_format, stream):
+    """按指定格式输出查询结果"""
+    if output_format == 'json':
+        json.dump(rows, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
+        return
+
+    if not rows:
+        return
+    writer = csv.DictWriter(stream, fieldnames=list(rows[0].keys()))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.list_fields:
+        print(describe_fields())
+        return 0
+
+    try:
+        filter_spec = load_filter(args)
+    except (OSError, ValueError) as e:
+        print(f"读取查询条件失败: {e}", file=sys.stderr)
+        return 2
+
+    db = Database(args.db)
+    try:
+        if args.user and not db.is_admin(args.user):
+            permissions = db.get_user_permissions(args.user)
+            if not permissions.get(args.table, False):
+                print(f"用户 {args.user} 没有 {TABLE_TITLES[args.table]} 的查看权限", file=sys.stderr)
+                return 3
+            denied = sorted(key for key in required_permissions(filter_spec) if not permissions.get(key, False))
+            if denied:
+                titles = '、'.join(TABLE_TITLES[key] for key in denied)
+                print(f"用户 {args.user} 没有 {titles} 的查看权限，不能在查询条件中使用", file=sys.stderr)
+                return 3
+
+        results = db.search(filter_spec)
+        write_rows(results.get(args.table, []), args.format, sys.stdout)
+        logger.info(f"命令行查询完成，执行计划缓存: {plan_cache_info()}")
+        return 0
+    except QueryFilterError as e:
+        print(f"查询条件错误: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from schema import DOT_DATE_FIELDS, YEAR_MONTH_FIELDS, get_searchable_fields
+
+logger = logging.getLogger('QueryDSL')
+
+# 与 base_info 通过姓名关联的子表
+CHILD_TABLES = ['rewards', 'family', 'resume', 'career_events']
+
+# 查看权限与表名不同的表：任职经历由简历解析而来，随简历权限
+PERMISSION_TABLES = {'career_events': 'resume'}
+
+# 比较运算符 -> SQL 模板（{expr} 为字段表达式）
+OPERATORS = {
+    'eq': '{expr} = ?',
+    'ne': '{expr} != ?',
+    'gt': '{expr} > ?',
+    'gte': '{expr} >= ?',
+    'lt': '{expr} < ?',
+    'lte': '{expr} <= ?',
+    'like': '{expr} LIKE ?',
+    'between': '{expr} BETWEEN ? AND ?',
+    'in': None,        # 参数个数可变，编译时展开
+    'like_any': None,  # 任一关键词模糊匹配，编译时展开为 OR
+    'empty': "COALESCE({expr}, '') = ''",
+    'not_empty': "COALESCE({expr}, '') != ''",
+}
+
+# 不需要参数的运算符
+NO_VALUE_OPERATORS = {'empty', 'not_empty'}
+
+# 参数为列表的运算符
+LIST_OPERATORS = {'in', 'like_any', 'between'}
+
+
+class QueryFilterError(ValueError):
+    """查询条件格式错误"""
+
+
+def _resolve_field(field: str, scope: str) -> Tuple[str, str]:
+    """将字段名解析为 (表名, 列名)，未加表名前缀时属于当前作用域的表"""
+    if not isinstance(field, str) or not field:
+        raise QueryFilterError(f"无效的字段名: {field!r}")
+
+    table, _, column = field.rpartition('.')
+    table = table or scope
+    if table != 'base_info' and table not in CHILD_TABLES:
+        raise QueryFilterError(f"未知的数据表: {table}")
+    if column not in get_searchable_fields(table):
+        raise QueryFilterError(f"表 {table} 中不存在可检索字段: {column}")
+    return table, column
+
+
+def _convert_value(table: str, column: str, value: Any) -> Any:
+    """按字段类型转换参数值，YYYYMM 字段接受 yyyy.MM 文本"""
+    if (table, column) in YEAR_MONTH_FIELDS and isinstance(value, str):
+        # 在函数内部导入以避免循环依赖
+        from database import parse_year_month
+        converted = parse_year_month(value)
+        if converted is None:
+            raise QueryFilterError(f"无法识别的年月: {value}")
+        return converted
+    return value
+
+
+def _leaf_params(table: str, column: str, op: str, value: Any) -> List[Any]:
+    """生成叶子条件的参数列表"""
+    if op in NO_VALUE_OPERATORS:
+        return []
+
+    if op in LIST_OPERATORS:
+        if not isinstance(value, (list, tuple)) or not value:
+            raise QueryFilterError(f"运算符 {op} 需要非空列表参数")
+        if op == 'between' and len(value) != 2:
+            raise QueryFilterError("运算符 between 需要两个参数")
+        values = list(value)
+    else:
+        values = [value]
+
+    values = [_convert_value(table, column, v) for v in values]
+    if op in ('like', 'like_any'):
+        values = [f"%{v}%" for v in values]
+    return values
+
+
+def _analyze(node: Any, scope: str = 'base_info') -> Tuple[tuple, List[Any]]:
+    """校验条件树，返回 (形状, 参数)。形状不含参数值，用作执行计划缓存的键"""
+    if not isinstance(node, dict):
+        raise QueryFilterError(f"查询条件必须为字典: {node!r}")
+
+    for group_op in ('and', 'or'):
+        if group_op in node:
+            children = node[group_op]
+            if not isinstance(children, (list, tuple)):
+                raise QueryFilterError(f"{group_op} 条件必须为列表")
+            shapes, params = [], []
+            for child in children:
+                child_shape, child_params = _analyze(child, scope)
+                shapes.append(child_shape)
+                params.extend(child_params)
+            return (group_op, tuple(shapes)), params
+
+    if 'not' in node:
+        child_shape, params = _analyze(node['not'], scope)
+        return ('not', child_shape), params
+
+    if 'exists' in node:
+        table = node['exists']
+        if scope != 'base_info':
+            raise QueryFilterError("exists 条件不能嵌套使用")
+        if table not in CHILD_TABLES:
+            raise QueryFilterError(f"exists 只支持子表: {', '.join(CHILD_TABLES)}")
+        where = node.get('where')
+        if where is None:
+            return ('exists', table, None), []
+        child_shape, params = _analyze(where, table)
+        return ('exists', table, child_shape), params
+
+    if 'assessment' in node:
+        if scope != 'base_info':
+            raise QueryFilterError("assessment 条件只能用于人员基本信息")
+        spec = node['assessment'] or {}
+        if not spec.get('result'):
+            raise QueryFilterError("assessment 条件缺少考核结果 result")
+        params = [spec['result']]
+        recent_years = spec.get('recent_years')
+        if recent_years:
+            params.append(int(recent_years))
+        params.append(int(spec.get('min_count') or 1))
+        return ('assessment', bool(recent_years)), params
+
+    if 'field' in node:
+        op = node.get('op', 'eq')
+        if op not in OPERATORS:
+            raise QueryFilterError(f"不支持的运算符: {op}")
+        table, column = _resolve_field(node['field'], scope)
+        params = _leaf_params(table, column, op, node.get('value'))
+        shape = ('leaf', table, column, op, len(params))
+        if table != scope:
+            if scope != 'base_info':
+                raise QueryFilterError(f"子表条件中不能引用其他表字段: {node['field']}")
+            # 顶层直接引用子表字段时，自动包装为 EXISTS 关联子查询
+            return ('exists', table, shape), params
+        return shape, params
+
+    raise QueryFilterError(f"无法识别的查询条件: {node!r}")
+
+
+def _field_expr(table: str, column: str) -> str:
+    """字段的 SQL 表达式"""
+    expr = f"{table}.{column}"
+    if (table, column) in DOT_DATE_FIELDS:
+        expr = f"REPLACE({expr}, '-', '.')"
+    return expr
+
+
+@lru_cache(maxsize=256)
+def _compile_shape(shape: tuple) -> str:
+    """将条件形状编译为带 ? 占位符的 WHERE 子句（结果按形状缓存）"""
+    kind = shape[0]
+
+    if kind in ('and', 'or'):
+        children = shape[1]
+        if not children:
+            return '1 = 1' if kind == 'and' else '1 = 0'
+        parts = [_compile_shape(child) for child in children]
+        if len(parts) == 1:
+            return parts[0]
+        return '(' + f" {kind.upper()} ".join(parts) + ')'
+
+    if kind == 'not':
+        return f"NOT ({_compile_shape(shape[1])})"
+
+    if kind == 'exists':
+        _, table, child_shape = shape
+        sql = f"EXISTS (SELECT 1 FROM {table} WHERE {table}.name = base_info.name"
+        if child_shape is not None:
+            sql += f" AND {_compile_shape(child_shape)}"
+        return sql + ")"
+
+    if kind == 'assessment':
+        sql = "base_info.id IN (SELECT person_id FROM assessments WHERE result = ?"
+        if shape[1]:
+            # 最近 N 年以已导入的最新考核年份为准
+            sql += " AND year > (SELECT MAX(year) FROM assessments) - ?"
+        return sql + " GROUP BY person_id HAVING COUNT(*) >= ?)"
+
+    if kind == 'leaf':
+        _, table, column, op, param_count = shape
+        expr = _field_expr(table, column)
+        if op == 'in':
+            return f"{expr} IN ({', '.join(['?'] * param_count)})"
+        if op == 'like_any':
+            return '(' + ' OR '.join([f"{expr} LIKE ?"] * param_count) + ')'
+        return OPERATORS[op].format(expr=expr)
+
+    raise QueryFilterError(f"无法编译的条件形状: {shape!r}")
+
+
+def compile_filter(spec: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+    """将查询条件编译为 (WHERE 子句, 参数列表)，无条件时返回空子句"""
+    if not spec:
+        return '', []
+    shape, params = _analyze(spec)
+    return _compile_shape(shape), params
+
+
+def _shape_tables(shape: tuple, tables: Set[str]):
+    """收集条件形状中引用的数据表"""
+    kind = shape[0]
+    if kind in ('and', 'or'):
+        for child in shape[1]:
+            _shape_tables(child, tables)
+    elif kind == 'not':
+        _shape_tables(shape[1], tables)
+    elif kind == 'exists':
+        tables.add(shape[1])
+        if shape[2] is not None:
+            _shape_tables(shape[2], tables)
+    elif kind == 'assessment':
+        tables.add('base_info')
+    elif kind == 'leaf':
+        tables.add(shape[1])
+
+
+def required_permissions(spec: Optional[Dict[str, Any]]) -> Set[str]:
+    """查询条件涉及的表格查看权限（键与 user_permissions 的列相同）
+
+    条件中引用了某张表的字段或以 exists 判断其记录时，即使不输出该表，查询结果也会透露其内容，
+    因此按用户权限执行查询前须确认这些权限。
+    """
+    if not spec:
+        return set()
+    tables = set()
+    _shape_tables(_analyze(spec)[0], tables)
+    return {PERMISSION_TABLES.get(table, table) for table in tables}
+
+
+def plan_cache_info():
+    """返回执行计划缓存的命中统计"""
+    return _compile_shape.cache_info()
+
+
+def personnel_filter(name: str = None,
+                     grades: list = None,
+                     position: list = None,
+                     birth_start: str = None,
+                     birth_end: str = None,
+                     education: list = None,
+                     parttime_education: list = None,
+                     assessment_result: str = None,
+                     assessment_min_count: int = None,
+                     assessment_recent_years: int = None,
+                     career_unit: str = None,
+                     career_start_year: int = None,
+                     career_end_year: int = None,
+                     reward_since: str = None,
+                     punishment_in_effect: bool = False,
+                     family_political_status: str = None) -> Dict[str, Any]:
+    """将综合查询界面的各项条件组合为查询条件树（各条件之间为 AND 关系）"""
+    conditions = []
+
+    if name:
+        conditions.append({'field': 'name', 'op': 'like', 'value': name})
+    if grades:
+        conditions.append({'field': 'current_grade', 'op': 'like_any', 'value': list(grades)})
+    if position:
+        conditions.append({'field': 'current_position', 'op': 'in', 'value': list(position)})
+
+    # 出生年月范围（格式为yyyy.MM）
+    if birth_start and birth_end:
+        conditions.append({'field': 'birth_date', 'op': 'between', 'value': [birth_start, birth_end]})
+    elif birth_start:
+        conditions.append({'field': 'birth_date', 'op': 'gte', 'value': birth_start})
+    elif birth_end:
+        conditions.append({'field': 'birth_date', 'op': 'lte', 'value': birth_end})
+
+    if education:
+        conditions.append({'field': 'fulltime_education', 'op': 'like_any', 'value': list(education)})
+    if parttime_education:
+        conditions.append({'field': 'parttime_education', 'op': 'like_any', 'value': list(parttime_education)})
+
+    if assessment_result:
+        conditions.append({'assessment': {
+            'result': assessment_result,
+            'min_count': assessment_min_count or 1,
+            'recent_years': assessment_recent_years,
+        }})
+
+    # 任职经历：同一段经历需同时满足单位与时间区间
+    if career_unit or career_start_year or career_end_year:
+        career_conditions = []
+        if career_end_year:
+            career_conditions.append({'field': 'start_ym', 'op': 'lte', 'value': int(career_end_year) * 100 + 12})
+        if career_start_year:
+            career_conditions.append({'field': 'end_ym', 'op': 'gte', 'value': int(career_start_year) * 100 + 1})
+        if career_unit:
+            # 叙述式简历常把单位写在职务里（如"县检察长"），两者都匹配
+            career_conditions.append({'or': [
+                {'field': 'unit', 'op': 'like', 'value': career_unit},
+                {'field': 'position', 'op': 'like', 'value': career_unit},
+            ]})
+        conditions.append({'exists': 'career_events', 'where': {'and': career_conditions}})
+
+    if reward_since:
+        conditions.append({'field': 'rewards.reward_ym', 'op': 'gte', 'value': reward_since})
+
+    if punishment_in_effect:
+        today_ym = datetime.now().year * 100 + datetime.now().month
+        conditions.append({'exists': 'rewards', 'where': {'and': [
+            {'field': 'punishment_ym', 'op': 'lte', 'value': today_ym},
+            {'field': 'impact_end_ym', 'op': 'gte', 'value': today_ym},
+        ]}})
+
+    if family_political_status:
+        conditions.append({'field': 'family.political_status', 'op': 'like', 'value': family_political_status})
+
+    return {'and': conditions}
+
+
+def describe_fields() -> str:
+    """生成可检索字段说明（供命令行帮助及 AI 提示词使用）"""
+    lines = []
+    for table in ['base_info'] + CHILD_TABLES:
+        prefix = '' if table == 'base_info' else f"{table}."
+        lines.append(f"[{table}]")
+        for column, label in get_searchable_fields(table).items():
+            lines.append(f"  {prefix}{column}: {label}")
+    lines.append("[assessment] {\"assessment\": {\"result\": \"优秀\", \"min_count\": 3, \"recent_years\": 5}}")
+    lines.append(f"运算符: {', '.join(OPERATORS)}")
+    return "\n".join(lines)
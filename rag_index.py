@@ -0,0 +1,142 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ai_context import ContextTable, build_data_context, person_documents
+from ai_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, get_scheduler
+from ollama_client import OllamaClient, get_client
+
+logger = logging.getLogger('RAGIndex')
+
+# 每次请求嵌入接口的文本条数
+EMBED_BATCH_SIZE = 32
+
+# 每个问题默认检索的人数
+DEFAULT_TOP_K = 20
+
+# SQLite 单条语句的参数个数上限（旧版本为 999）
+SQL_PARAM_CHUNK = 900
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class PersonRetriever:
+    """按人员构建向量索引，提问时只检索最相关的 top-k 人员数据
+
+    向量以 float32 二进制存入 person_embeddings 表，按 (模型, 文本哈希) 复用，
+    数据或勾选字段不变时再次打开对话框无需重新计算。
+    在后台线程中使用，因此自行打开数据库连接。
+    """
+
+    def __init__(self, db_path: str, tables: List[ContextTable], embed_model: str,
+                 client: OllamaClient = None):
+        self.db_path = db_path
+        self.tables = tables
+        self.embed_model = embed_model
+        self.client = client or get_client()
+        self.documents = person_documents(tables)
+        self.names = list(self.documents)
+        self.matrix = None
+        self._lock = threading.Lock()
+
+    def is_built(self) -> bool:
+        return self.matrix is not None
+
+    def build(self, progress: Optional[Callable[[int, int], None]] = None):
+        """读取已缓存的向量并补算缺失部分，构建按行归一化的矩阵"""
+        with self._lock:
+            if self.matrix is not None:
+                return
+            start_time = time.perf_counter()
+            hashes = [text_hash(self.documents[name]) for name in self.names]
+
+            conn = sqlite3.connect(self.db_path)
+            try:
+                vectors = self._load_vectors(conn, sorted(set(hashes)))
+                missing = {}
+                for name, digest in zip(self.names, hashes):
+                    if digest not in vectors:
+                        missing[digest] = self.documents[name]
+                missing_items = list(missing.items())
+
+                for offset in range(0, len(missing_items), EMBED_BATCH_SIZE):
+                    batch = missing_items[offset:offset + EMBED_BATCH_SIZE]
+                    # 索引构建按批作为后台任务排队，其他对话框的提问可以插队
+                    texts = [text for _, text in batch]
+                    embeddings = get_scheduler().call(
+                        self.embed_model, lambda: self.client.embed(self.embed_model, texts),
+                        PRIORITY_BACKGROUND, "构建人员向量索引"
+                    )
+                    rows = []
+                    for (digest, _), embedding in zip(batch, embeddings):
+                        vector = np.asarray(embedding, dtype=np.float32)
+                        vectors[digest] = vector
+                        rows.append((self.embed_model, digest, vector.shape[0], vector.tobytes()))
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO person_embeddings (model, text_hash, dim, vector) "
+                        "VALUES (?, ?, ?, ?)", rows
+                    )
+                    conn.commit()
+                    if progress:
+                        progress(min(offset + EMBED_BATCH_SIZE, len(missing_items)), len(missing_items))
+            finally:
+                conn.close()
+
+            if hashes:
+                matrix = np.vstack([vectors[digest] for digest in hashes])
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1
+                self.matrix = matrix / norms
+            else:
+                self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+            elapsed = time.perf_counter() - start_time
+            logger.info(f"人员向量索引构建完成：{len(self.names)} 人，新计算 {len(missing_items)} 条，"
+                        f"模型 {self.embed_model}，耗时 {elapsed:.2f} 秒")
+
+    def _load_vectors(self, conn, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """按文本哈希读取已缓存的向量"""
+        vectors = {}
+        for offset in range(0, len(hashes), SQL_PARAM_CHUNK):
+            chunk = hashes[offset:offset + SQL_PARAM_CHUNK]
+            placeholders = ', '.join(['?'] * len(chunk))
+            cursor = conn.execute(
+                f"SELECT text_hash, vector FROM person_embeddings "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.embed_model] + chunk
+            )
+            for digest, blob in cursor.fetchall():
+                vectors[digest] = np.frombuffer(blob, dtype=np.float32)
+        return vectors
+
+    def search(self, question: str, top_k: int = DEFAULT_TOP_K) -> List[str]:
+        """返回与问题最相关的人员姓名（按相似度降序）"""
+        self.build()
+        if not self.names:
+            return []
+        embedding = get_scheduler().call(
+            self.embed_model, lambda: self.client.embed(self.embed_model, [question])[0],
+            PRIORITY_INTERACTIVE, "检索相关人员"
+        )
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self.matrix @ query
+        k = min(top_k, len(self.names))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.names[idx] for idx in top]
+
+    def context_for(self, question: str, top_k: int = DEFAULT_TOP_K) -> str:
+        """生成只包含相关人员的数据上下文"""
+        names = self.search(question, top_k)
+        return build_data_context(self.tables, names=set(names))
@@ -0,0 +1,118 @@
+import re
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger('ResumeParser')
+
+# "至今"类经历的结束年月（便于区间比较时不用处理 NULL）
+PRESENT_YM = 999912
+
+# 年月：2005.07 / 2005-7 / 2005/07 / 2005年7月
+_YM = r'(?P<{0}y>\d{{4}})\s*[.\-/年]\s*(?P<{0}m>\d{{1,2}})\s*月?'
+_START = _YM.format('s')
+_END = _YM.format('e')
+_SEP = r'\s*(?:-|—|–|~|～|至|到)+\s*'
+_NOW = r'(?P<now>至今|今|现在)'
+
+# 简历逐行格式：2005.07-2010.03 XX检察院 科员
+LINE_PATTERN = re.compile(
+    rf'^\s*{_START}{_SEP}(?:{_END}|{_NOW})?\s*[,，:：]?\s*(?P<body>\S.*?)\s*$'
+)
+
+# 叙述格式：曾任副检察长(2018.01-2020.02)
+INLINE_PERIOD_PATTERN = re.compile(
+    rf'(?P<body>[^,，。;；、()（）\d]+)[(（]\s*{_START}{_SEP}(?:{_END}|{_NOW})?\s*[)）]'
+)
+
+# 叙述格式：2020年3月至今任检察长
+CURRENT_POST_PATTERN = re.compile(
+    rf'{_START}\s*(?:至今|以来)\s*任(?P<body>[^,，。;；(（]+)'
+)
+
+# 经历描述前缀，如"曾任""历任"
+BODY_PREFIX_PATTERN = re.compile(r'^(?:曾任|历任|先后任|任)')
+
+# 无空格时按常见机构后缀拆分单位与职务：XX检察院第一检察部主任
+UNIT_SUFFIX_PATTERN = re.compile(
+    r'^(?P<unit>.+?(?:检察院|法院|委员会|政府|局|厅|大学|学院|学校|公司|中心|办公室|部|处|科|队))(?P<position>.+)$'
+)
+
+CareerEvent = Tuple[int, int, str, str]
+
+
+def _to_ym(year: Optional[str], month: Optional[str]) -> Optional[int]:
+    """将年、月转换为 YYYYMM 整数，非法月份返回 None"""
+    if not year or not month:
+        return None
+    month_value = int(month)
+    if not 1 <= month_value <= 12:
+        return None
+    return int(year) * 100 + month_value
+
+
+def split_unit_position(body: str) -> Tuple[str, str]:
+    """将经历描述拆分为 (单位, 职务)"""
+    body = BODY_PREFIX_PATTERN.sub('', body.strip())
+    parts = body.rsplit(None, 1)
+    if len(parts) == 2:
+        return parts[0], parts[1]
+
+    match = UNIT_SUFFIX_PATTERN.match(body)
+    if match:
+        return match.group('unit'), match.group('position')
+    return '', body
+
+
+def _event_from_match(match) -> Optional[CareerEvent]:
+    """根据正则匹配结果构造一条经历记录"""
+    start_ym = _to_ym(match.group('sy'), match.group('sm'))
+    if start_ym is None:
+        return None
+
+    groups = match.groupdict()
+    end_ym = _to_ym(groups.get('ey'), groups.get('em'))
+    if end_ym is None:
+        end_ym = PRESENT_YM
+
+    unit, position = split_unit_position(match.group('body'))
+    if not unit and not position:
+        return None
+    return start_ym, end_ym, unit, position
+
+
+def parse_resume(text: str) -> List[CareerEvent]:
+    """将简历文本解析为 [(start_ym, end_ym, unit, position)] 列表"""
+    if not text:
+        return []
+
+    events = []
+    for line in str(text).splitlines():
+        line_match = LINE_PATTERN.match(line)
+        if line_match:
+            event = _event_from_match(line_match)
+            if event:
+                events.append(event)
+            continue
+
+        # 非逐行格式，按叙述格式提取
+        for pattern in (INLINE_PERIOD_PATTERN, CURRENT_POST_PATTERN):
+            for match in pattern.finditer(line):
+                event = _event_from_match(match)
+                if event:
+                    events.append(event)
+
+    events.sort(key=lambda e: (e[0], e[1]))
+    return events
+
+
+def parse_resumes(resumes: Iterable[Tuple[str, str]]) -> List[Tuple[str, int, int, str, str]]:
+    """批量解析简历，输入 [(姓名, 简历文本)]，返回可直接批量插入的经历记录"""
+    rows = []
+    parsed_count = 0
+    for name, text in resumes:
+        events = parse_resume(text)
+        if events:
+            parsed_count += 1
+        rows.extend((name,) + event for event in events)
+    logger.info(f"简历解析完成：{parsed_count} 份简历共提取 {len(rows)} 条任职经历")
+    return rows
@@ -0,0 +1,117 @@
+# 数据表字段注册表：数据库字段名、中文表头及检索字段的统一定义
+
+# 业务表的中文名称
+TABLE_TITLES = {
+    'base_info': '人员基本信息',
+    'rewards': '人员奖惩信息',
+    'family': '人员家庭成员信息',
+    'resume': '人员简历信息',
+}
+
+# 各表展示字段（数据库字段名 -> 中文表头），顺序即表格列顺序
+# 年度考核字段按已导入年份动态生成，见 get_table_fields
+TABLE_FIELDS = {
+    'base_info': {
+        "sequence": "序号",
+        "name": "姓名",
+        "next_promotion": "距离下次职级晋升时间",
+        "current_position": "现任职务",
+        "current_position_date": "任现职务时间",
+        "current_grade": "职级/等级",
+        "current_grade_date": "任现职级/等级时间",
+        "previous_position1": "前一职务",
+        "previous_position1_date": "前一职务任职时间",
+        "previous_position2": "前二职务",
+        "previous_position2_date": "前二职务任职时间",
+        "current_legal_position": "现任法律职务",
+        "current_legal_position_date": "现任法律职务任职时间",
+        "previous_legal_position": "前一法律职务",
+        "previous_legal_position_date": "前一法律职务任职时间",
+        "admission_date": "入额时间",
+        "entry_date": "进入检察机关时间",
+        "gender": "性别",
+        "birth_date": "出生年月",
+        "ethnicity": "民族",
+        "hometown": "籍贯出生地",
+        "work_start_date": "参加工作时间",
+        "party_date": "入党时间",
+        "fulltime_education": "全日制学历学位",
+        "fulltime_school": "全日制毕业院校及专业",
+        "parttime_education": "在职学历学位",
+        "parttime_school": "在职毕业院校及专业",
+        "rewards": "奖惩",
+    },
+    'rewards': {
+        "sequence": "序号",
+        "name": "姓名",
+        "reward_name": "奖励名称",
+        "reward_date": "奖励批准日期",
+        "reward_unit": "奖励批准单位",
+        "reward_authority_type": "批准机关性质",
+        "punishment_name": "惩戒名称",
+        "punishment_date": "惩处批准日期",
+        "punishment_unit": "惩戒批准单位",
+        "punishment_authority_type": "惩戒批准机关性质",
+        "impact_period": "影响期",
+    },
+    'family': {
+        "sequence": "序号",
+        "name": "姓名",
+        "relation": "称谓",
+        "family_name": "家庭成员姓名",
+        "birth_date": "出生日期",
+        "political_status": "政治面貌",
+        "work_unit": "家庭成员工作单位",
+        "position": "职务",
+    },
+    'resume': {
+        "sequence": "序号",
+        "name": "姓名",
+        "resume_text": "简历信息",
+    },
+}
+
+# 仅用于检索、不在结果表中展示的字段（派生列及解析出的任职经历）
+SEARCH_ONLY_FIELDS = {
+    'rewards': {
+        "reward_ym": "奖励批准年月(YYYYMM)",
+        "punishment_ym": "惩处批准年月(YYYYMM)",
+        "impact_end_ym": "处分影响期截止年月(YYYYMM)",
+    },
+    'career_events': {
+        "start_ym": "任职起始年月(YYYYMM)",
+        "end_ym": "任职结束年月(YYYYMM，至今为999912)",
+        "unit": "任职单位",
+        "position": "任职职务",
+    },
+}
+
+# 以 YYYYMM 整数存储的字段，检索时可直接传入 yyyy.MM 文本
+YEAR_MONTH_FIELDS = {
+    ('rewards', 'reward_ym'), ('rewards', 'punishment_ym'), ('rewards', 'impact_end_ym'),
+    ('career_events', 'start_ym'), ('career_events', 'end_ym'),
+}
+
+# 以 yyyy.MM 文本存储、比较前需统一分隔符的日期字段
+DOT_DATE_FIELDS = {
+    ('base_info', 'birth_date'),
+}
+
+
+def get_table_fields(table_name: str, assessment_years=None) -> dict:
+    """获取指定表的展示字段映射（数据库字段名 -> 中文表头）"""
+    fields = dict(TABLE_FIELDS.get(table_name, {}))
+    if table_name == 'base_info':
+        for year in assessment_years or []:
+            fields[f"assessment_{year}"] = f"{year}年年度考核结果"
+        fields["remarks"] = "备注"
+    return fields
+
+
+def get_searchable_fields(table_name: str) -> dict:
+    """获取指定表可用于检索的全部字段（展示字段 + 仅检索字段）"""
+    fields = dict(TABLE_FIELDS.get(table_name, {}))
+    if table_name == 'base_info':
+        fields["remarks"] = "备注"
+    fields.update(SEARCH_ONLY_FIELDS.get(table_name, {}))
+    return fields
@@ -0,0 +1,161 @@
+import re
+import time
+import sqlite3
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+from schema import SEARCH_ONLY_FIELDS
+
+logger = logging.getLogger('SQLAnalyst')
+
+# 单条查询的最长执行时间（秒）
+QUERY_TIMEOUT_SECONDS = 5
+
+# 返回给 AI 的最大行数
+MAX_RESULT_ROWS = 200
+
+# 执行超时检查的间隔（SQLite 虚拟机指令数）
+PROGRESS_HANDLER_STEPS = 10000
+
+SQL_BLOCK_PATTERN = re.compile(r'```(?:sql|sqlite)?\s*(.*?)```', re.S | re.I)
+SELECT_PATTERN = re.compile(r'^\s*(select|with)\b', re.I)
+
+# 查询时允许的授权动作：SELECT 语句本身、读取列、调用函数、递归 CTE
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                   getattr(sqlite3, 'SQLITE_RECURSIVE', 33)}
+
+
+class SQLAnalysisError(Exception):
+    """AI 生成的查询无法执行（格式错误、越权或超时）"""
+
+
+def extract_sql(text: str) -> str:
+    """从模型回复中提取 SQL（优先取 ```sql 代码块）"""
+    match = SQL_BLOCK_PATTERN.search(text)
+    sql = match.group(1) if match else text
+    sql = sql.strip().rstrip(';').strip()
+    if not SELECT_PATTERN.match(sql):
+        raise SQLAnalysisError("只允许执行 SELECT 查询")
+    return sql
+
+
+class SQLAnalyst:
+    """在只读、限时、按权限裁剪的连接上执行 AI 生成的统计查询
+
+    每张有权限的表复制到内存数据库中的同名表，只包含展示字段且只包含当前查询结果中的人员；
+    复制完成后分离原数据库，其余表在连接中根本不存在。授权回调拒绝裁剪表之外的任何读取
+    （包括 sqlite_master）以及所有写操作。连接在执行线程中临时建立。
+    """
+
+    def __init__(self, db_path: str, tables: Dict[str, dict], person_ids: Iterable[int],
+                 assessment_years: List[int] = None):
+        self.db_path = db_path
+        self.tables = tables  # 表名 -> {'title': 中文名, 'mapping': 字段 -> 中文表头}
+        self.person_ids = list(person_ids)
+        self.assessment_years = list(assessment_years or [])
+
+    def scoped_columns(self, table_name: str) -> Dict[str, str]:
+        """临时表的列（字段名 -> 中文说明）"""
+        if table_name == 'career_events':
+            columns = {'name': '姓名'}
+            columns.update(SEARCH_ONLY_FIELDS['career_events'])
+            return columns
+        return dict(self.tables[table_name]['mapping'])
+
+    def scoped_tables(self) -> List[str]:
+        names = list(self.tables)
+        # 任职经历由简历解析而来，有简历权限即可查询
+        if 'resume' in self.tables:
+            names.append('career_events')
+        return names
+
+    def schema_prompt(self) -> str:
+        """生成供模型编写 SQL 的表结构说明（不含任何数据）"""
+        lines = []
+        for table_name in self.scoped_tables():
+            title = self.tables[table_name]['title'] if table_name in self.tables else '任职经历（由简历解析）'
+            lines.append(f"表 {table_name}（{title}）：")
+            for column, label in self.scoped_columns(table_name).items():
+                lines.append(f"  - {column}: {label}")
+        lines.append("说明：")
+        lines.append("  - 各表通过 name（姓名）关联；日期均为 'yyyy.MM' 格式的文本，可直接按字符串比较。")
+        lines.append("  - 以 _ym 结尾的字段为 YYYYMM 整数，'至今' 记为 999912。")
+        if self.assessment_years:
+            lines.append("  - assessment_<年份> 为该年度考核结果文本（如 优秀、称职）。")
+        return "\n".join(lines)
+
+    def _copy_sql(self, table_name: str) -> str:
+        columns = []
+        for column in self.scoped_columns(table_name):
+            match = re.fullmatch(r'assessment_(\d{4})', column)
+            if table_name == 'base_info' and match:
+                columns.append(
+                    f"(SELECT result FROM src.assessments a WHERE a.person_id = b.id "
+                    f"AND a.year = {int(match.group(1))}) AS {column}"
+                )
+            else:
+                columns.append(f"b.{column}")
+        column_sql = ', '.join(columns)
+        if table_name == 'base_info':
+            scope = "b.id IN (SELECT id FROM main.scope_ids)"
+        else:
+            scope = "b.name IN (SELECT name FROM src.base_info WHERE id IN (SELECT id FROM main.scope_ids))"
+        return f"CREATE TABLE main.{table_name} AS SELECT {column_sql} FROM src.{table_name} b WHERE {scope}"
+
+    def connect(self) -> sqlite3.Connection:
+        """建立内存数据库，只读附加原数据库复制按权限裁剪的数据后再分离"""
+        # uri=True 使 ATTACH 也接受 file: URI，从而以只读方式附加
+        conn = sqlite3.connect(':memory:', uri=True)
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (f"file:{self.db_path}?mode=ro",))
+            conn.execute("CREATE TABLE main.scope_ids (id INTEGER PRIMARY KEY)")
+            conn.executemany("INSERT INTO main.scope_ids (id) VALUES (?)", [(pid,) for pid in self.person_ids])
+            tables = self.scoped_tables()
+            for table_name in tables:
+                conn.execute(self._copy_sql(table_name))
+            conn.execute("DROP TABLE main.scope_ids")
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+            conn.execute("PRAGMA query_only = ON")
+        except sqlite3.Error as e:
+            conn.close()
+            logger.error(f"建立统计查询连接失败: {e}")
+            raise
+
+        allowed_tables = set(tables)
+
+        def authorizer(action, arg1, arg2, db_name, source):
+            if action not in ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_READ:
+                # 只能读取裁剪后的表；CTE 与子查询不触发读取回调，只检查其引用的实际表
+                if arg1 in allowed_tables:
+                    return sqlite3.SQLITE_OK
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        conn.set_authorizer(authorizer)
+        return conn
+
+    def execute(self, sql: str) -> Tuple[List[str], List[tuple], bool]:
+        """执行查询，返回 (列名, 数据行, 是否被截断)"""
+        conn = self.connect()
+        deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+        # 返回非零值会中断正在执行的语句
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_HANDLER_STEPS)
+        start_time = time.perf_counter()
+        try:
+            cursor = conn.execute(sql)
+            rows = cursor.fetchmany(MAX_RESULT_ROWS + 1)
+            columns = [desc[0] for desc in cursor.description or []]
+        except sqlite3.Error as e:
+            if time.monotonic() > deadline:
+                raise SQLAnalysisError(f"查询超过 {QUERY_TIMEOUT_SECONDS} 秒被中止") from e
+            raise SQLAnalysisError(str(e)) from e
+        finally:
+            conn.close()
+
+        truncated = len(rows) > MAX_RESULT_ROWS
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"统计查询执行完成：{min(len(rows), MAX_RESULT_ROWS)} 行，耗时 {elapsed_ms:.1f} ms")
+        return columns, rows[:MAX_RESULT_ROWS], truncated
@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('TokenBudget')
+
+# 可选的上下文长度（num_ctx），自动模式下取能容纳本轮请求的最小档位
+CTX_BUCKETS = [4096, 8192, 16384, 32768, 65536]
+
+# 预留给 AI 回复的 token 数
+ANSWER_RESERVE_TOKENS = 1500
+
+# 未校准时沿用原来的保守估计（中文约 1.5~2 token/字，取上限防越界）
+DEFAULT_TOKENS_PER_CHAR = 1.8
+
+# 每条消息的对话模板开销（角色标记等）
+MESSAGE_OVERHEAD_CHARS = 8
+
+# 校准值的指数滑动平均系数
+CALIBRATION_ALPHA = 0.3
+
+# 校准结果在 system_config 中的键
+CALIBRATION_CONFIG_KEY = 'token_calibration'
+
+
+def message_chars(messages: List[dict]) -> int:
+    """消息列表的总字符数（含每条消息的模板开销）"""
+    return sum(len(msg.get('content', '')) + MESSAGE_OVERHEAD_CHARS for msg in messages)
+
+
+def choose_num_ctx(tokens_needed: int, minimum: int = 0) -> Optional[int]:
+    """选择能容纳所需 token 的最小档位；不低于 minimum，避免对话中途缩小上下文导致模型重新加载"""
+    for bucket in CTX_BUCKETS:
+        if bucket >= tokens_needed and bucket >= minimum:
+            return bucket
+    return None
+
+
+class TokenCalibrator:
+    """按模型记录实测的 token/字符 比例（来自 Ollama 返回的 prompt_eval_count 与 eval_count）"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path
+        self.ratios: Dict[str, float] = {}
+        self.load()
+
+    def load(self):
+        if not self.db_path:
+            return
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute("SELECT config_value FROM system_config WHERE config_key=?",
+                                   (CALIBRATION_CONFIG_KEY,)).fetchone()
+            if row and row[0]:
+                self.ratios = {model: float(ratio) for model, ratio in json.loads(row[0]).items()}
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"读取 token 校准数据失败: {e}")
+
+    def save(self):
+        if not self.db_path:
+            return
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO system_config (config_key, config_value) VALUES (?, ?)",
+                             (CALIBRATION_CONFIG_KEY, json.dumps(self.ratios)))
+        except sqlite3.Error as e:
+            logger.warning(f"保存 token 校准数据失败: {e}")
+
+    def ratio(self, model: str) -> float:
+        return self.ratios.get(model, DEFAULT_TOKENS_PER_CHAR)
+
+    def estimate(self, model: str, chars: int) -> int:
+        """按该模型的校准比例估算 token 数"""
+        return int(chars * self.ratio(model)) + 1
+
+    def update(self, model: str, usage: dict) -> bool:
+        """用一次请求的实测用量更新校准比例，返回是否更新"""
+        samples = []
+        completion_tokens = usage.get('completion_tokens')
+        if completion_tokens and usage.get('completion_chars'):
+            samples.append((usage['completion_chars'], completion_tokens))
+
+        prompt_tokens = usage.get('prompt_tokens')
+        if prompt_tokens and usage.get('prompt_chars'):
+            # 命中 Ollama 提示词缓存时 prompt_eval_count 只统计新增部分，明显偏小的样本不采用；
+            # 尚未校准的模型以本次回答的实测比例为参照，没有回答用量时以默认比例为参照
+            reference = self.ratios.get(model)
+            if reference is None:
+                reference = samples[0][1] / samples[0][0] if samples else DEFAULT_TOKENS_PER_CHAR
+            if prompt_tokens / usage['prompt_chars'] >= 0.5 * reference:
+                samples.append((usage['prompt_chars'], prompt_tokens))
+
+        chars = sum(c for c, _ in samples)
+        tokens = sum(t for _, t in samples)
+        if not chars:
+            return False
+
+        sample_ratio = tokens / chars
+        if model in self.ratios:
+            self.ratios[model] = (1 - CALIBRATION_ALPHA) * self.ratios[model] + CALIBRATION_ALPHA * sample_ratio
+        else:
+            self.ratios[model] = sample_ratio
+        self.save()
+        logger.info(f"模型 {model} token 校准: 本次 {sample_ratio:.3f} token/字，当前 {self.ratios[model]:.3f} token/字")
+        return True